@@ -0,0 +1,91 @@
+"""
+Benchmark: gemeinsamer Parser (shared_code/log_parser.py) gegen die bisherige
+Regex-Schleife aus trainer.py/log_utils.py.
+
+    PYTHONPATH=shared_code python benchmarks/bench_log_parser.py --lines 200000
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "shared_code"))
+
+from log_parser import FEATURE_COLS, feature_matrix, parse_block  # noqa: E402
+
+NORMAL = ["/", "/about", "/index.html", "/static/logo.png", "/static/style.css", "/contact", "/help", "/favicon.ico"]
+MALICIOUS = ["/admin", "/wp-login.php", "/.env", "/login?user=admin'--", "/cgi-bin/test.cgi"]
+
+
+def sample_log(n, seed=0):
+    rnd = random.Random(seed)
+    lines = []
+    for _ in range(n):
+        if rnd.random() < 0.1:
+            method, url, status = rnd.choice(["POST", "PUT", "DELETE"]), rnd.choice(MALICIOUS), rnd.choice([403, 404])
+        else:
+            method, url, status = "GET", rnd.choice(NORMAL), 200
+        lines.append(
+            f'172.18.0.{rnd.randint(2, 9)} - - [10/Oct/2025:13:55:{rnd.randint(10, 59)} +0000] '
+            f'"{method} {url} HTTP/1.1" {status} {rnd.randint(100, 5000)} "-" "python-requests/2.32.3" "-"\n'
+        )
+    return "".join(lines).encode()
+
+
+def legacy_parse(data):
+    """Bisherige Implementierung: Regex + groupdict() pro Zeile."""
+    pattern = re.compile(
+        r'(?P<ip>\S+) \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<method>\S+) (?P<url>\S+) \S+" (?P<status>\d+) (?P<size>\d+)'
+    )
+    url_map = {u: i for i, u in enumerate(NORMAL)}
+    out = []
+    for line in data.decode().splitlines(True):
+        m = pattern.search(line)
+        if m:
+            entry = m.groupdict()
+            entry['method_num'] = 0 if entry['method'] == 'GET' else 1
+            entry['url_num'] = url_map.get(entry['url'], 99)
+            entry['status'] = int(entry['status'])
+            entry['size'] = int(entry['size'])
+            out.append(entry)
+    return out
+
+
+def legacy_features(data):
+    """Bisheriger Weg bis zur Feature-Matrix: dicts -> DataFrame -> to_numpy()."""
+    import pandas as pd
+    return pd.DataFrame(legacy_parse(data))[FEATURE_COLS].astype(float).to_numpy()
+
+
+def bench(name, func, data, n, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(data)
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:<22} {n / best:>12,.0f} lines/s  ({best * 1000:.1f} ms)")
+    return n / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    data = sample_log(args.lines)
+    print("-- parsen")
+    legacy = bench("legacy regex+dict", legacy_parse, data, args.lines, args.repeat)
+    regex = bench("parse_block (regex)", lambda d: parse_block(d, fast=False), data, args.lines, args.repeat)
+    fast = bench("parse_block (split)", parse_block, data, args.lines, args.repeat)
+    print(f"speedup split vs legacy: {fast / legacy:.2f}x, regex vs legacy: {regex / legacy:.2f}x")
+    print("-- parsen bis zur Feature-Matrix")
+    legacy = bench("legacy DataFrame", legacy_features, data, args.lines, args.repeat)
+    fast = bench("parse_block+matrix", lambda d: feature_matrix(parse_block(d)), data, args.lines, args.repeat)
+    print(f"speedup: {fast / legacy:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""
+Benchmark der ganzen Pipeline auf einem synthetischen Access-Log
+(shared_code/synthetic_log.py): Parsen (Dashboard und Trainer), Skalieren,
+Scoring pro Engine, Regeln schreiben und Training. Ergebnisse als JSON; mit
+--baseline wird gegen einen früheren Lauf verglichen (Exit-Code 1 bei Regression).
+
+    PYTHONPATH=shared_code python benchmarks/bench_pipeline.py --lines 1000000 --output bench.json
+    PYTHONPATH=shared_code python benchmarks/bench_pipeline.py --lines 1000000 --baseline bench.json
+
+Alle Modell-, Threshold- und Regeldateien landen in einem temporären
+Verzeichnis; /model, /shared und /etc/nginx werden nicht angefasst. Stufen,
+deren Abhängigkeiten fehlen (TensorFlow, Streamlit), werden als "skipped" vermerkt.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path[:0] = [os.path.join(ROOT, "shared_code"), os.path.join(ROOT, "trainer"),
+                os.path.join(ROOT, "streamlit_app", "app")]
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+import numpy as np  # noqa: E402
+
+from log_parser import feature_matrix, iter_file_blocks, parse_block  # noqa: E402
+from synthetic_log import write_log  # noqa: E402
+
+SKIP_FRAME_LINES = 2000000  # größere Logs nicht komplett als DataFrame laden (Speicher)
+
+
+class Results:
+    def __init__(self, verbose=False):
+        self.stages = []
+        self.verbose = verbose
+
+    def add(self, stage, engine, seconds, lines=None, **extra):
+        record = {"stage": stage, "engine": engine, "seconds": round(seconds, 6)}
+        if lines is not None:
+            record["lines"] = lines
+            record["lines_per_sec"] = round(lines / max(seconds, 1e-9), 1)
+        record.update(extra)
+        self.stages.append(record)
+        rate = f"{record['lines_per_sec']:>14,.0f} lines/s" if lines is not None else " " * 22
+        print(f"{stage + ' [' + engine + ']':<52} {rate}  {seconds * 1000:>10.1f} ms")
+        return record
+
+    def skip(self, stage, reason):
+        self.stages.append({"stage": stage, "skipped": reason})
+        print(f"{stage:<52} skipped: {reason}")
+
+
+def timed(func, repeat=1):
+    """Bestes Ergebnis aus repeat Läufen: (Sekunden, Rückgabewert des letzten Laufs)."""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+@contextlib.contextmanager
+def quiet(enabled=True):
+    if not enabled:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def bench_parse(results, log_path, lines, args):
+    for engine, fast in (("split", True), ("regex", False)):
+        seconds, _ = timed(lambda: sum(len(parse_block(b, fast=fast)["status"])
+                                       for b in iter_file_blocks(log_path)), args.repeat)
+        results.add("parse.parse_block", engine, seconds, lines)
+
+    from log_ingest import aggregate_logs
+    workers = args.workers or os.cpu_count() or 1
+    seconds, (counter, _) = timed(lambda: aggregate_logs(log_path, workers), args.repeat)
+    results.add("parse.aggregate_logs", f"{workers} workers", seconds, lines, distinct=len(counter))
+
+    try:
+        import trainer
+    except ImportError as e:
+        results.skip("parse.extract_features", str(e))
+    else:
+        if lines > args.frame_limit:
+            results.skip("parse.extract_features", f"more than --frame-limit {args.frame_limit} lines")
+        else:
+            seconds, _ = timed(lambda: trainer.extract_features(log_path), args.repeat)
+            results.add("parse.extract_features", "trainer", seconds, lines)
+
+    try:
+        import log_utils
+    except ImportError as e:
+        results.skip("parse.extract_features_with_line_numbers", str(e))
+    else:
+        tail = min(args.tail, lines)
+
+        def tail_read():
+            log_utils._tailers.pop(log_path, None)  # jedes Mal kalt (erster Aufruf im Dashboard)
+            return log_utils.extract_features_with_line_numbers(log_path, last_n=tail)
+        seconds, df = timed(tail_read, args.repeat)
+        results.add("parse.extract_features_with_line_numbers", "dashboard", seconds, len(df))
+    return counter
+
+
+def bench_train(results, counter, workdir, args):
+    try:
+        import trainer
+        from model_versions import ModelVersions
+    except ImportError as e:
+        results.skip("train.train_and_save_model", str(e))
+        return None
+    model_dir = os.path.join(workdir, "model")
+    os.makedirs(model_dir, exist_ok=True)
+    trainer.VERSIONS = ModelVersions(os.path.join(model_dir, "versions"), os.path.join(model_dir, "current.json"))
+    trainer.THRESHOLD_PATH = os.path.join(model_dir, "threshold.json")
+    trainer.THRESHOLD_SKETCH_PATH = os.path.join(model_dir, "threshold_sketch.json")
+    trainer.TRAIN_MAX_EPOCHS = args.epochs
+    rows = int(sum(counter.values()))
+    with quiet(not args.verbose):
+        seconds, stats = timed(lambda: trainer.train_and_save_model(counter))
+    results.add("train.train_and_save_model", "keras", seconds, rows,
+                distinct=len(counter), max_epochs=args.epochs)
+    return trainer.VERSIONS if stats else None
+
+
+def score_matrix(log_path, lines):
+    """Roh-Features (URL als Text) der ersten lines Zeilen für Skalierung und Scoring."""
+    parts, urls = [], []
+    for block in iter_file_blocks(log_path):
+        columns = parse_block(block)
+        parts.append(feature_matrix(columns))
+        urls.extend(columns["url"])
+        if len(urls) >= lines:
+            break
+    return np.concatenate(parts)[:lines], urls[:lines]
+
+
+def bench_score(results, versions, log_path, lines, args):
+    from model_registry import get_registry, load_model_file, model_features
+    from score_cache import ScoreCache
+    model_dir = os.path.dirname(versions.root)
+    registry = get_registry(None, None, os.path.join(model_dir, "threshold.json"), versions=versions)
+    snapshot = registry.get()
+    if snapshot is None:
+        results.skip("score", f"model could not be loaded: {registry.last_error}")
+        return
+    n = min(args.score_lines, lines)
+    X_raw, urls = score_matrix(log_path, n)
+    seconds, X_raw = timed(lambda: model_features(snapshot, X_raw, urls), args.repeat)
+    results.add("score.url_vocab", "vocab" if snapshot.url_vocab else "url_map", seconds, n)
+    seconds, X_scaled = timed(lambda: snapshot.scaler.transform(X_raw), args.repeat)
+    results.add("scale.transform", type(snapshot.scaler).__name__, seconds, n)
+    if snapshot.engine == "numpy":
+        import joblib
+        scaler = joblib.load(versions.path(versions.current(), "scaler"))
+        seconds, _ = timed(lambda: scaler.transform(X_raw), args.repeat)
+        results.add("scale.transform", type(scaler).__name__, seconds, n)
+
+    snapshots = {snapshot.engine: snapshot}
+    if "keras" not in snapshots:
+        try:
+            model, engine = load_model_file(versions.path(versions.current(), "model"))
+            snapshots[engine] = snapshot._replace(model=model, engine=engine)
+        except Exception as e:
+            results.skip("score.predict [keras]", str(e))
+    for engine, snap in snapshots.items():
+        if engine == "keras":
+            predict = lambda: snap.model.predict(X_scaled, batch_size=args.batch_size, verbose=0)  # noqa: E731
+        else:
+            predict = lambda: snap.model.predict(X_scaled)  # noqa: E731
+        seconds, _ = timed(predict, args.repeat)
+        results.add("score.predict", engine, seconds, n)
+
+    cache = ScoreCache()
+    seconds, _ = timed(lambda: cache.mse(snapshot, X_raw))
+    results.add("score.cached_mse", f"{snapshot.engine} cold", seconds, n)
+    seconds, _ = timed(lambda: cache.mse(snapshot, X_raw), args.repeat)
+    results.add("score.cached_mse", f"{snapshot.engine} warm", seconds, n, hit_rate=round(cache.stats()["hit_rate"], 4))
+
+
+def bench_rules(results, workdir, args):
+    try:
+        from nginx_utils import build_block_rules_from_paths, write_rules_to_file
+    except ImportError as e:
+        results.skip("rules.write_rules_to_file", str(e))
+        return
+    rules_path = os.path.join(workdir, "nginx", "custom_rules.conf")
+    os.makedirs(os.path.dirname(rules_path), exist_ok=True)
+    rules = build_block_rules_from_paths([f"/bench/probe-{i}" for i in range(args.rules)])
+    seconds, _ = timed(lambda: write_rules_to_file(rules, rules_path))
+    results.add("rules.write_rules_to_file", "bulk", seconds, rules=args.rules)
+    # Live-Betrieb: einzelne neue Regeln zu einem bestehenden Satz
+    single = build_block_rules_from_paths([f"/bench/single-{i}" for i in range(args.rule_updates)])
+    start = time.perf_counter()
+    for rule in single:
+        write_rules_to_file([rule], rules_path)
+    seconds = (time.perf_counter() - start) / max(len(single), 1)
+    results.add("rules.write_rules_to_file", "single", seconds, rules=args.rules + len(single))
+
+
+def environment():
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+    }
+    for name in ("pandas", "sklearn", "tensorflow"):
+        module = sys.modules.get(name)
+        if module is not None:
+            info[name] = module.__version__
+    try:
+        info["git_commit"] = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+
+def stage_key(record):
+    return f"{record['stage']} [{record.get('engine', '')}]"
+
+
+def compare(report, baseline_path, tolerance):
+    """Vergleicht die Durchsatzwerte mit einem früheren Lauf; gibt die Regressionen zurück."""
+    with open(baseline_path) as f:
+        data = json.load(f)
+    baseline = {stage_key(r): r for r in data["stages"] if "seconds" in r}
+    regressions = []
+    print(f"-- Vergleich mit {baseline_path} (Toleranz {tolerance:.0%})")
+    if data.get("params") != report["params"]:
+        print("   Achtung: andere Parameter als im Vergleichslauf, Werte nur bedingt vergleichbar")
+    for record in report["stages"]:
+        old = baseline.get(stage_key(record))
+        if old is None or "seconds" not in record:
+            continue
+        # Zeit pro Einheit vergleichen, falls sich die Größe geändert hat
+        size_new = record.get("lines") or record.get("rules") or 1
+        size_old = old.get("lines") or old.get("rules") or 1
+        ratio = (record["seconds"] / size_new) / max(old["seconds"] / size_old, 1e-12)
+        flag = "REGRESSION" if ratio > 1 + tolerance else ""
+        print(f"{stage_key(record):<52} {ratio:>6.2f}x time {flag}")
+        if flag:
+            regressions.append({"stage": stage_key(record), "ratio": round(ratio, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=100000, help="Zeilen im synthetischen Log (10k .. 100M)")
+    parser.add_argument("--malicious", type=float, default=0.1, help="Anteil bösartiger Zeilen (0..1)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--profiles", default=os.path.join(ROOT, "shared", "traffic_profiles.json"),
+                        help="Pfade für das synthetische Log")
+    parser.add_argument("--log", help="Logdatei (Standard: im temporären Verzeichnis)")
+    parser.add_argument("--reuse-log", action="store_true", help="vorhandene --log-Datei nicht neu erzeugen")
+    parser.add_argument("--repeat", type=int, default=1, help="Wiederholungen pro Stufe (bester Wert zählt)")
+    parser.add_argument("--workers", type=int, default=0, help="Prozesse für aggregate_logs (0 = alle CPUs)")
+    parser.add_argument("--tail", type=int, default=10000, help="last_n für extract_features_with_line_numbers")
+    parser.add_argument("--frame-limit", type=int, default=SKIP_FRAME_LINES)
+    parser.add_argument("--score-lines", type=int, default=1000000, help="Zeilen für Skalierung und Scoring")
+    parser.add_argument("--batch-size", type=int, default=4096, help="Batchgröße für Keras predict")
+    parser.add_argument("--epochs", type=int, default=10, help="max. Epochen für train_and_save_model")
+    parser.add_argument("--rules", type=int, default=1000)
+    parser.add_argument("--rule-updates", type=int, default=20)
+    parser.add_argument("--stages", default="parse,train,score,rules")
+    parser.add_argument("--output", help="Ergebnis als JSON schreiben")
+    parser.add_argument("--baseline", help="früheres JSON-Ergebnis zum Vergleich")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="erlaubte Verlangsamung gegenüber --baseline")
+    parser.add_argument("--keep", action="store_true", help="temporäres Verzeichnis nicht löschen")
+    parser.add_argument("--verbose", action="store_true", help="Ausgaben des Trainers anzeigen")
+    args = parser.parse_args()
+    stages = set(args.stages.split(","))
+
+    workdir = tempfile.mkdtemp(prefix="bench-pipeline-")
+    log_path = args.log or os.path.join(workdir, "access.log")
+    results = Results(args.verbose)
+    try:
+        if args.reuse_log and os.path.exists(log_path):
+            with open(log_path, "rb") as f:
+                lines = sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 24), b""))
+        else:
+            lines = args.lines
+            seconds, written = timed(lambda: write_log(log_path, lines, args.malicious, args.seed, profiles=args.profiles))
+            results.add("generate.write_log", "synthetic", seconds, lines, bytes=written)
+        print(f"-- {log_path}: {lines:,} lines, {os.path.getsize(log_path) / 1e6:,.1f} MB")
+
+        counter = None
+        if stages & {"parse", "train", "score"}:
+            counter = bench_parse(results, log_path, lines, args)
+        versions = None
+        if stages & {"train", "score"}:
+            versions = bench_train(results, counter, workdir, args)
+        if "score" in stages:
+            if versions is None:
+                results.skip("score", "no trained model")
+            else:
+                bench_score(results, versions, log_path, lines, args)
+        if "rules" in stages:
+            bench_rules(results, workdir, args)
+    finally:
+        if args.keep:
+            print(f"-- Arbeitsverzeichnis: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "benchmark": "pipeline",
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "params": {"lines": lines, "malicious": args.malicious, "seed": args.seed, "repeat": args.repeat,
+                   "score_lines": args.score_lines, "epochs": args.epochs, "rules": args.rules},
+        "environment": environment(),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "stages": results.stages,
+    }
+    regressions = compare(report, args.baseline, args.tolerance) if args.baseline else []
+    report["regressions"] = regressions
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"-- Ergebnis: {args.output}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
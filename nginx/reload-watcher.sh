@@ -1,12 +1,102 @@
 #!/bin/sh
-RELOAD_TRIGGER="/shared/nginx_reload.trigger"
+# Wartet auf Reload-Anforderungen (eine Zeile pro Anforderung im Trigger-File),
+# fasst alle innerhalb von RELOAD_DEBOUNCE Sekunden zu einem Reload zusammen,
+# prüft die Konfiguration mit "nginx -t" und schreibt das Ergebnis nach RELOAD_STATUS.
+# signalled_ms: "nginx -s reload" ist zurück (Signal an den Master gesendet);
+# finished_ms: die neuen Worker laufen (workers_confirmed=false: nach RELOAD_CONFIRM_TIMEOUT
+# ohne neue Worker gestempelt). finished_ms ist die Station "reload_done" der Latenz-Traces
+# (shared_code/latency.py): der Scorer schließt damit alle Traces ab, deren Anforderung
+# <= requested_last ist.
+RELOAD_TRIGGER="${RELOAD_TRIGGER:-/shared/nginx_reload.trigger}"
+RELOAD_STATUS="${RELOAD_STATUS:-/shared/nginx_reload_status.json}"
+RELOAD_DEBOUNCE="${RELOAD_DEBOUNCE:-1}"
+RELOAD_CONFIRM_TIMEOUT="${RELOAD_CONFIRM_TIMEOUT:-5}"
+PENDING="$RELOAD_TRIGGER.processing"
 
-while true; do
-  if [ -f "$RELOAD_TRIGGER" ]; then
-    echo "Reload-Trigger found, executing nginx -s reload aus"
-    nginx -s reload
-    rm -f "$RELOAD_TRIGGER"
+now_ms() {
+  echo $(( $(date +%s%N) / 1000000 ))
+}
+
+worker_pids() {
+  # PIDs der laufenden nginx-Worker (Prozesstitel "nginx: worker process")
+  for f in /proc/[0-9]*/cmdline; do
+    case "$(tr '\0' ' ' < "$f" 2>/dev/null)" in
+      "nginx: worker process"*) pid=${f#/proc/}; echo "${pid%/cmdline}" ;;
+    esac
+  done | sort
+}
+
+wait_for_new_workers() {
+  # $1 Worker-PIDs vor dem Reload; Rückgabe 0, sobald ein neuer Worker läuft
+  deadline=$(( $(now_ms) + RELOAD_CONFIRM_TIMEOUT * 1000 ))
+  while [ "$(now_ms)" -lt "$deadline" ]; do
+    if worker_pids | grep -qvxF "$1"; then
+      return 0
+    fi
+    sleep 0.01
+  done
+  return 1
+}
+
+write_status() {
+  # $1 ok, $2 Meldung, $3 Anzahl, $4 erste Anforderung, $5 letzte, $6 Start, $7 Ende,
+  # $8 Signal gesendet, $9 neue Worker bestätigt
+  message=$(printf '%s' "$2" | tr '\n"\\' '   ' | cut -c1-500)
+  printf '{"ok": %s, "message": "%s", "requests": %s, "requested_first": %s, "requested_last": %s, "started_ms": %s, "signalled_ms": %s, "finished_ms": %s, "workers_confirmed": %s, "duration_ms": %s}\n' \
+    "$1" "$message" "$3" "${4:-null}" "${5:-null}" "$6" "${8:-null}" "$7" "${9:-false}" $(( $7 - $6 )) > "$RELOAD_STATUS.tmp"
+  mv "$RELOAD_STATUS.tmp" "$RELOAD_STATUS"
+}
+
+reload_once() {
+  # Weitere Anforderungen im Debounce-Fenster landen im selben Trigger-File
+  sleep "$RELOAD_DEBOUNCE"
+  mv "$RELOAD_TRIGGER" "$PENDING" || return
+  requests=$(grep -c . "$PENDING")
+  first=$(grep -E '^[0-9.]+$' "$PENDING" | head -n 1)
+  last=$(grep -E '^[0-9.]+$' "$PENDING" | tail -n 1)
+  rm -f "$PENDING"
+  started=$(now_ms)
+  if output=$(nginx -t 2>&1); then
+    before=$(worker_pids)
+    if output=$(nginx -s reload 2>&1); then
+      signalled=$(now_ms)
+      if wait_for_new_workers "$before"; then
+        confirmed=true
+        echo "NGINX reloaded ($requests Anforderung(en) zusammengefasst)"
+      else
+        confirmed=false
+        echo "NGINX reload signalisiert, aber nach ${RELOAD_CONFIRM_TIMEOUT}s keine neuen Worker"
+      fi
+      write_status true "reloaded" "$requests" "$first" "$last" "$started" "$(now_ms)" "$signalled" "$confirmed"
+    else
+      echo "NGINX reload fehlgeschlagen: $output"
+      write_status false "$output" "$requests" "$first" "$last" "$started" "$(now_ms)"
+    fi
+  else
+    # Fehlerhafte Konfiguration: alte Konfiguration bleibt aktiv
+    echo "nginx -t fehlgeschlagen, kein Reload: $output"
+    write_status false "$output" "$requests" "$first" "$last" "$started" "$(now_ms)"
   fi
-  sleep 2
-done
+}
+
+process_pending() {
+  while [ -f "$RELOAD_TRIGGER" ]; do
+    reload_once
+  done
+}
 
+if command -v inotifywait >/dev/null 2>&1; then
+  # Dauerhafte Überwachung (-m): Ereignisse gehen zwischen zwei Reloads nicht verloren.
+  # Ohne -q kommt "Watches established." erst, wenn die Überwachung steht; die
+  # Prüfung auf diese Zeile hin erfasst auch Trigger, die vor dem Start geschrieben wurden.
+  inotifywait -m -e close_write -e moved_to -e create \
+    --include "$(basename "$RELOAD_TRIGGER")\$" "$(dirname "$RELOAD_TRIGGER")" 2>&1 |
+    while read -r _; do
+      process_pending
+    done
+else
+  while true; do
+    process_pending
+    sleep 1
+  done
+fi
@@ -0,0 +1,347 @@
+import os
+import select
+import time
+from collections import Counter, OrderedDict, deque
+import numpy as np
+
+from config import (
+    LOGFILE_PATH,
+    MODEL_PATH,
+    SCALER_PATH,
+    THRESHOLD_PATH,
+    WEIGHTS_PATH,
+    URL_VOCAB_PATH,
+    MODEL_VERSIONS_DIR,
+    MODEL_CURRENT_PATH,
+    CUSTOM_RULES_PATH,
+    SCORES_PATH,
+    SCORER_STATUS_PATH,
+    SCORER_STATE_PATH,
+    BLOCK_SUGGESTIONS_PATH,
+    FEATURE_STORE_DIR,
+    TRAINING_TRIGGER,
+    MALICIOUS_PATTERNS_PATH,
+    RELOAD_TRIGGER,
+    RELOAD_STATUS_PATH,
+    LATENCY_TRACES_PATH,
+    LATENCY_METRICS_PATH,
+)
+from log_tail import LogTailer
+from log_parser import parse_block, feature_matrix, URL_MAP
+from url_vocab import url_encoder
+from model_registry import get_registry
+from model_versions import ModelVersions
+from score_cache import ScoreCache
+from score_store import ScoreStore, write_json_atomic, read_json
+from feature_store import FeatureStore
+from pattern_filter import PatternFilter
+from rule_store import get_rule_store
+from ip_windows import IPWindowAggregator, aggregate_cidrs
+from latency import LatencyCollector, METRICS_PORT, start_metrics_server
+from control_bus import RESYNC_INTERVAL, TRAINING_MODE, open_subscriber
+
+# Micro-Batch: höchstens so viele Bytes pro Leseschritt (begrenzt den Speicher)
+BATCH_BYTES = int(os.environ.get("SCORER_BATCH_BYTES", 4 << 20))
+# Liegt der Scorer weiter zurück, wird ans Dateiende gesprungen (0 = nie überspringen)
+MAX_LAG_BYTES = int(os.environ.get("SCORER_MAX_LAG_BYTES", 0))
+POLL_INTERVAL = 0.2
+FLUSH_INTERVAL = 1.0
+MAX_SUGGESTIONS = 100
+MAX_TRACKED_URLS = 10000
+# Trefferzahlen übernehmen, Regeln ablaufen lassen und zusammenfassen (Sekunden)
+RULE_COMPACT_INTERVAL = float(os.environ.get("RULE_COMPACT_INTERVAL", 60))
+# Auffällige IPs so lange für IP-/CIDR-Vorschläge berücksichtigen (Sekunden)
+SUSPICIOUS_IP_TTL = 600
+# So viele unauffällige Pfade merken (LRU), damit sie keine zusammengefasste Regel trifft
+MAX_BENIGN_PATHS = 20000
+RULE_MERGES_SHOWN = 20
+
+def parse_for_scoring(data, start_line, url_vocab=None):
+    """
+    Parst einen Block vollständiger Logzeilen in (Spalten, Features); url_num
+    kommt aus dem URL-Vokabular des aktuellen Modells (sonst URL_MAP).
+    """
+    columns = parse_block(data, start_line, url_encoder=url_encoder(url_vocab))
+    return columns, feature_matrix(columns)
+
+class SuggestionTracker:
+    """
+    Sammelt anomale URLs fortlaufend (Anzahl, max. MSE, erstes/letztes Auftreten).
+    Die Anzahl verfolgter URLs ist begrenzt; es werden die seltensten verworfen.
+    """
+
+    def __init__(self, max_tracked=MAX_TRACKED_URLS):
+        self.max_tracked = max_tracked
+        self.urls = {}
+        self.changed = False
+
+    def add(self, urls, mse, now, logged=None, stages=None):
+        """
+        logged (Zeitstempel der Logzeilen) und stages ({Station: Zeit} des Batches)
+        starten den Latenz-Trace einer neu auffälligen URL.
+        """
+        for i, (url, value) in enumerate(zip(urls, mse)):
+            entry = self.urls.get(url)
+            if entry is None:
+                trace = dict(stages or {})
+                if logged is not None and logged[i] == logged[i]:  # NaN: Zeitstempel nicht lesbar
+                    trace["logged"] = float(logged[i])
+                entry = self.urls[url] = {"path": url, "count": 0, "max_mse": 0.0, "first_seen": now,
+                                          "trace": trace}
+            entry["count"] += 1
+            entry["max_mse"] = max(entry["max_mse"], float(value))
+            entry["last_seen"] = now
+        self.changed = self.changed or bool(urls)
+        if len(self.urls) > self.max_tracked:
+            keep = sorted(self.urls.values(), key=lambda e: e["count"], reverse=True)[:self.max_tracked // 2]
+            self.urls = {e["path"]: e for e in keep}
+
+    def discard(self, paths):
+        for path in paths:
+            if self.urls.pop(path, None) is not None:
+                self.changed = True
+
+    def top(self, n=MAX_SUGGESTIONS, now=None):
+        """Die n häufigsten URLs; mit now wird die Station "suggested" der Traces gestempelt."""
+        top = sorted(self.urls.values(), key=lambda e: e["count"], reverse=True)[:n]
+        if now is not None:
+            for entry in top:
+                if entry["trace"].get("suggested") is None:
+                    entry["trace"]["suggested"] = now
+        return top
+
+class Scorer:
+    def __init__(self):
+        self.registry = get_registry(MODEL_PATH, SCALER_PATH, THRESHOLD_PATH, WEIGHTS_PATH, URL_VOCAB_PATH,
+                                     versions=ModelVersions(MODEL_VERSIONS_DIR, MODEL_CURRENT_PATH))
+        self.store = ScoreStore(SCORES_PATH)
+        self.score_cache = ScoreCache()
+        self.features = FeatureStore(FEATURE_STORE_DIR)
+        self.prefilter = PatternFilter(MALICIOUS_PATTERNS_PATH)
+        self.tailer = LogTailer(LOGFILE_PATH, max_bytes=BATCH_BYTES)
+        if not self.tailer.restore_state(read_json(SCORER_STATE_PATH, {})):
+            # Erster Start: ab jetzt scoren, nicht die komplette Historie
+            self.tailer.seek_tail(0)
+        self.suggestions = SuggestionTracker()
+        self.latency = LatencyCollector(LATENCY_TRACES_PATH, RELOAD_STATUS_PATH, LATENCY_METRICS_PATH)
+        self.rules = get_rule_store(CUSTOM_RULES_PATH)
+        self.rules_seen = None
+        self.rule_hits = Counter()
+        self.ip_windows = IPWindowAggregator()
+        self.suspicious_ips = OrderedDict()  # IP -> zuletzt auffällig (Wanduhr)
+        self.ip_suggestions_changed = False
+        self.rules_expired = 0
+        self.rules_consolidated = 0
+        self.rule_merges = deque(maxlen=RULE_MERGES_SHOWN)  # zuletzt zusammengefasste Regeln (Dashboard)
+        # Unauffällig gescorte Pfade: darunter wird nie zu einer Präfix-Regel zusammengefasst
+        self.benign_paths = OrderedDict()
+        self.last_compact = time.time()
+        self.lines_scored = 0
+        self.anomalies = 0
+        self.skipped_bytes = 0
+        self.last_flush = 0.0
+        self.lines_since_flush = 0
+        # Trainingsphase: Änderungen kommen über den Steuerbus, die Trigger-Datei nur zum Abgleich
+        self.bus = open_subscriber("scorer", [TRAINING_MODE])
+        self.training = os.path.exists(TRAINING_TRIGGER)
+        self.training_synced = time.time()
+
+    def poll_control(self, now):
+        """Übernimmt anstehende Steuernachrichten; ohne Bus bzw. alle RESYNC_INTERVAL die Trigger-Datei."""
+        if self.bus is not None:
+            message = self.bus.receive(timeout=0)
+            while message is not None:
+                self.training = message.data["enabled"]
+                self.bus.ack(message, detail=f"training={self.training}")
+                message = self.bus.receive(timeout=0)
+        if self.bus is None or now - self.training_synced >= RESYNC_INTERVAL:
+            self.training = os.path.exists(TRAINING_TRIGGER)
+            self.training_synced = now
+
+    def idle(self):
+        """Wartet POLL_INTERVAL auf neue Logzeilen, wacht bei einer Steuernachricht sofort auf."""
+        if self.bus is None:
+            time.sleep(POLL_INTERVAL)
+        else:
+            select.select([self.bus], [], [], POLL_INTERVAL)
+
+    def refresh_existing_rules(self):
+        # Der Index wird nur bei geänderter Signatur neu gelesen
+        rules = self.rules.rules()
+        if rules is not self.rules_seen:
+            self.rules_seen = rules
+            self.suggestions.discard([url for url in list(self.suggestions.urls) if self.rules.covers(url)])
+            self.ip_suggestions_changed = True
+
+    def count_rule_hits(self, urls, ips, status):
+        """Zählt geblockte Anfragen (403) pro Regel; hält genutzte Regeln am Leben."""
+        blocked = Counter((urls[i], ips[i]) for i in np.flatnonzero(status == 403))
+        for (url, ip), count in blocked.items():
+            key = self.rules.match(url) or self.rules.match_ip(ip)
+            if key is not None:
+                self.rule_hits[key] += count
+
+    def track_benign_paths(self, urls, anomaly, status):
+        """Pfade unauffälliger, erfolgreicher Anfragen (ohne Query-String) für compact() merken."""
+        benign = ~anomaly & (status < 400)
+        if not benign.any():
+            return
+        for url in set(urls[benign]):
+            path = url.split("?", 1)[0]
+            self.benign_paths[path] = True
+            self.benign_paths.move_to_end(path)
+        while len(self.benign_paths) > MAX_BENIGN_PATHS:
+            self.benign_paths.popitem(last=False)
+
+    def track_suspicious_ips(self, ips, now):
+        for ip in set(ips):
+            if ip not in self.suspicious_ips:
+                self.ip_suggestions_changed = True
+            self.suspicious_ips[ip] = now
+            self.suspicious_ips.move_to_end(ip)
+        while self.suspicious_ips and now - next(iter(self.suspicious_ips.values())) > SUSPICIOUS_IP_TTL:
+            self.suspicious_ips.popitem(last=False)
+            self.ip_suggestions_changed = True
+
+    def ip_suggestions(self):
+        """Auffällige IPs, wo möglich zu Netzen zusammengefasst, ohne bereits geblockte."""
+        benign = [ip for ip in self.ip_windows.tracked_ips() if ip not in self.suspicious_ips]
+        cidrs = aggregate_cidrs(self.suspicious_ips, benign)
+        return [{"cidr": c} for c in cidrs if not self.rules.covers_cidr(c)]
+
+    def maintain_rules(self, now):
+        """Treffer in den Index schreiben, ungenutzte Regeln entfernen, ähnliche zusammenfassen."""
+        if self.rule_hits:
+            self.rules.record_hits(self.rule_hits, now)
+            self.rule_hits = Counter()
+        snapshot = self.registry.get()
+        # Bekannte und beobachtete gutartige Pfade nie von einer zusammengefassten Regel treffen lassen
+        protected = set(URL_MAP) | set(self.benign_paths)
+        if snapshot is not None and snapshot.url_vocab is not None:
+            protected.update(snapshot.url_vocab.paths)
+        expired, merges = self.rules.compact(now, protected=protected)
+        for merge in merges:
+            print(f"Regeln zusammengefasst: {', '.join(merge['members'])} -> {merge['rule']}")
+            self.rule_merges.append({"time": now, **merge})
+        if expired or merges:
+            consolidated = sum(len(m["members"]) for m in merges)
+            self.rules_expired += expired
+            self.rules_consolidated += consolidated
+            print(f"Regeln kompaktiert: {expired} abgelaufen, {consolidated} zusammengefasst.")
+            with open(RELOAD_TRIGGER, "a") as f:
+                f.write(f"{now:.3f}\n")
+        self.last_compact = now
+
+    def score_batch(self, start_line, data):
+        snapshot = self.registry.get()
+        columns, X = parse_for_scoring(data, start_line, snapshot.url_vocab if snapshot else None)
+        parsed = time.time()
+        line_numbers, urls = columns['line'], columns['url']
+        if len(line_numbers) == 0:
+            return
+        # Einmal geparst ablegen; Trainer und Dashboard lesen dann nicht mehr den Text
+        self.features.append(self.tailer.inode[1], columns, training=self.training)
+        # Bekannte Angriffs-URLs ohne Modell markieren (MSE = inf), nur der Rest geht ins Modell
+        known = self.prefilter.match(urls)
+        mse = np.full(len(X), np.inf)
+        anomaly = known.copy()
+        rest = ~known
+        if snapshot is None:
+            mse[rest] = np.nan
+        elif rest.any():
+            # Wiederkehrende Feature-Vektoren kommen aus dem Cache, nur neue gehen ins Modell
+            mse[rest] = self.score_cache.mse(snapshot, X[rest])
+            anomaly[rest] = mse[rest] > snapshot.threshold
+        scored = time.time()
+        # Gleitende Fenster pro Client-IP: Scanner, die ständig neue Pfade probieren.
+        # Nur für IP-/CIDR-Vorschläge; die Anomalie pro Zeile (Scores, URL-Vorschläge,
+        # gutartige Pfade) bleibt Vorfilter bzw. Modell, sonst würde jede URL einer
+        # schnellen IP (z.B. Profil "stress") zum Blockvorschlag.
+        ip_features = self.ip_windows.update(columns['ip'], columns['timestamp'], columns['status'], urls)
+        ip_flagged = self.ip_windows.suspicious(ip_features)
+        if ip_flagged.any():
+            self.track_suspicious_ips(columns['ip'][ip_flagged], time.time())
+        self.store.append(self.tailer.inode[1], line_numbers, mse, anomaly)
+        self.lines_scored += len(line_numbers)
+        self.lines_since_flush += len(line_numbers)
+        self.count_rule_hits(urls, columns['ip'], columns['status'])
+        self.track_benign_paths(urls, anomaly, columns['status'])
+        if anomaly.any():
+            self.anomalies += int(anomaly.sum())
+            idx = np.flatnonzero(anomaly)
+            flagged = [urls[i] for i in idx]
+            keep = [j for j, url in enumerate(flagged) if not self.rules.covers(url)]
+            self.suggestions.add([flagged[j] for j in keep], mse[idx][keep], time.time(),
+                                 logged=columns['timestamp'][idx][keep],
+                                 stages={"parsed": parsed, "scored": scored})
+
+    def flush(self, now):
+        snapshot = self.registry.get()
+        elapsed = now - self.last_flush if self.last_flush else FLUSH_INTERVAL
+        write_json_atomic(SCORER_STATE_PATH, self.tailer.get_state())
+        write_json_atomic(SCORER_STATUS_PATH, {
+            "updated": now,
+            "lines_scored": self.lines_scored,
+            "anomalies": self.anomalies,
+            "lines_per_sec": self.lines_since_flush / max(elapsed, 1e-6),
+            "lag_bytes": self.tailer.lag(),
+            "skipped_bytes": self.skipped_bytes,
+            "model_version": snapshot.version if snapshot else None,
+            "engine": snapshot.engine if snapshot else None,
+            "model_error": str(self.registry.last_error) if self.registry.last_error else None,
+            "prefilter": self.prefilter.stats(),
+            "score_cache": self.score_cache.stats(),
+            "rules": len(self.rules),
+            "rules_expired": self.rules_expired,
+            "rules_consolidated": self.rules_consolidated,
+            "rule_merges": list(self.rule_merges),
+            "tracked_ips": len(self.ip_windows.ips),
+            "suspicious_ips": len(self.suspicious_ips),
+        })
+        if self.suggestions.changed or self.ip_suggestions_changed:
+            write_json_atomic(BLOCK_SUGGESTIONS_PATH, {
+                "updated": now,
+                "suggestions": self.suggestions.top(now=now),
+                "ip_suggestions": self.ip_suggestions(),
+            })
+            self.suggestions.changed = False
+            self.ip_suggestions_changed = False
+        try:
+            # Regeln, deren Reload reload-watcher.sh gemeldet hat: Trace abschließen
+            self.latency.poll(now)
+        except OSError as e:
+            print(f"Latenz-Traces nicht lesbar: {e}")
+        self.last_flush = now
+        self.lines_since_flush = 0
+
+    def run(self):
+        print(f"Scorer gestartet (Batch: {BATCH_BYTES} Bytes).")
+        if METRICS_PORT:
+            start_metrics_server(self.latency.prometheus, METRICS_PORT)
+            print(f"Latenz-Metriken unter http://0.0.0.0:{METRICS_PORT}/metrics")
+        while True:
+            if MAX_LAG_BYTES and self.tailer.lag() > MAX_LAG_BYTES:
+                lag = self.tailer.lag()
+                self.tailer.seek_tail(0)
+                self.skipped_bytes += lag
+                print(f"Scorer {lag} Bytes im Rückstand, springe ans Dateiende.")
+            self.refresh_existing_rules()
+            self.poll_control(time.time())
+            _, start_line, data = self.tailer.read_block()
+            if data:
+                self.score_batch(start_line, data)
+            now = time.time()
+            if now - self.last_flush >= FLUSH_INTERVAL:
+                self.flush(now)
+            if now - self.last_compact >= RULE_COMPACT_INTERVAL:
+                try:
+                    self.maintain_rules(now)
+                except OSError as e:
+                    print(f"Regelpflege fehlgeschlagen: {e}")
+                    self.last_compact = now
+            # Backpressure: solange Rückstand besteht, ohne Pause weiterlesen
+            if not data:
+                self.idle()
+
+if __name__ == "__main__":
+    Scorer().run()
@@ -0,0 +1,76 @@
+# shared_code/background_job.py
+
+import multiprocessing
+import os
+import queue
+import signal
+import time
+import traceback
+
+
+def _run(results, func, args):
+    # Eigene Prozessgruppe: cancel() beendet so auch Kindprozesse (z.B. den Lese-Pool)
+    os.setpgrp()
+    try:
+        results.put(("ok", func(*args)))
+    except BaseException as e:
+        results.put(("error", f"{type(e).__name__}: {e}\n{traceback.format_exc()}"))
+
+
+class BackgroundJob:
+    """
+    Führt func(*args) in einem eigenen Prozess aus (Start-Methode "spawn": kein
+    geerbter TensorFlow-/Thread-Zustand aus dem Elternprozess). Der Aufrufer
+    bleibt reaktionsfähig, fragt mit poll() nach dem Ergebnis und kann den Job
+    mit cancel() jederzeit beenden. Der Job darf selbst Prozesse starten (kein
+    daemon-Prozess). func, args und das Ergebnis müssen picklebar sein.
+    """
+
+    def __init__(self, name, func, args=(), start_method="spawn"):
+        context = multiprocessing.get_context(start_method)
+        self.name = name
+        self._results = context.Queue(maxsize=1)
+        self.process = context.Process(target=_run, args=(self._results, func, args), name=name)
+        self.started = None
+        self._result = None
+
+    def start(self):
+        self.process.start()
+        self.started = time.time()
+        return self
+
+    def elapsed(self):
+        return time.time() - self.started if self.started else 0.0
+
+    def poll(self):
+        """None, solange der Job läuft, sonst ("ok", Ergebnis), ("error", Meldung) oder ("cancelled", None)."""
+        if self._result is None:
+            try:
+                self._result = self._results.get_nowait()
+            except queue.Empty:
+                if self.process.is_alive():
+                    return None
+                try:
+                    # Prozess ist fertig, das Ergebnis kann noch in der Pipe stecken
+                    self._result = self._results.get(timeout=1)
+                except queue.Empty:
+                    self._result = ("error", f"{self.name} exited with code {self.process.exitcode}")
+            self.process.join()
+        return self._result
+
+    def cancel(self, timeout=5):
+        """Beendet den Prozess samt Kindprozessen (SIGTERM, nach timeout SIGKILL)."""
+        if self.process.is_alive():
+            self._signal(signal.SIGTERM)
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self._signal(signal.SIGKILL)
+                self.process.join()
+        if self._result is None:
+            self._result = ("cancelled", None)
+
+    def _signal(self, signum):
+        try:
+            os.killpg(self.process.pid, signum)
+        except (ProcessLookupError, PermissionError):
+            os.kill(self.process.pid, signum)
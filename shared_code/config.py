@@ -4,24 +4,47 @@
 LOGFILE_PATH = "/logs/access.log"
 MODEL_PATH = "/model/autoencoder_model.h5"
 THRESHOLD_PATH = "/model/autoencoder_threshold.json"
+THRESHOLD_SKETCH_PATH = "/model/threshold_sketch.json"  # Quantil-Sketch der Rekonstruktionsfehler (Trainer)
 MODEL_REF_PATH = "/model/autoencoder_model_reference.h5"
 SCALER_PATH = "/model/autoencoder_scaler.pkl"  # <--- NEU
+WEIGHTS_PATH = "/model/autoencoder_weights.npz"  # NumPy-Export für die Inferenz ohne TensorFlow
+WEIGHTS_REF_PATH = "/model/autoencoder_weights_reference.npz"
+URL_VOCAB_PATH = "/model/autoencoder_url_vocab.json"  # gelerntes URL-Vokabular (Trainer), fehlt -> feste URL_MAP
+URL_VOCAB_REF_PATH = "/model/autoencoder_url_vocab_reference.json"
+SCALER_REF_PATH = "/model/autoencoder_scaler_reference.pkl"
+MODEL_VERSIONS_DIR = "/model/versions"  # ein unveränderliches Verzeichnis pro Trainingsstand
+MODEL_CURRENT_PATH = "/model/current.json"  # Zeiger auf den aktiven Stand (atomar per os.replace)
+TRAINER_STATE_PATH = "/model/trainer_state.json"
 CUSTOM_RULES_PATH = "/etc/nginx/conf.d/custom_rules.conf"
+SCORES_PATH = "/shared/scores.bin"  # Scores des Scorer-Dienstes (append-only)
+SCORER_STATUS_PATH = "/shared/scorer_status.json"
+SCORER_STATE_PATH = "/shared/scorer_state.json"
+BLOCK_SUGGESTIONS_PATH = "/shared/block_suggestions.json"
+MALICIOUS_PATTERNS_PATH = "/shared/malicious_patterns.json"  # Vorfilter vor dem ML-Scoring
+FEATURE_STORE_DIR = "/shared/features"  # geparste Logzeilen als Segmente (vom Scorer geschrieben)
+LATENCY_TRACES_PATH = "/shared/latency_traces.json"  # offene Traces Erkennung -> Regel -> Reload
+LATENCY_METRICS_PATH = "/shared/latency_metrics.json"  # Latenz-Histogramme (vom Scorer geschrieben)
 CHECK_INTERVAL = 2
 
-# State Triggers
+# State Triggers (persistenter Zustand; Änderungen meldet zusätzlich der Steuerbus)
 TRAINING_TRIGGER = "/shared/training.trigger"
 ATTACK_TRIGGER = "/shared/attack.trigger"
+FULL_RETRAIN_TRIGGER = "/shared/full_retrain.trigger"
+CONTROL_BUS_DIR = "/shared/bus"  # Unix-Datagramm-Sockets der Abonnenten (control_bus.py)
 RELOAD_TRIGGER = "/shared/nginx_reload.trigger"
+RELOAD_STATUS_PATH = "/shared/nginx_reload_status.json"  # Ergebnis des letzten Reloads (reload-watcher.sh)
 
 # Attack Variables
 MALICIOUS_DURATION = 20
-MALICIOUS_RATE = 2
+# Rate, Methoden und Pfade des Angriffs: Profil "attack" in TRAFFIC_PROFILES_PATH
 
 # Webserver
 NGINX_HOST = "http://nginx:80"
+TRAFFIC_PROFILES_PATH = "/shared/traffic_profiles.json"  # Lastprofile für loadgen.py (normal/attack/...)
 
 # UI-Settings
 N_LOG_LINES = 10
+LOG_WINDOW_LINES = 5000  # große Tabelle zum Untersuchen eines Bursts (nur mit Scorer-Dienst)
+LOG_PAGE_ROWS = 500  # Zeilen pro Seite der großen Tabelle (nur diese gehen pro Refresh an den Browser)
 MALICIOUS_DURATION = 20  # seconds
 
@@ -0,0 +1,219 @@
+# shared_code/control_bus.py
+
+import json
+import os
+import select
+import socket
+import time
+from collections import namedtuple
+
+from config import CONTROL_BUS_DIR
+from score_store import read_json, write_json_atomic
+
+# Nachrichtentypen und ihre Pflichtfelder
+TRAINING_MODE = "training_mode"  # {"enabled": bool}
+ATTACK = "attack"  # {"duration": Sekunden}
+FULL_RETRAIN = "full_retrain"  # {}
+MESSAGE_FIELDS = {
+    TRAINING_MODE: {"enabled": bool},
+    ATTACK: {"duration": (int, float)},
+    FULL_RETRAIN: {},
+}
+ACK_TIMEOUT = 0.5
+# Ohne Nachricht gleichen Abonnenten spätestens nach dieser Zeit mit den Trigger-Dateien ab
+RESYNC_INTERVAL = float(os.environ.get("CONTROL_BUS_RESYNC", 30))
+MAX_DATAGRAM = 65536
+
+Message = namedtuple("Message", ["type", "data", "id", "sent", "sender", "reply_to"])
+Ack = namedtuple("Ack", ["id", "subscriber", "ok", "detail", "latency_ms"])
+
+
+def validate(type, data):
+    """Prüft Typ und Pflichtfelder einer Nachricht; ValueError bei Abweichung."""
+    fields = MESSAGE_FIELDS.get(type)
+    if fields is None:
+        raise ValueError(f"Unknown control message type: {type}")
+    for name, kind in fields.items():
+        if not isinstance(data.get(name), kind) or (kind is not bool and isinstance(data.get(name), bool)):
+            raise ValueError(f"Control message {type} needs field {name!r} of type {kind}")
+    return data
+
+
+def _socket(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    sock.bind(path)
+    os.chmod(path, 0o666)
+    sock.setblocking(False)  # volle Empfangspuffer blockieren den Sender nicht
+    return sock
+
+
+class Subscriber:
+    """
+    Empfänger am lokalen Steuerbus: ein Unix-Datagramm-Socket unter
+    CONTROL_BUS_DIR/<name>.sock plus eine Registrierung <name>.json mit den
+    abonnierten Typen. Das Verzeichnis liegt im gemeinsamen Volume /shared,
+    so erreichen sich alle Container ohne Broker. receive() blockiert bis zur
+    nächsten Nachricht (kein stat()-Polling); ack() bestätigt dem Absender.
+
+    Die Trigger-Dateien bleiben der persistente Zustand (Neustarts, Anzeige im
+    Dashboard); der Bus meldet nur Änderungen sofort.
+    """
+
+    def __init__(self, name, topics, bus_dir=CONTROL_BUS_DIR):
+        os.makedirs(bus_dir, exist_ok=True)
+        self.name = name
+        self.topics = list(topics)
+        self.socket_path = os.path.join(bus_dir, f"{name}.sock")
+        self.registration_path = os.path.join(bus_dir, f"{name}.json")
+        self.sock = _socket(self.socket_path)
+        write_json_atomic(self.registration_path, {
+            "name": name, "socket": self.socket_path, "topics": self.topics, "pid": os.getpid(),
+        })
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def receive(self, timeout=None):
+        """Nächste gültige Nachricht oder None nach timeout Sekunden (0 = nicht blockieren)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            if not select.select([self.sock], [], [], remaining)[0]:
+                return None
+            try:
+                raw = self.sock.recv(MAX_DATAGRAM)
+            except BlockingIOError:
+                continue
+            try:
+                data = json.loads(raw)
+                message = Message(data["type"], validate(data["type"], data.get("data") or {}),
+                                  data["id"], data["sent"], data.get("sender"), data.get("reply_to"))
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Ungültige Steuernachricht verworfen: {e}")
+                continue
+            if message.type in self.topics:
+                return message
+
+    def ack(self, message, ok=True, detail=None):
+        """Bestätigt message; ist der Absender nicht mehr da, passiert nichts."""
+        if not message.reply_to:
+            return
+        payload = json.dumps({
+            "ack": message.id, "subscriber": self.name, "ok": ok, "detail": detail, "received": time.time(),
+        }).encode()
+        try:
+            self.sock.sendto(payload, message.reply_to)
+        except OSError:
+            pass
+
+    def close(self):
+        self.sock.close()
+        for path in (self.socket_path, self.registration_path):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_subscriber(name, topics, bus_dir=CONTROL_BUS_DIR):
+    """Subscriber oder None, falls kein Socket angelegt werden kann (Aufrufer pollt dann wie bisher)."""
+    try:
+        return Subscriber(name, topics, bus_dir)
+    except OSError as e:
+        print(f"Steuerbus nicht verfügbar ({e}), nutze Trigger-Dateien.")
+        return None
+
+
+def subscribers(type, bus_dir=CONTROL_BUS_DIR):
+    """{name: socket_path} aller Abonnenten eines Nachrichtentyps."""
+    try:
+        names = os.listdir(bus_dir)
+    except FileNotFoundError:
+        return {}
+    found = {}
+    for name in names:
+        if name.endswith(".json"):
+            data = read_json(os.path.join(bus_dir, name)) or {}
+            if type in data.get("topics", ()) and data.get("socket"):
+                found[data["name"]] = data["socket"]
+    return found
+
+
+def _forget(bus_dir, name, socket_path):
+    """Registrierung eines nicht mehr gebundenen Sockets entfernen (Abonnent beendet)."""
+    for path in (socket_path, os.path.join(bus_dir, f"{name}.json")):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def publish(type, data=None, sender=None, timeout=ACK_TIMEOUT, bus_dir=CONTROL_BUS_DIR):
+    """
+    Sendet eine Nachricht an alle Abonnenten und wartet bis timeout auf deren
+    Bestätigungen. Gibt (acks, fehlende Abonnenten) zurück; ohne Abonnenten
+    ([], []). Der Bus ersetzt nicht die Trigger-Datei: der Aufrufer schreibt
+    den Zustand weiterhin dorthin.
+    """
+    data = validate(type, dict(data or {}))
+    targets = subscribers(type, bus_dir)
+    if not targets:
+        return [], []
+    message_id = os.urandom(6).hex()
+    reply_path = os.path.join(bus_dir, f".reply-{os.getpid()}-{message_id}.sock")
+    sock = _socket(reply_path)
+    try:
+        sent = time.time()
+        payload = json.dumps({
+            "type": type, "data": data, "id": message_id, "sent": sent,
+            "sender": sender, "reply_to": reply_path,
+        }).encode()
+        waiting = set()
+        for name, socket_path in targets.items():
+            try:
+                sock.sendto(payload, socket_path)
+                waiting.add(name)
+            except (ConnectionRefusedError, FileNotFoundError):
+                _forget(bus_dir, name, socket_path)
+            except OSError as e:  # z.B. BlockingIOError: Abonnent liest gerade nicht
+                print(f"Steuernachricht an {name} fehlgeschlagen: {e}")
+        acks = []
+        deadline = time.monotonic() + timeout
+        while waiting:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([sock], [], [], remaining)[0]:
+                break
+            try:
+                reply = json.loads(sock.recv(MAX_DATAGRAM))
+            except ValueError:
+                continue
+            if reply.get("ack") == message_id and reply.get("subscriber") in waiting:
+                waiting.discard(reply["subscriber"])
+                acks.append(Ack(message_id, reply["subscriber"], reply.get("ok", True), reply.get("detail"),
+                                round((time.time() - sent) * 1000, 2)))
+        return acks, sorted(waiting)
+    finally:
+        sock.close()
+        try:
+            os.unlink(reply_path)
+        except FileNotFoundError:
+            pass
+
+
+def describe_acks(acks, missing):
+    """Kurzer Text für das Dashboard, z.B. 'acknowledged by trainer (3 ms)'."""
+    parts = [f"{a.subscriber} ({a.latency_ms:.0f} ms)" for a in acks]
+    text = f"acknowledged by {', '.join(parts)}" if parts else "no subscriber on the control bus"
+    if missing:
+        text += f"; no ack from {', '.join(missing)}"
+    return text
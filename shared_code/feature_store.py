@@ -0,0 +1,198 @@
+# shared_code/feature_store.py
+
+import glob
+import json
+import os
+
+import numpy as np
+
+
+# Ein Datensatz pro geparster Logzeile. Strings haben feste Breite, damit die
+# Segmente per mmap ohne Kopie und ohne erneutes Parsen gelesen werden können.
+FEATURE_DTYPE = np.dtype([
+    ("inode", "<u8"),
+    ("line", "<i8"),
+    ("timestamp", "<f8"),
+    ("method_num", "i1"),
+    ("url_num", "<i4"),
+    ("status", "<i2"),
+    ("size", "<i8"),
+    ("training", "u1"),  # Zeile wurde im Trainingsmodus geschrieben
+    ("ip", "S45"),
+    ("time", "S26"),
+    ("method", "S16"),
+    ("url", "S256"),  # längere URLs werden abgeschnitten
+])
+_STRING_COLS = ("ip", "time", "method", "url")
+
+SEGMENT_ROWS = 1 << 16
+MAX_SEGMENTS = int(os.environ.get("FEATURE_STORE_MAX_SEGMENTS", 16))
+MANIFEST = "manifest.json"
+
+
+class FeatureStore:
+    """
+    Append-only Feature-Store aus Segmenten.
+
+    Der Schreiber (Scorer) hängt an ``active_<id>.bin`` an; ist das Segment voll,
+    wird es als ``seg_<id>.npy`` versiegelt und im Manifest mit Zeilen- und
+    Zeitbereich eingetragen. Leser (Trainer, Dashboard) lesen Segmente per mmap
+    und wählen sie über das Manifest aus. Ältere Segmente als max_segments
+    werden gelöscht.
+    """
+
+    def __init__(self, directory, segment_rows=SEGMENT_ROWS, max_segments=MAX_SEGMENTS):
+        self.directory = directory
+        self.segment_rows = segment_rows
+        self.max_segments = max_segments
+
+    # --- Manifest ---
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def manifest(self):
+        try:
+            with open(self._path(MANIFEST)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"segments": [], "active_id": 0}
+
+    def _write_manifest(self, manifest):
+        tmp_path = self._path(MANIFEST + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._path(MANIFEST))
+
+    def _active_path(self, active_id):
+        return self._path(f"active_{active_id:06d}.bin")
+
+    # --- Schreiben (nur ein Prozess) ---
+    def append(self, inode, columns, training=False):
+        """Hängt die Spalten aus log_parser.parse_block an das aktive Segment an."""
+        n = len(columns["line"])
+        if n == 0:
+            return
+        records = np.zeros(n, dtype=FEATURE_DTYPE)
+        records["inode"] = inode
+        records["training"] = training
+        for name in ("line", "timestamp", "method_num", "url_num", "status", "size"):
+            records[name] = columns[name]
+        for name in _STRING_COLS:
+            records[name] = np.char.encode(columns[name].astype(str), "utf-8", "replace")
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = self.manifest()
+        path = self._active_path(manifest["active_id"])
+        with open(path, "ab") as f:
+            f.write(records.tobytes())
+        if os.path.getsize(path) >= self.segment_rows * FEATURE_DTYPE.itemsize:
+            self._seal(manifest)
+
+    def _seal(self, manifest):
+        active_id = manifest["active_id"]
+        path = self._active_path(active_id)
+        records = np.fromfile(path, dtype=FEATURE_DTYPE)
+        name = f"seg_{active_id:06d}.npy"
+        tmp_path = self._path(name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, records)
+        os.replace(tmp_path, self._path(name))
+        manifest["segments"].append({
+            "file": name,
+            "rows": len(records),
+            "line_min": int(records["line"].min()),
+            "line_max": int(records["line"].max()),
+            "ts_min": float(np.nanmin(records["timestamp"])),
+            "ts_max": float(np.nanmax(records["timestamp"])),
+            "inodes": sorted(int(i) for i in np.unique(records["inode"])),
+        })
+        expired = manifest["segments"][:-self.max_segments] if self.max_segments else []
+        manifest["segments"] = manifest["segments"][len(expired):]
+        manifest["active_id"] = active_id + 1
+        # Erst das Manifest, dann aufräumen: ein Absturz dazwischen hinterlässt
+        # höchstens verwaiste Dateien, aber keine doppelten Zeilen.
+        self._write_manifest(manifest)
+        for stale in [self._path(s["file"]) for s in expired] + glob.glob(self._path("active_*.bin")):
+            if stale != self._active_path(active_id + 1):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+
+    # --- Lesen ---
+    def _load(self, name):
+        try:
+            return np.load(self._path(name), mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return None  # gerade durch die Retention gelöscht
+
+    def _load_active(self, active_id):
+        path = self._active_path(active_id)
+        try:
+            rows = os.path.getsize(path) // FEATURE_DTYPE.itemsize
+        except FileNotFoundError:
+            return None
+        if rows == 0:
+            return None
+        return np.memmap(path, dtype=FEATURE_DTYPE, mode="r", shape=(rows,))
+
+    def iter_segments(self, ts_from=None, ts_to=None):
+        """
+        Liefert die Segmente (älteste zuerst) als mmap-Arrays. Versiegelte
+        Segmente außerhalb von [ts_from, ts_to] werden gar nicht erst geöffnet.
+        """
+        manifest = self.manifest()
+        for meta in manifest["segments"]:
+            if ts_from is not None and meta["ts_max"] < ts_from:
+                continue
+            if ts_to is not None and meta["ts_min"] > ts_to:
+                continue
+            records = self._load(meta["file"])
+            if records is not None:
+                yield records
+        active = self._load_active(manifest["active_id"])
+        if active is not None:
+            yield active
+
+    def read_time_range(self, ts_from=None, ts_to=None, training_only=False):
+        """Alle Datensätze mit ts_from <= timestamp <= ts_to (None = offen)."""
+        parts = []
+        for records in self.iter_segments(ts_from, ts_to):
+            mask = np.ones(len(records), dtype=bool)
+            if ts_from is not None:
+                mask &= records["timestamp"] >= ts_from
+            if ts_to is not None:
+                mask &= records["timestamp"] <= ts_to
+            if training_only:
+                mask &= records["training"] == 1
+            if mask.any():
+                parts.append(records[mask])
+        return np.concatenate(parts) if parts else np.empty(0, dtype=FEATURE_DTYPE)
+
+    def tail(self, n):
+        """Die letzten n Datensätze (aktives Segment zuerst, dann rückwärts)."""
+        if n <= 0:
+            return np.empty(0, dtype=FEATURE_DTYPE)
+        manifest = self.manifest()
+        parts, remaining = [], n
+        active = self._load_active(manifest["active_id"])
+        if active is not None:
+            parts.append(active[-remaining:])
+            remaining -= len(parts[-1])
+        for meta in reversed(manifest["segments"]):
+            if remaining <= 0:
+                break
+            records = self._load(meta["file"])
+            if records is not None:
+                parts.append(records[-remaining:])
+                remaining -= len(parts[-1])
+        if not parts:
+            return np.empty(0, dtype=FEATURE_DTYPE)
+        return np.concatenate(parts[::-1])
+
+
+def store_columns(records):
+    """Datensätze -> Spalten-dict im Format von log_parser.parse_block (für to_dataframe)."""
+    columns = {name: np.asarray(records[name]) for name in ("line", "timestamp", "method_num", "url_num", "status", "size")}
+    for name in _STRING_COLS:
+        columns[name] = np.char.decode(records[name], "utf-8", "replace").astype(object)
+    return columns
@@ -0,0 +1,154 @@
+# shared_code/ip_windows.py
+
+import ipaddress
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+WINDOWS = (10, 60)  # Sekunden; das längste Fenster bestimmt die Ringgröße
+MAX_IPS = int(os.environ.get("IP_WINDOW_MAX_IPS", 10000))
+MAX_URLS_PER_IP = 512
+# Schwellen, ab denen eine Client-IP als auffällig gilt
+IP_MAX_RATE_10S = float(os.environ.get("IP_MAX_RATE_10S", 10.0))  # Anfragen/s
+IP_MAX_ERROR_RATIO = float(os.environ.get("IP_MAX_ERROR_RATIO", 0.5))  # Anteil 4xx in 60s
+IP_MAX_DISTINCT_URLS = int(os.environ.get("IP_MAX_DISTINCT_URLS", 30))  # verschiedene URLs in 60s
+IP_MIN_REQUESTS = 10  # Verhältniswerte erst ab so vielen Anfragen im 60s-Fenster
+FEATURE_NAMES = ["rate_10s", "rate_60s", "error_ratio_60s", "distinct_urls_60s"]
+
+
+class _IPState:
+    """Sekunden-Buckets (Ring) und die zuletzt gesehenen URLs einer Client-IP."""
+
+    __slots__ = ("second", "requests", "errors", "urls")
+
+    def __init__(self, size):
+        self.second = [-1] * size
+        self.requests = [0] * size
+        self.errors = [0] * size
+        self.urls = OrderedDict()  # URL -> letzte Sekunde, älteste zuerst
+
+    def add(self, second, is_error, url):
+        size = len(self.second)
+        i = second % size
+        if self.second[i] != second:
+            self.second[i] = second
+            self.requests[i] = 0
+            self.errors[i] = 0
+        self.requests[i] += 1
+        self.errors[i] += is_error
+        self.urls[url] = second
+        self.urls.move_to_end(url)
+        if len(self.urls) > MAX_URLS_PER_IP:
+            self.urls.popitem(last=False)
+
+    def window(self, second, length):
+        """(Anfragen, Fehler) in den letzten length Sekunden bis einschließlich second."""
+        start = second - length
+        requests = errors = 0
+        for s, r, e in zip(self.second, self.requests, self.errors):
+            if start < s <= second:
+                requests += r
+                errors += e
+        return requests, errors
+
+    def distinct_urls(self, second, length):
+        start = second - length
+        count = 0
+        for seen in reversed(self.urls.values()):
+            if seen <= start:
+                break
+            count += 1
+        return count
+
+
+class IPWindowAggregator:
+    """
+    Gleitende Fenster pro Client-IP (Anfragerate, 4xx-Anteil, verschiedene URLs)
+    über die Logzeit. Speicher ist begrenzt: höchstens max_ips IPs (LRU), pro IP
+    ein Ring aus Sekunden-Buckets und höchstens MAX_URLS_PER_IP URLs.
+    """
+
+    def __init__(self, windows=WINDOWS, max_ips=MAX_IPS):
+        self.windows = windows
+        self.size = max(windows)
+        self.max_ips = max_ips
+        self.ips = OrderedDict()
+
+    def _state(self, ip):
+        state = self.ips.get(ip)
+        if state is None:
+            state = self.ips[ip] = _IPState(self.size)
+            if len(self.ips) > self.max_ips:
+                self.ips.popitem(last=False)
+        else:
+            self.ips.move_to_end(ip)
+        return state
+
+    def update(self, ips, timestamps, statuses, urls):
+        """
+        Nimmt einen Block Logzeilen auf und liefert pro Zeile die Fensterwerte
+        zum Zeitpunkt der Zeile als (n, 4)-Matrix (Spalten: FEATURE_NAMES).
+        """
+        n = len(ips)
+        out = np.zeros((n, len(FEATURE_NAMES)))
+        short, long_ = self.windows[0], self.windows[-1]
+        seconds = np.nan_to_num(timestamps).astype(np.int64)
+        errors = (np.asarray(statuses) >= 400) & (np.asarray(statuses) < 500)
+        for i in range(n):
+            state = self._state(ips[i])
+            second = int(seconds[i])
+            state.add(second, int(errors[i]), urls[i])
+            requests_short, _ = state.window(second, short)
+            requests_long, errors_long = state.window(second, long_)
+            out[i] = (
+                requests_short / short,
+                requests_long / long_,
+                errors_long / requests_long if requests_long >= IP_MIN_REQUESTS else 0.0,
+                state.distinct_urls(second, long_),
+            )
+        return out
+
+    @staticmethod
+    def suspicious(features):
+        """Bool-Maske: Zeilen, deren Client-IP eine der Schwellen überschreitet."""
+        return (
+            (features[:, 0] > IP_MAX_RATE_10S)
+            | (features[:, 2] > IP_MAX_ERROR_RATIO)
+            | (features[:, 3] > IP_MAX_DISTINCT_URLS)
+        )
+
+    def tracked_ips(self):
+        return list(self.ips)
+
+
+def aggregate_cidrs(suspicious_ips, benign_ips=(), min_group=2, prefix_v4=24, prefix_v6=64):
+    """
+    Fasst auffällige IPs zu Netzen zusammen: liegen mindestens min_group davon
+    im selben /24 (IPv6: /64) und keine unauffällige IP, wird das Netz
+    vorgeschlagen, sonst die Einzeladresse. Ergebnis ist kollabiert und sortiert.
+    """
+    networks = {}
+    for ip in suspicious_ips:
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            continue
+        prefix = prefix_v4 if addr.version == 4 else prefix_v6
+        networks.setdefault(ipaddress.ip_network(f"{addr}/{prefix}", strict=False), []).append(addr)
+    benign = []
+    for ip in benign_ips:
+        try:
+            benign.append(ipaddress.ip_address(ip))
+        except ValueError:
+            pass
+    result = []
+    for network, members in networks.items():
+        if len(members) >= min_group and not any(b in network for b in benign):
+            result.append(network)
+        else:
+            result.extend(ipaddress.ip_network(a) for a in members)
+    collapsed = []
+    for version in (4, 6):
+        collapsed += ipaddress.collapse_addresses(n for n in result if n.version == version)
+    return [str(n) for n in collapsed]
@@ -0,0 +1,287 @@
+# shared_code/latency.py
+
+import fcntl
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from model_registry import file_signature
+from score_store import read_json, write_json_atomic
+
+# Stationen einer Erkennung bis zur durchgesetzten Regel (in dieser Reihenfolge).
+# "logged" stammt aus $time_local im Log und hat nur Sekundenauflösung.
+STAGES = ("logged", "parsed", "scored", "suggested", "rule_written", "reload_requested", "reload_done")
+# Obergrenzen der Histogramm-Buckets in Sekunden (wie Prometheus, +Inf kommt dazu)
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 1.5, 2, 3, 5, 7.5, 10, 15, 30, 60, 120, 300, 600, 1800, 3600)
+QUANTILES = (0.5, 0.95, 0.99)
+# Offene Traces, deren Regel nie durchgesetzt wird, nach dieser Zeit verwerfen
+TRACE_TTL = float(os.environ.get("LATENCY_TRACE_TTL", 3600))
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9108))
+METRIC_PREFIX = "autonomous_control"
+
+
+class Histogram:
+    """Kumulatives Histogramm mit festen Buckets; Quantile wie histogram_quantile()."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # letzter Eintrag: > größter Bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        value = max(float(value), 0.0)
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Linear innerhalb des Buckets interpoliert; None ohne Beobachtungen."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]  # über dem größten Bucket: keine Obergrenze bekannt
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def summary(self):
+        data = {"count": self.count, "mean": self.sum / self.count if self.count else None}
+        for q in QUANTILES:
+            data[f"p{round(q * 100)}"] = self.quantile(q)
+        return data
+
+    def prometheus(self, name, labels=""):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == math.inf else repr(float(bound))
+            lines.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="{le}"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+    def to_dict(self):
+        return {"buckets": list(self.buckets), "counts": self.counts, "sum": self.sum, "count": self.count}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data["buckets"])
+        if len(data["counts"]) == len(histogram.counts):
+            histogram.counts = list(data["counts"])
+            histogram.sum = float(data["sum"])
+            histogram.count = int(data["count"])
+        return histogram
+
+
+class LatencyMetrics:
+    """
+    Histogramme pro Station (Zeit seit der vorherigen vorhandenen Station) und
+    für die Gesamtzeit von der Logzeile bis zum abgeschlossenen NGINX-Reload.
+    """
+
+    def __init__(self):
+        self.stages = {stage: Histogram() for stage in STAGES[1:]}
+        self.total = Histogram()
+        self.completed = 0
+        self.expired = 0
+
+    def observe(self, trace):
+        previous = None
+        for stage in STAGES:
+            t = trace.get(stage)
+            if t is None:
+                continue
+            if previous is not None:
+                self.stages[stage].observe(t - previous)
+            previous = t
+        # Gesamtzeit nur für erkannte Anfragen; manuell geschriebene Regeln beginnen bei rule_written
+        if trace.get("logged") is not None and trace.get("reload_done") is not None:
+            self.total.observe(trace["reload_done"] - trace["logged"])
+        self.completed += 1
+
+    def summary(self):
+        return {
+            "stages": {stage: h.summary() for stage, h in self.stages.items()},
+            "total": self.total.summary(),
+            "completed": self.completed,
+            "expired": self.expired,
+        }
+
+    def prometheus(self):
+        name = f"{METRIC_PREFIX}_stage_latency_seconds"
+        lines = [f"# HELP {name} Time from the previous pipeline stage to this stage.",
+                 f"# TYPE {name} histogram"]
+        for stage, histogram in self.stages.items():
+            lines += histogram.prometheus(name, f'stage="{stage}"')
+        name = f"{METRIC_PREFIX}_detection_to_enforcement_seconds"
+        lines += [f"# HELP {name} Time from the logged request to the completed nginx reload.",
+                  f"# TYPE {name} histogram"]
+        lines += self.total.prometheus(name)
+        for field, text in (("completed", "Traces that reached reload_done."),
+                            ("expired", "Traces dropped before their rule was enforced.")):
+            name = f"{METRIC_PREFIX}_latency_traces_{field}_total"
+            lines += [f"# HELP {name} {text}", f"# TYPE {name} counter", f"{name} {getattr(self, field)}"]
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        return {
+            "stages": {stage: h.to_dict() for stage, h in self.stages.items()},
+            "total": self.total.to_dict(),
+            "completed": self.completed,
+            "expired": self.expired,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        metrics = cls()
+        for stage, histogram in (data.get("stages") or {}).items():
+            if stage in metrics.stages:
+                metrics.stages[stage] = Histogram.from_dict(histogram)
+        if data.get("total"):
+            metrics.total = Histogram.from_dict(data["total"])
+        metrics.completed = int(data.get("completed", 0))
+        metrics.expired = int(data.get("expired", 0))
+        return metrics
+
+
+class PendingTraces:
+    """
+    Offene Traces (Regel-Schlüssel -> {Station: Zeitstempel}) als JSON-Datei.
+    Das Dashboard legt sie beim Schreiben einer Regel an und stempelt den
+    Reload-Auftrag, der Scorer schließt sie nach dem Reload ab. Änderungen
+    laufen unter einer Dateisperre.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @contextmanager
+    def _locked(self):
+        with open(self.path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                traces = read_json(self.path, {}) or {}
+                before = dict(traces)
+                yield traces
+                if traces != before:
+                    write_json_atomic(self.path, traces)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def add(self, traces):
+        """Übernimmt neue Traces ({Schlüssel: Trace}); ein bestehender Trace wird ersetzt."""
+        if traces:
+            with self._locked() as pending:
+                pending.update(traces)
+
+    def mark(self, stage, t=None):
+        """Stempelt stage bei allen offenen Traces, die sie noch nicht haben."""
+        t = time.time() if t is None else t
+        with self._locked() as pending:
+            for key, trace in pending.items():
+                if trace.get(stage) is None:
+                    pending[key] = {**trace, stage: t}
+
+    def complete(self, reload_status, now=None):
+        """
+        Schließt alle Traces ab, deren Reload-Auftrag im erfolgreichen Reload
+        reload_status (RELOAD_STATUS_PATH von reload-watcher.sh) enthalten war
+        oder davor lag. Gibt (abgeschlossene Traces, Anzahl verworfener) zurück.
+        """
+        now = time.time() if now is None else now
+        done_at = requested_last = None
+        if reload_status and reload_status.get("ok"):
+            done_at = reload_status["finished_ms"] / 1000
+            requested_last = reload_status.get("requested_last") or reload_status["started_ms"] / 1000
+        completed, expired = [], 0
+        with self._locked() as pending:
+            for key, trace in list(pending.items()):
+                requested = trace.get("reload_requested")
+                if done_at is not None and requested is not None and requested <= requested_last + 1e-3:
+                    completed.append({**trace, "reload_done": max(done_at, requested), "key": key})
+                    del pending[key]
+                elif now - max(trace.get(s) or 0 for s in STAGES) > TRACE_TTL:
+                    del pending[key]
+                    expired += 1
+        return completed, expired
+
+
+class LatencyCollector:
+    """
+    Läuft im Scorer: schließt offene Traces ab, sobald reload-watcher.sh einen
+    erfolgreichen Reload meldet, und führt die Histogramme. Diese werden nach
+    metrics_path geschrieben (Dashboard, Neustart) und per prometheus() exportiert.
+    """
+
+    def __init__(self, pending_path, reload_status_path, metrics_path):
+        self.pending = PendingTraces(pending_path)
+        self.reload_status_path = reload_status_path
+        self.metrics_path = metrics_path
+        self.metrics = LatencyMetrics.from_dict(read_json(metrics_path, {}) or {})
+        self._sig = None
+        self._lock = threading.Lock()
+
+    def poll(self, now=None):
+        """Nur bei geänderter Trace- oder Reload-Status-Datei; gibt die Anzahl abgeschlossener Traces zurück."""
+        now = time.time() if now is None else now
+        sig = (file_signature(self.pending.path), file_signature(self.reload_status_path), int(now // 60))
+        if sig == self._sig or sig[0] is None:
+            return 0
+        self._sig = sig  # Minutenanteil: abgelaufene Traces auch ohne Änderung verwerfen
+        completed, expired = self.pending.complete(read_json(self.reload_status_path), now)
+        if not completed and not expired:
+            return 0
+        with self._lock:
+            for trace in completed:
+                self.metrics.observe(trace)
+            self.metrics.expired += expired
+            data = self.metrics.to_dict()
+        data["updated"] = now
+        data["summary"] = self.metrics.summary()
+        write_json_atomic(self.metrics_path, data)
+        return len(completed)
+
+    def prometheus(self):
+        with self._lock:
+            return self.metrics.prometheus()
+
+
+def start_metrics_server(render, port=METRICS_PORT):
+    """
+    Liefert render() (Prometheus-Textformat) unter http://<host>:port/metrics
+    aus einem Daemon-Thread. Gibt den Server zurück.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # kein Zugriffslog pro Scrape
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
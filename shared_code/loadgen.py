@@ -0,0 +1,295 @@
+# shared_code/loadgen.py
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import socket
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from config import NGINX_HOST, TRAFFIC_PROFILES_PATH
+
+REQUEST_TIMEOUT = 5.0
+ERROR_BACKOFF = 0.1  # nach Verbindungsfehlern kurz warten statt in einer Schleife neu zu verbinden
+REPORT_INTERVAL = float(os.environ.get("LOADGEN_REPORT_INTERVAL", 5))
+LATENCY_RESERVOIR = 65536  # Stichprobe für die Perzentile über den ganzen Lauf
+USER_AGENT = "autonomous-control-loadgen/1.0"
+
+
+def load_profiles(path=TRAFFIC_PROFILES_PATH):
+    """
+    Lastprofile aus traffic_profiles.json. Die Datei ist die einzige Quelle für
+    Methoden und Pfade (auch für synthetic_log und die Labels in replay).
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"Traffic profiles not found: {path} (copy shared/traffic_profiles.json or pass --profiles)"
+        ) from None
+
+
+def profile_paths(profiles, name):
+    """Alle Pfade (inkl. Query) eines Lastprofils, ohne Duplikate in Dateireihenfolge."""
+    if name not in profiles:
+        raise KeyError(f"Unknown traffic profile: {name} (available: {', '.join(sorted(profiles))})")
+    return list(dict.fromkeys(path for group in profiles[name]["requests"] for path in group["paths"]))
+
+
+class Profile:
+    """
+    Lastprofil: Ziel-RPS (0 = so schnell wie möglich), Anzahl paralleler
+    Keep-Alive-Verbindungen, Dauer in Sekunden (0 = endlos) und eine gewichtete
+    Mischung aus Anfragegruppen (Methoden x Pfade).
+    """
+
+    def __init__(self, name, rps=1, concurrency=1, duration=0, requests=()):
+        self.name = name
+        self.rps = float(rps)
+        self.concurrency = max(1, int(concurrency))
+        self.duration = float(duration or 0)
+        self.groups = [(g["methods"], g["paths"]) for g in requests]
+        self.weights = [float(g.get("weight", 1)) for g in requests]
+        if not self.groups:
+            raise ValueError(f"Profile {name} has no requests")
+
+    @classmethod
+    def load(cls, name, path=TRAFFIC_PROFILES_PATH, **overrides):
+        profiles = load_profiles(path)
+        if name not in profiles:
+            raise KeyError(f"Unknown traffic profile: {name} (available: {', '.join(sorted(profiles))})")
+        data = dict(profiles[name])
+        data.update({k: v for k, v in overrides.items() if v is not None})
+        return cls(name, **data)
+
+    def choose(self, rng=random):
+        methods, paths = rng.choices(self.groups, self.weights)[0]
+        return rng.choice(methods), rng.choice(paths)
+
+
+class HTTPConnection:
+    """
+    Minimaler HTTP/1.1-Client über eine asyncio-Verbindung mit Keep-Alive.
+    Liest Antworten mit Content-Length, chunked oder bis Verbindungsende.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        sock = self.writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def request(self, method, path):
+        if self.writer is None:
+            await self._connect()
+        self.writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nUser-Agent: {USER_AGENT}\r\n"
+            f"Content-Length: 0\r\n\r\n".encode("latin-1")
+        )
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by server")
+        status = int(status_line.split()[1])
+        length, chunked, close = None, False, False
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "transfer-encoding":
+                chunked = "chunked" in value
+            elif name == "connection":
+                close = value == "close"
+        if method == "HEAD" or status in (204, 304) or status < 200:
+            pass
+        elif chunked:
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif length is not None:
+            await self.reader.readexactly(length)
+        else:
+            await self.reader.read()
+            close = True
+        if close:
+            self.close()
+        return status
+
+
+class LoadStats:
+    """Zähler, Statuscodes und Latenzen (Intervall + Reservoir-Stichprobe für den ganzen Lauf)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.errors = 0
+        self.status = Counter()
+        self.latencies = []
+        self.interval = []
+        self.interval_count = 0
+        self.interval_started = self.started
+        self._rng = random.Random(0)
+
+    def record(self, status, latency):
+        self.requests += 1
+        if status is None:
+            self.errors += 1
+            self.status["error"] += 1
+            return
+        self.status[str(status)] += 1
+        self.interval_count += 1
+        if len(self.interval) < LATENCY_RESERVOIR:
+            self.interval.append(latency)
+        if len(self.latencies) < LATENCY_RESERVOIR:
+            self.latencies.append(latency)
+        else:
+            i = self._rng.randrange(self.requests)
+            if i < LATENCY_RESERVOIR:
+                self.latencies[i] = latency
+
+    @staticmethod
+    def percentiles(values):
+        if not values:
+            return {"p50": None, "p90": None, "p99": None, "max": None}
+        ordered = sorted(values)
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)  # noqa: E731
+        return {"p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": round(ordered[-1] * 1000, 2)}
+
+    def interval_report(self):
+        now = time.perf_counter()
+        report = {
+            "rps": self.interval_count / max(now - self.interval_started, 1e-9),
+            "latency_ms": self.percentiles(self.interval),
+        }
+        self.interval, self.interval_count, self.interval_started = [], 0, now
+        return report
+
+    def report(self, profile, target):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "profile": profile.name,
+            "target": target,
+            "seconds": round(elapsed, 3),
+            "requests": self.requests,
+            "errors": self.errors,
+            "target_rps": profile.rps,
+            "rps": round(self.requests / max(elapsed, 1e-9), 2),
+            "concurrency": profile.concurrency,
+            "latency_ms": self.percentiles(self.latencies),
+            "status": dict(self.status),
+        }
+
+
+async def _worker(conn, profile, tickets, start, end, stats, stop):
+    rng = random.Random()
+    while not stop():
+        if profile.rps > 0:
+            # Offene Schleife: Anfrage i ist zum Zeitpunkt start + i/rps fällig
+            due = start + next(tickets) / profile.rps
+            if end is not None and due >= end:
+                break
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        if end is not None and time.perf_counter() >= end:
+            break  # zu langsam für die Ziel-RPS: nicht über die Dauer hinaus nachholen
+        method, path = profile.choose(rng)
+        sent = time.perf_counter()
+        try:
+            status = await asyncio.wait_for(conn.request(method, path), REQUEST_TIMEOUT)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError):
+            conn.close()  # Verbindung im unbekannten Zustand nicht weiterverwenden
+            status = None
+        stats.record(status, time.perf_counter() - sent)
+        if status is None:
+            await asyncio.sleep(ERROR_BACKOFF)
+    conn.close()
+
+
+async def _reporter(stats, done, interval, log):
+    while not done.is_set():
+        try:
+            await asyncio.wait_for(done.wait(), interval)
+        except asyncio.TimeoutError:
+            current = stats.interval_report()
+            log(f"{current['rps']:.0f} req/s · p50 {current['latency_ms']['p50']} ms · "
+                f"p99 {current['latency_ms']['p99']} ms · {stats.requests} requests, {stats.errors} errors")
+
+
+async def run_load(profile, target=NGINX_HOST, stop=None, report_interval=REPORT_INTERVAL, log=print):
+    """
+    Erzeugt Last gemäß profile gegen target über profile.concurrency gepoolte
+    Keep-Alive-Verbindungen. stop() (optional) beendet den Lauf vorzeitig.
+    Gibt den Abschlussbericht (erreichte RPS, Latenz-Perzentile, Statuscodes) zurück.
+    """
+    parts = urlsplit(target)
+    host, port = parts.hostname, parts.port or 80
+    stop = stop or (lambda: False)
+    stats = LoadStats()
+    start = time.perf_counter()
+    end = start + profile.duration if profile.duration > 0 else None
+    tickets = itertools.count()
+    done = asyncio.Event()
+    reporter = asyncio.ensure_future(_reporter(stats, done, report_interval, log)) if report_interval else None
+    await asyncio.gather(*(
+        _worker(HTTPConnection(host, port), profile, tickets, start, end, stats, stop)
+        for _ in range(profile.concurrency)
+    ))
+    done.set()
+    if reporter is not None:
+        await reporter
+    return stats.report(profile, target)
+
+
+def run_profile(name, target=NGINX_HOST, stop=None, **overrides):
+    """Synchroner Einstieg für die Traffic-Container."""
+    profile = Profile.load(name, **overrides)
+    return asyncio.run(run_load(profile, target, stop))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Asynchroner HTTP-Lastgenerator")
+    parser.add_argument("--profile", default="normal")
+    parser.add_argument("--target", default=NGINX_HOST)
+    parser.add_argument("--rps", type=float, help="Ziel-Anfragen/s (0 = unbegrenzt)")
+    parser.add_argument("--concurrency", type=int, help="parallele Keep-Alive-Verbindungen")
+    parser.add_argument("--duration", type=float, help="Sekunden (0 = endlos)")
+    parser.add_argument("--profiles", default=TRAFFIC_PROFILES_PATH)
+    parser.add_argument("--report", help="Abschlussbericht zusätzlich als JSON-Datei schreiben")
+    args = parser.parse_args(argv)
+    profile = Profile.load(args.profile, args.profiles, rps=args.rps,
+                           concurrency=args.concurrency, duration=args.duration)
+    try:
+        report = asyncio.run(run_load(profile, args.target))
+    except KeyboardInterrupt:
+        return
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
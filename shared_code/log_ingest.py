@@ -0,0 +1,151 @@
+# shared_code/log_ingest.py
+
+import glob
+import gzip
+import mmap
+import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from log_parser import READ_BLOCK_BYTES, iter_stream_blocks, parse_block
+
+# Unterhalb dieser Größe lohnt sich das Aufteilen auf mehrere Prozesse nicht
+MIN_RANGE_BYTES = 16 << 20
+_ROTATED = re.compile(r"\.(\d+)(\.gz)?$")
+
+
+def _skip_urls(urls):
+    return np.zeros(len(urls), dtype=np.int32)
+
+
+def aggregate_block(data, counter):
+    """
+    Zählt die Tupel (method_num, url, status, size) eines Logblocks in counter.
+    Die URL bleibt ein String: das URL-Vokabular wird erst aus diesen
+    Häufigkeiten gelernt, die Kodierung zu url_num passiert danach.
+    """
+    columns = parse_block(data, url_encoder=_skip_urls)
+    counter.update(zip(
+        columns["method_num"].tolist(), columns["url"].tolist(),
+        columns["status"].tolist(), columns["size"].tolist(),
+    ))
+    return counter
+
+
+def rotated_logs(path):
+    """
+    Rotierte Dateien zu path (access.log.1, access.log.2.gz, ...), älteste zuerst.
+    Die aktive Datei selbst ist nicht enthalten.
+    """
+    found = []
+    for candidate in glob.glob(glob.escape(path) + ".*"):
+        m = _ROTATED.search(candidate[len(path):])
+        if m and candidate[len(path):] == m.group(0):
+            found.append((int(m.group(1)), candidate))
+    return [p for _, p in sorted(found, reverse=True)]
+
+
+def split_ranges(path, parts, end=None, min_bytes=MIN_RANGE_BYTES):
+    """
+    Teilt path[0:end] in höchstens ``parts`` an Zeilenenden ausgerichtete
+    Byte-Bereiche. end wird auf das letzte vollständige Zeilenende gekürzt.
+    Gibt (ranges, end) zurück.
+    """
+    size = os.path.getsize(path) if end is None else end
+    if size == 0:
+        return [], 0
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        end = mm.rfind(b"\n", 0, size) + 1
+        parts = max(1, min(parts, end // min_bytes))
+        bounds = [0]
+        for i in range(1, parts):
+            cut = mm.find(b"\n", max(end * i // parts, bounds[-1]), end)
+            if cut < 0 or cut + 1 >= end:
+                break
+            bounds.append(cut + 1)
+        bounds.append(end)
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1) if bounds[i] < bounds[i + 1]], end
+
+
+def _iter_mmap_blocks(path, start, end, block_bytes=READ_BLOCK_BYTES):
+    """Zeilenausgerichtete Blöcke aus path[start:end], gelesen über mmap (kein read()-Puffer)."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = start
+        while pos < end:
+            stop = min(pos + block_bytes, end)
+            if stop < end:
+                cut = mm.rfind(b"\n", pos, stop)
+                if cut < 0:
+                    # Zeile länger als block_bytes: bis zu ihrem Ende lesen
+                    cut = mm.find(b"\n", stop, end)
+                stop = cut + 1 if cut >= 0 else end
+            yield mm[pos:stop]
+            pos = stop
+
+
+def _task_blocks(task):
+    kind, path, start, end = task
+    if kind == "gz":
+        with gzip.open(path, "rb") as f:
+            yield from iter_stream_blocks(f)
+    elif end is None:
+        with open(path, "rb") as f:
+            yield from iter_stream_blocks(f)
+    else:
+        yield from _iter_mmap_blocks(path, start, end)
+
+
+def _aggregate_task(task):
+    counter = Counter()
+    lines = 0
+    for block in _task_blocks(task):
+        lines += block.count(b"\n")
+        aggregate_block(block, counter)
+    return counter, lines
+
+
+def _build_tasks(path, workers, include_rotated, end=None):
+    tasks = []
+    if include_rotated:
+        for rotated in rotated_logs(path):
+            if rotated.endswith(".gz"):
+                tasks.append(("gz", rotated, 0, None))  # gzip lässt sich nicht aufteilen: ein Stream
+            else:
+                ranges, _ = split_ranges(rotated, workers)
+                tasks.extend(("plain", rotated, s, e) for s, e in ranges)
+    ranges, end = split_ranges(path, workers, end) if os.path.exists(path) else ([], 0)
+    live_tasks = len(ranges)
+    tasks.extend(("plain", path, s, e) for s, e in ranges)
+    return tasks, live_tasks, end
+
+
+def _run(func, tasks, workers):
+    if workers <= 1 or len(tasks) <= 1:
+        return [func(t) for t in tasks]
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        return list(pool.map(func, tasks))  # map() liefert die Ergebnisse in Task-Reihenfolge
+
+
+def aggregate_logs(path, workers=None, include_rotated=False):
+    """
+    Aggregiert die Tupel (method_num, url, status, size) von path (und optional aller rotierten
+    Dateien) parallel in einem Prozess-Pool.
+
+    Gibt (counter, live_state) zurück; live_state beschreibt, bis wohin die aktive
+    Datei gelesen wurde (inode/offset/line_count, passend für
+    LogTailer.restore_state), damit danach inkrementell weitergelesen werden kann.
+    """
+    workers = workers or os.cpu_count() or 1
+    st = os.stat(path)
+    tasks, live_tasks, end = _build_tasks(path, workers, include_rotated, st.st_size)
+    results = _run(_aggregate_task, tasks, workers)
+    counter = Counter()
+    for partial, _ in results:
+        counter.update(partial)
+    live_lines = sum(lines for _, lines in results[len(results) - live_tasks:]) if live_tasks else 0
+    live_state = {"inode": [st.st_dev, st.st_ino], "offset": end, "line_count": live_lines}
+    return counter, live_state
+
@@ -0,0 +1,245 @@
+# shared_code/log_parser.py
+
+import re
+from datetime import datetime
+
+import numpy as np
+
+# Regex-Fallback, entspricht dem bisherigen Muster aus trainer.py/log_utils.py
+LOG_PATTERN = re.compile(
+    r'(?P<ip>\S+) \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<method>\S+) (?P<url>\S+) \S+" (?P<status>\d+) (?P<size>\d+)'
+)
+TIME_FORMAT = "%d/%b/%Y:%H:%M:%S %z"
+
+URL_MAP = {
+    '/': 0,
+    '/index.html': 1,
+    '/about': 2,
+    '/contact': 3,
+    '/help': 4,
+    '/favicon.ico': 5,
+    '/static/logo.png': 6,
+    '/static/style.css': 7
+}
+UNKNOWN_URL = 99
+FEATURE_COLS = ['method_num', 'url_num', 'status', 'size']
+COLUMNS = ['line', 'ip', 'time', 'timestamp', 'method', 'url', 'status', 'size', 'method_num', 'url_num']
+READ_BLOCK_BYTES = 8 << 20
+
+_time_cache = {}
+
+
+def _split_main(line):
+    """
+    Schneller Pfad für das nginx-log_format 'main':
+    $remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent "..." ...
+    nginx escaped '"' im Request als \\x22, daher ist das Splitten an '"' sicher.
+    Gibt None zurück, wenn die Zeile nicht in dieses Schema passt.
+    """
+    parts = line.split('"', 2)
+    if len(parts) < 3:
+        return None
+    head, request, tail = parts
+    lb = head.find('[')
+    rb = head.find(']', lb)
+    if lb < 0 or rb < 0:
+        return None
+    request_parts = request.split(' ')
+    if len(request_parts) != 3:
+        return None
+    tail_parts = tail.split(None, 2)
+    if len(tail_parts) < 2 or not tail_parts[0].isdigit() or not tail_parts[1].isdigit():
+        return None
+    ip = head[:head.find(' ')]
+    if not ip:
+        return None
+    return ip, head[lb + 1:rb], request_parts[0], request_parts[1], tail_parts[0], tail_parts[1]
+
+
+def _split_regex(line):
+    m = LOG_PATTERN.search(line)
+    if not m:
+        return None
+    return m.group('ip', 'time', 'method', 'url', 'status', 'size')
+
+
+def parse_time(value):
+    """$time_local -> Unix-Zeitstempel (gecacht, pro Sekunde gibt es nur einen Wert)."""
+    ts = _time_cache.get(value)
+    if ts is None:
+        try:
+            ts = datetime.strptime(value, TIME_FORMAT).timestamp()
+        except ValueError:
+            ts = np.nan
+        if len(_time_cache) > 100000:
+            _time_cache.clear()
+        _time_cache[value] = ts
+    return ts
+
+
+def encode_urls(urls, url_map=URL_MAP, unknown=UNKNOWN_URL):
+    codes = {u: url_map.get(u, unknown) for u in set(urls)}
+    return np.fromiter(map(codes.__getitem__, urls), dtype=np.int32, count=len(urls))
+
+
+def _int_array(values):
+    return np.fromiter(map(int, values), dtype=np.int64, count=len(values))
+
+
+def _columns_main(text):
+    """
+    Spaltenweiser schneller Pfad für einen ganzen Block im Format 'main'.
+
+    Jede Zeile enthält genau 8 Anführungszeichen ($request, $http_referer,
+    $http_user_agent, $http_x_forwarded_for; nginx escaped '"' als \\x22).
+    Ein split('"') über den ganzen Block liefert die Felder daher an festen
+    Positionen; Kopf, Request und Status/Größe werden anschließend jeweils
+    wieder zusammengefügt und mit einem einzigen split(' ') zerlegt, sodass
+    keine Python-Schleife pro Zeile nötig ist. Gibt None zurück, wenn der Block
+    nicht exakt diesem Schema entspricht (dann greift der zeilenweise Pfad).
+    """
+    n = text.count('\n')
+    tokens = ('\n' + text).split('"')
+    if n == 0 or len(tokens) != 8 * n + 1:
+        return None
+    # "\nIP - USER [TIME TZ] " -> 5 Leerzeichen pro Kopf
+    heads = ''.join(tokens[0:8 * n:8]).split(' ')
+    # "METHOD URL PROTO" -> 2 Leerzeichen pro Request
+    requests = ' '.join(tokens[1::8]).split(' ')
+    # " STATUS SIZE " -> 3 Felder pro Zeile
+    tails = ''.join(tokens[2::8]).split(' ')
+    if len(heads) != 5 * n + 1 or len(requests) != 3 * n or len(tails) != 3 * n + 1:
+        return None
+    methods = requests[0::3]
+    if not all(p.startswith('HTTP/') for p in set(requests[2::3])) \
+            or not all(m.isalpha() for m in set(methods)):
+        return None
+    try:
+        status = _int_array(tails[1::3])
+        size = _int_array(tails[2::3])
+    except ValueError:
+        return None
+    ips = [ip[1:] for ip in heads[0:5 * n:5]]
+    # "[10/Oct/2025:13:55:36" + "+0000]" -> "10/Oct/2025:13:55:36 +0000", pro Sekunde nur
+    # einmal formatiert. map(str.__add__) statt zip(): keine Tupel, kein GC-Aufwand.
+    stamps = list(map(str.__add__, heads[3::5], heads[4::5]))
+    time_strings = {t: f"{t[1:-6]} {t[-6:-1]}" for t in set(stamps)}
+    times = list(map(time_strings.__getitem__, stamps))
+    return ips, times, methods, requests[1::3], status, size
+
+
+def _columns_lines(lines):
+    """Zeilenweiser Pfad (Split-Schema, sonst Regex); liefert auch die Positionen der Treffer."""
+    positions, rows = [], []
+    for i, line in enumerate(lines):
+        fields = _split_main(line) or _split_regex(line)
+        if fields is not None:
+            positions.append(i)
+            rows.append(fields)
+    if not rows:
+        return positions, ([], [], [], [], np.empty(0, np.int64), np.empty(0, np.int64))
+    ips, times, methods, urls, statuses, sizes = map(list, zip(*rows))
+    return positions, (ips, times, methods, urls, _int_array(statuses), _int_array(sizes))
+
+
+def _columns_regex(lines):
+    positions, rows = [], []
+    for i, line in enumerate(lines):
+        fields = _split_regex(line)
+        if fields is not None:
+            positions.append(i)
+            rows.append(fields)
+    if not rows:
+        return positions, ([], [], [], [], np.empty(0, np.int64), np.empty(0, np.int64))
+    ips, times, methods, urls, statuses, sizes = map(list, zip(*rows))
+    return positions, (ips, times, methods, urls, _int_array(statuses), _int_array(sizes))
+
+
+def parse_block(data, start_line=1, url_encoder=encode_urls, fast=True):
+    """
+    Parst einen Block vollständiger Logzeilen (bytes oder str) in Spalten.
+
+    Gibt ein dict mit NumPy-Arrays zurück (siehe COLUMNS): Zeilennummer,
+    ip/time/method/url (object), timestamp (float64, Unix-Zeit), status, size,
+    method_num und url_num. Nicht parsebare Zeilen werden übersprungen, zählen
+    aber bei den Zeilennummern mit. fast=False erzwingt den Regex-Pfad.
+    """
+    if isinstance(data, bytes):
+        data = data.decode("utf-8", errors="replace")
+    if data and not data.endswith('\n'):
+        data += '\n'
+    columns = _columns_main(data) if fast else None
+    if columns is not None:
+        timestamps = {t: parse_time(t) for t in set(columns[1])}
+        if any(ts != ts for ts in timestamps.values()):
+            columns = None  # Felder verrutscht (ungültige Zeit) -> zeilenweise parsen
+    if columns is not None:
+        line_numbers = np.arange(start_line, start_line + len(columns[0]), dtype=np.int64)
+    else:
+        lines = data.split('\n')  # nicht splitlines(): Zeilennummern sollen exakt den '\n' entsprechen
+        lines.pop()
+        positions, columns = _columns_lines(lines) if fast else _columns_regex(lines)
+        line_numbers = np.array(positions, dtype=np.int64) + start_line
+        timestamps = {t: parse_time(t) for t in set(columns[1])}
+    ips, times, methods, urls, status, size = columns
+    method = np.array(methods, dtype=object)
+    return {
+        'line': line_numbers,
+        'ip': np.array(ips, dtype=object),
+        'time': np.array(times, dtype=object),
+        'timestamp': np.fromiter(map(timestamps.__getitem__, times), dtype=np.float64, count=len(times)),
+        'method': method,
+        'url': np.array(urls, dtype=object),
+        'status': status,
+        'size': size,
+        'method_num': (method != 'GET').astype(np.int8),
+        'url_num': url_encoder(urls),
+    }
+
+
+def feature_matrix(columns):
+    """(n, 4)-Matrix method_num, url_num, status, size als float64."""
+    return np.column_stack([columns[c] for c in FEATURE_COLS]).astype(np.float64).reshape(-1, len(FEATURE_COLS))
+
+
+def to_dataframe(columns):
+    """
+    DataFrame im bisherigen Dashboard-Format (Spalte 'Line' vorne,
+    time als Originalstring).
+    """
+    import pandas as pd
+    return pd.DataFrame({
+        'Line': columns['line'],
+        'ip': columns['ip'],
+        'time': columns['time'],
+        'method': columns['method'],
+        'url': columns['url'],
+        'status': columns['status'],
+        'size': columns['size'],
+        'method_num': columns['method_num'],
+        'url_num': columns['url_num'],
+    })
+
+
+def iter_stream_blocks(fileobj, block_bytes=READ_BLOCK_BYTES):
+    """Liest einen Binär-Stream (Datei, gzip, ...) in an Zeilenenden ausgerichteten Blöcken."""
+    rest = b""
+    while True:
+        chunk = fileobj.read(block_bytes)
+        if not chunk:
+            break
+        chunk = rest + chunk
+        cut = chunk.rfind(b"\n")
+        if cut < 0:
+            rest = chunk
+            continue
+        rest = chunk[cut + 1:]
+        yield chunk[:cut + 1]
+    if rest:
+        yield rest
+
+
+def iter_file_blocks(path, block_bytes=READ_BLOCK_BYTES):
+    """Liest eine Datei in an Zeilenenden ausgerichteten Byte-Blöcken."""
+    with open(path, "rb") as f:
+        yield from iter_stream_blocks(f, block_bytes)
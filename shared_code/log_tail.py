@@ -0,0 +1,181 @@
+# shared_code/log_tail.py
+
+import os
+
+READ_CHUNK = 1 << 20  # 1 MiB
+
+
+class LogTailer:
+    """
+    Folgt einer Logdatei inkrementell.
+
+    Merkt sich Byte-Offset, Inode und einen laufenden Zeilenzähler und liest bei
+    jedem Aufruf nur die neu angehängten, vollständigen Zeilen. Truncation
+    (copytruncate) und Logrotate (Inode-Wechsel) werden erkannt; in beiden Fällen
+    wird ``generation`` erhöht und die Zeilenzählung beginnt wieder bei 1.
+    """
+
+    def __init__(self, path, max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.inode = None
+        self.offset = 0
+        self.line_count = 0
+        self.generation = 0
+        self._fh = None
+
+    # --- Datei-Handling ---
+    def _open(self):
+        try:
+            fh = open(self.path, "rb")
+        except FileNotFoundError:
+            return False
+        st = os.fstat(fh.fileno())
+        self._fh = fh
+        self.inode = (st.st_dev, st.st_ino)
+        self.offset = 0
+        self.line_count = 0
+        return True
+
+    def _restart(self):
+        """Setzt Offset und Zeilenzähler zurück (neue Datei oder Truncation)."""
+        self.generation += 1
+        self.offset = 0
+        self.line_count = 0
+
+    def _rotated(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False  # Rotation läuft gerade, neue Datei noch nicht angelegt
+        return (st.st_dev, st.st_ino) != self.inode
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def size(self):
+        if self._fh is None:
+            return 0
+        return os.fstat(self._fh.fileno()).st_size
+
+    def get_state(self):
+        """Serialisierbarer Lesezustand, z.B. zum Persistieren als JSON."""
+        return {
+            "inode": list(self.inode) if self.inode else None,
+            "offset": self.offset,
+            "line_count": self.line_count,
+        }
+
+    def restore_state(self, state):
+        """
+        Setzt den Lesezustand aus get_state() fort. Passt die Inode nicht mehr
+        oder ist die Datei kürzer geworden, wird von vorne gelesen.
+        """
+        if self._fh is None and not self._open():
+            return False
+        inode = tuple(state.get("inode") or ())
+        if inode != self.inode or state.get("offset", 0) > self.size():
+            return False
+        self.offset = state["offset"]
+        self.line_count = state.get("line_count", 0)
+        return True
+
+    def lag(self):
+        """Anzahl noch nicht gelesener Bytes."""
+        return max(self.size() - self.offset, 0)
+
+    # --- Lesen ---
+    def _read_complete(self, size):
+        end = size if self.max_bytes is None else min(size, self.offset + self.max_bytes)
+        if end <= self.offset:
+            return b""
+        self._fh.seek(self.offset)
+        data = self._fh.read(end - self.offset)
+        cut = data.rfind(b"\n")
+        if cut < 0:
+            if self.max_bytes is None or len(data) < self.max_bytes:
+                return b""  # unvollständige Zeile, beim nächsten Aufruf erneut lesen
+            # Zeile länger als max_bytes: als eigene Zeile übernehmen, sonst hängt der Tailer
+            self.offset += len(data)
+            self.line_count += 1
+            return data + b"\n"
+        data = data[:cut + 1]
+        self.offset += len(data)
+        self.line_count += data.count(b"\n")
+        return data
+
+    def read_block(self):
+        """
+        Liest alle seit dem letzten Aufruf angehängten vollständigen Zeilen.
+        Gibt (generation, erste_zeilennummer, bytes) zurück; bytes ist leer,
+        wenn nichts Neues vorliegt.
+        """
+        if self._fh is None:
+            if not self._open():
+                return self.generation, self.line_count + 1, b""
+        size = self.size()
+        if size < self.offset:
+            self._restart()
+        generation, start_line = self.generation, self.line_count + 1
+        data = self._read_complete(size)
+        if not data and self._rotated():
+            # Alte Datei ist vollständig gelesen -> auf die neue Datei wechseln
+            self.close()
+            self.generation += 1
+            if self._open():
+                return self.read_block()
+        return generation, start_line, data
+
+    def seek_tail(self, last_n):
+        """
+        Positioniert den Tailer so, dass der nächste read_block() höchstens die
+        letzten ``last_n`` vollständigen Zeilen liefert (0: nur neue Zeilen).
+        Die übersprungenen Zeilen werden blockweise gezählt, damit die
+        Zeilennummern korrekt bleiben.
+        """
+        if self._fh is None and not self._open():
+            return
+        size = self.size()
+        if size < self.offset:
+            self._restart()
+        fh = self._fh
+        # Ende der letzten vollständigen Zeile suchen und rückwärts last_n Zeilen zählen
+        pos = size
+        end = None
+        found = 0
+        start = self.offset
+        done = False
+        while pos > self.offset and not done:
+            chunk_start = max(pos - READ_CHUNK, self.offset)
+            fh.seek(chunk_start)
+            chunk = fh.read(pos - chunk_start)
+            idx = len(chunk)
+            while True:
+                idx = chunk.rfind(b"\n", 0, idx)
+                if idx < 0:
+                    break
+                if end is None:
+                    end = chunk_start + idx + 1
+                else:
+                    found += 1
+                if found >= last_n:
+                    start = chunk_start + idx + 1
+                    done = True
+                    break
+            pos = chunk_start
+        if end is None:
+            return  # noch keine vollständige Zeile
+        # Übersprungene Zeilen zählen
+        skipped = 0
+        fh.seek(self.offset)
+        remaining = start - self.offset
+        while remaining > 0:
+            chunk = fh.read(min(READ_CHUNK, remaining))
+            if not chunk:
+                break
+            skipped += chunk.count(b"\n")
+            remaining -= len(chunk)
+        self.offset = start
+        self.line_count += skipped
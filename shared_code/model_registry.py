@@ -0,0 +1,260 @@
+# shared_code/model_registry.py
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from numpy_engine import NumpyAutoencoder, UnsupportedModel, sha1_file
+from url_vocab import load_vocab
+
+DEFAULT_THRESHOLD = 0.1
+
+ModelSnapshot = namedtuple(
+    "ModelSnapshot",
+    ["model", "scaler", "threshold", "version", "loaded_at", "load_seconds", "engine", "url_vocab"],
+    defaults=(None,),
+)
+
+
+def file_signature(path):
+    """(mtime_ns, size) einer Datei oder None, falls sie nicht existiert."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def file_digest(*paths):
+    """Kurzer SHA1 über den Inhalt der angegebenen Dateien (dient als Versionskennung)."""
+    h = hashlib.sha1()
+    for path in paths:
+        if path is None:
+            continue
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()[:12]
+
+
+def load_model_file(model_path):
+    """
+    Lädt ein Keras-Modell (.h5) oder ein scikit-learn-Modell (joblib).
+    TensorFlow wird erst hier importiert. Gibt (model, engine) zurück.
+    """
+    try:
+        import tensorflow as tf
+        return tf.keras.models.load_model(model_path, compile=False), "keras"
+    except Exception:
+        pass  # Kein Keras-Modell
+    import joblib
+    model = joblib.load(model_path)
+    if not hasattr(model, "predict"):
+        raise ValueError("Loaded object is not a valid ML model (no 'predict' method)!")
+    return model, "sklearn"
+
+
+def compute_mse(snapshot, X_raw):
+    """Skaliert die Roh-Features und berechnet den Rekonstruktionsfehler pro Zeile."""
+    X_scaled = snapshot.scaler.transform(np.asarray(X_raw, dtype=np.float64))
+    if snapshot.engine == "keras":
+        reconstructions = snapshot.model.predict(X_scaled, verbose=0)
+    else:
+        reconstructions = snapshot.model.predict(X_scaled)
+    return np.mean(np.square(X_scaled - reconstructions), axis=1)
+
+
+def model_features(snapshot, X_raw, urls):
+    """
+    Ersetzt url_num durch die Kodierung des URL-Vokabulars, mit dem das Modell
+    trainiert wurde. Ohne Vokabular bleibt die feste URL_MAP-Kodierung.
+    """
+    if snapshot.url_vocab is None:
+        return X_raw
+    X = np.array(X_raw, dtype=np.float64)
+    X[:, 1] = snapshot.url_vocab.encode(list(urls))
+    return X
+
+
+def load_threshold(threshold_path, default=DEFAULT_THRESHOLD):
+    if not os.path.exists(threshold_path):
+        return default
+    with open(threshold_path) as f:
+        return float(json.load(f)["threshold"])
+
+
+class ModelRegistry:
+    """
+    Prozessweiter Cache für Modell, Scaler, URL-Vokabular und Threshold.
+
+    Liegt ein passender NumPy-Export (weights_path) vor, wird dieser ohne
+    TensorFlow geladen (engine "numpy"). Keras ist nur der Fallback, wenn das
+    .npz fehlt, nicht zur .h5-Datei passt oder die Architektur nicht abbildet.
+
+    Mit versions (ModelVersions) folgt die Registry dem Versionszeiger: geladen
+    werden die Dateien des aktiven, unveränderlichen Versionsverzeichnisses, die
+    Versionskennung ist dessen Name. Ohne veröffentlichten Stand gelten die
+    festen Pfade (ältere Installationen).
+
+    get() prüft per stat() die Signaturen (mtime/size) der Dateien und lädt nur
+    neu, wenn sich etwas geändert hat. Ändert sich nur der Threshold, wird nur
+    die JSON-Datei neu gelesen. Ein neuer Stand wird vollständig geladen und
+    dann als ein einziger ModelSnapshot ausgetauscht, Leser sehen also nie eine
+    halbe Kombination. Schlägt das Laden fehl (z.B. weil der Trainer die Datei
+    gerade schreibt), bleibt der bisherige Snapshot aktiv und last_error gesetzt.
+    """
+
+    def __init__(self, model_path, scaler_path, threshold_path, weights_path=None,
+                 default_threshold=DEFAULT_THRESHOLD, vocab_path=None, versions=None):
+        self._fixed_paths = (model_path, scaler_path, weights_path, vocab_path)
+        self.model_path, self.scaler_path, self.weights_path, self.vocab_path = self._fixed_paths
+        self.versions = versions
+        self.version_id = None
+        self._pointer_sig = None
+        self.threshold_path = threshold_path
+        self.default_threshold = default_threshold
+        self.last_error = None
+        self.reloads = 0
+        self._snapshot = None
+        self._model_sig = None
+        self._threshold_sig = None
+        self._lock = threading.Lock()
+
+    def _resolve_version(self):
+        """Folgt dem Versionszeiger (nur bei geänderter Signatur neu gelesen)."""
+        if self.versions is None:
+            return
+        pointer_sig = file_signature(self.versions.pointer_path)
+        if pointer_sig == self._pointer_sig:
+            return
+        self._pointer_sig = pointer_sig
+        self.version_id = self.versions.current()
+        if self.version_id is None:
+            self.model_path, self.scaler_path, self.weights_path, self.vocab_path = self._fixed_paths
+        else:
+            self.model_path, self.scaler_path, self.weights_path, self.vocab_path = (
+                self.versions.path(self.version_id, name) for name in ("model", "scaler", "weights", "vocab"))
+
+    def _threshold(self):
+        """
+        Threshold aus threshold_path. Wurde er für einen anderen Stand geschrieben
+        (Feld "version", z.B. direkt nach dem Umschalten), gilt der zusammen mit
+        dem aktiven Stand veröffentlichte Threshold.
+        """
+        data = {}
+        if os.path.exists(self.threshold_path):
+            with open(self.threshold_path) as f:
+                data = json.load(f)
+        if self.version_id and data.get("version") not in (None, self.version_id):
+            own_path = self.versions.path(self.version_id, "threshold")
+            if os.path.exists(own_path):
+                return load_threshold(own_path, self.default_threshold)
+        return float(data["threshold"]) if data else self.default_threshold
+
+    def _load_numpy(self):
+        """NumPy-Export laden, falls vorhanden und zur aktuellen .h5-Datei passend."""
+        if not self.weights_path or not os.path.exists(self.weights_path):
+            return None
+        try:
+            model = NumpyAutoencoder.load(self.weights_path)
+        except UnsupportedModel:
+            return None
+        if model.source_sha1 and os.path.exists(self.model_path) \
+                and model.source_sha1 != sha1_file(self.model_path):
+            return None  # veralteter Export (z.B. Referenzmodell ohne .npz kopiert)
+        return model
+
+    def _load(self):
+        start = time.perf_counter()
+        numpy_model = self._load_numpy()
+        vocab_path = self.vocab_path if self.vocab_path and os.path.exists(self.vocab_path) else None
+        if numpy_model is None:
+            for path in (self.model_path, self.scaler_path):
+                if not os.path.exists(path):
+                    raise FileNotFoundError(f"Model file not found at {path}!")
+        if self.version_id is not None:
+            version = self.version_id  # Versionsverzeichnisse sind unveränderlich
+        elif numpy_model is not None:
+            version = file_digest(self.weights_path, vocab_path)
+        else:
+            version = file_digest(self.model_path, self.scaler_path, vocab_path)
+        if self._snapshot is not None and version == self._snapshot.version:
+            # Nur mtime geändert (z.B. touch), Inhalt identisch
+            return self._snapshot
+        if numpy_model is not None:
+            model, scaler, engine = numpy_model, numpy_model.scaler, "numpy"
+        else:
+            import joblib
+            model, engine = load_model_file(self.model_path)
+            scaler = joblib.load(self.scaler_path)
+        url_vocab = load_vocab(vocab_path)
+        threshold = self._threshold()
+        self.reloads += 1
+        return ModelSnapshot(
+            model=model,
+            scaler=scaler,
+            threshold=threshold,
+            version=version,
+            loaded_at=time.time(),
+            load_seconds=time.perf_counter() - start,
+            engine=engine,
+            url_vocab=url_vocab,
+        )
+
+    def get(self):
+        """
+        Liefert den aktuellen ModelSnapshot (oder None, wenn noch kein Modell
+        geladen werden konnte).
+        """
+        self._resolve_version()
+        model_sig = (
+            self.version_id,
+            file_signature(self.model_path),
+            file_signature(self.scaler_path),
+            file_signature(self.weights_path) if self.weights_path else None,
+            file_signature(self.vocab_path) if self.vocab_path else None,
+        )
+        threshold_sig = file_signature(self.threshold_path)
+        if model_sig == self._model_sig and threshold_sig == self._threshold_sig:
+            return self._snapshot
+        with self._lock:
+            try:
+                if model_sig != self._model_sig:
+                    snapshot = self._load()
+                    self._model_sig = model_sig
+                    self._threshold_sig = threshold_sig
+                    if snapshot is self._snapshot:
+                        snapshot = snapshot._replace(threshold=self._threshold())
+                    self._snapshot = snapshot
+                elif threshold_sig != self._threshold_sig:
+                    threshold = self._threshold()
+                    self._threshold_sig = threshold_sig
+                    if self._snapshot is not None:
+                        self._snapshot = self._snapshot._replace(threshold=threshold)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+        return self._snapshot
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(model_path, scaler_path, threshold_path, weights_path=None, vocab_path=None,
+                 versions=None):
+    """Liefert die prozessweite Registry für diese Pfade (wird beim ersten Aufruf angelegt)."""
+    key = (model_path, scaler_path, threshold_path, weights_path, vocab_path,
+           (versions.root, versions.pointer_path) if versions else None)
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = ModelRegistry(model_path, scaler_path, threshold_path, weights_path,
+                                     vocab_path=vocab_path, versions=versions)
+            _registries[key] = registry
+    return registry
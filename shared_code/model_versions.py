@@ -0,0 +1,133 @@
+# shared_code/model_versions.py
+
+import os
+import shutil
+import time
+
+from score_store import read_json, write_json_atomic
+
+# Jeder Trainingsstand landet unveränderlich in VERSIONS_DIR/<id>/
+FILES = {
+    "model": "model.h5",
+    "scaler": "scaler.pkl",
+    "weights": "weights.npz",
+    "vocab": "url_vocab.json",
+    "threshold": "threshold.json",
+}
+REFERENCE_VERSION = "reference"
+KEEP_VERSIONS = int(os.environ.get("MODEL_KEEP_VERSIONS", 5))
+STAGING_PREFIX = ".staging-"
+STALE_STAGING_SECONDS = 3600
+
+
+def new_version_id():
+    """Sortierbare, eindeutige Kennung: Zeitstempel + Zufallsanteil."""
+    return time.strftime("%Y%m%d-%H%M%S") + "-" + os.urandom(3).hex()
+
+
+class ModelVersions:
+    """
+    Versionierte Modellstände mit atomarem Umschalten.
+
+    Der Trainer schreibt alle Dateien eines Stands (Modell, Scaler, NumPy-Export,
+    URL-Vokabular, Threshold) in ein privates Staging-Verzeichnis, benennt es in
+    VERSIONS_DIR/<id> um und schaltet dann den Zeiger (pointer_path, JSON) per
+    os.replace um. Leser folgen nur dem Zeiger und öffnen ausschließlich fertige,
+    nie mehr veränderte Verzeichnisse; sie sehen also nie eine halbe Datei oder
+    eine gemischte Kombination. Rollback ist ein erneutes Umschalten des Zeigers.
+    """
+
+    def __init__(self, root, pointer_path):
+        self.root = root
+        self.pointer_path = pointer_path
+
+    def path(self, version, name):
+        return os.path.join(self.root, version, FILES[name])
+
+    def exists(self, version):
+        return bool(version) and os.path.isdir(os.path.join(self.root, version))
+
+    def pointer(self):
+        return read_json(self.pointer_path, {}) or {}
+
+    def current(self):
+        """Kennung des aktiven Stands oder None (noch nichts veröffentlicht)."""
+        version = self.pointer().get("version")
+        return version if self.exists(version) else None
+
+    def versions(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(v for v in os.listdir(self.root)
+                      if not v.startswith(".") and os.path.isdir(os.path.join(self.root, v)))
+
+    def stage(self):
+        """Legt ein Staging-Verzeichnis an; gibt (version, verzeichnis) zurück."""
+        version = new_version_id()
+        staging = os.path.join(self.root, STAGING_PREFIX + version)
+        os.makedirs(staging)
+        return version, staging
+
+    def commit(self, version, staging):
+        """Macht ein vollständig geschriebenes Staging-Verzeichnis zur Version (rename)."""
+        for name in os.listdir(staging):
+            with open(os.path.join(staging, name), "rb") as f:
+                os.fsync(f.fileno())
+        os.rename(staging, os.path.join(self.root, version))
+        return version
+
+    def publish(self, version):
+        """Schaltet den Zeiger atomar auf version um."""
+        if not self.exists(version):
+            raise FileNotFoundError(f"Model version {version} not found")
+        current = self.pointer().get("version")
+        write_json_atomic(self.pointer_path, {
+            "version": version,
+            "previous": current if current != version else self.pointer().get("previous"),
+            "published": time.time(),
+        })
+        return version
+
+    def rollback(self):
+        """Zurück auf den zuvor aktiven Stand; gibt dessen Kennung zurück (oder None)."""
+        previous = self.pointer().get("previous")
+        if not self.exists(previous):
+            return None
+        return self.publish(previous)
+
+    def import_files(self, files, version=None):
+        """
+        Übernimmt vorhandene Einzeldateien ({name: pfad}, siehe FILES) als neue
+        Version, z.B. das Referenzmodell. Fehlende Pfade werden übersprungen.
+        """
+        staged, staging = self.stage()
+        try:
+            for name, source in files.items():
+                if source and os.path.exists(source):
+                    shutil.copyfile(source, os.path.join(staging, FILES[name]))
+            return self.commit(version or staged, staging)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    def prune(self, keep=KEEP_VERSIONS):
+        """
+        Löscht alte Versionen; behalten werden die neuesten keep, der aktive und
+        der vorherige Stand sowie die Referenz. Verwaiste Staging-Verzeichnisse
+        (abgebrochenes Training) werden nach STALE_STAGING_SECONDS entfernt.
+        """
+        pointer = self.pointer()
+        protected = {pointer.get("version"), pointer.get("previous"), REFERENCE_VERSION}
+        removed = 0
+        # Die Referenz sortiert hinter die Zeitstempel-Kennungen und belegte sonst einen der keep-Plätze
+        versions = [v for v in self.versions() if v != REFERENCE_VERSION]
+        for version in versions[:-keep] if keep > 0 else versions:
+            if version not in protected:
+                shutil.rmtree(os.path.join(self.root, version), ignore_errors=True)
+                removed += 1
+        now = time.time()
+        for name in os.listdir(self.root) if os.path.isdir(self.root) else ():
+            path = os.path.join(self.root, name)
+            if name.startswith(STAGING_PREFIX) and now - os.path.getmtime(path) > STALE_STAGING_SECONDS:
+                shutil.rmtree(path, ignore_errors=True)
+        return removed
@@ -0,0 +1,140 @@
+# shared_code/numpy_engine.py
+
+import hashlib
+import os
+
+import numpy as np
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0.0),
+    "sigmoid": lambda x: 1.0 / (1.0 + np.exp(-x)),
+    "tanh": np.tanh,
+}
+
+
+class UnsupportedModel(ValueError):
+    """Das Modell enthält Layer/Aktivierungen, die die NumPy-Engine nicht abbildet."""
+
+
+def sha1_file(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _scaler_affine(scaler):
+    """Bildet MinMaxScaler/StandardScaler auf X * mul + add ab."""
+    if hasattr(scaler, "min_") and hasattr(scaler, "scale_"):
+        return np.asarray(scaler.scale_, dtype=np.float64), np.asarray(scaler.min_, dtype=np.float64)
+    if hasattr(scaler, "mean_") and hasattr(scaler, "scale_"):
+        mul = 1.0 / np.asarray(scaler.scale_, dtype=np.float64)
+        return mul, -np.asarray(scaler.mean_, dtype=np.float64) * mul
+    raise UnsupportedModel(f"Unsupported scaler type: {type(scaler).__name__}")
+
+
+def extract_dense_layers(model):
+    """
+    Liest Gewichte und Aktivierungen aller Dense-Layer eines Keras-Modells.
+    Wirft UnsupportedModel für alles, was kein reiner Dense-Stack ist.
+    """
+    layers = []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind == "InputLayer":
+            continue
+        if kind != "Dense":
+            raise UnsupportedModel(f"Unsupported layer type: {kind}")
+        activation = getattr(layer.activation, "__name__", str(layer.activation))
+        if activation not in ACTIVATIONS:
+            raise UnsupportedModel(f"Unsupported activation: {activation}")
+        weights = layer.get_weights()
+        kernel = weights[0]
+        bias = weights[1] if len(weights) > 1 else np.zeros(kernel.shape[1], dtype=kernel.dtype)
+        layers.append((kernel, bias, activation))
+    if not layers:
+        raise UnsupportedModel("Model has no Dense layers")
+    return layers
+
+
+def export_autoencoder(model, scaler, path, source_path=None):
+    """
+    Exportiert Gewichte und Scaler-Parameter als kompaktes .npz.
+    source_path (die gespeicherte .h5-Datei) wird als SHA1 mitgeschrieben, damit
+    Leser ein veraltetes .npz erkennen. Gibt False zurück (und entfernt ein altes
+    Export-File), wenn die Architektur nicht unterstützt wird.
+    """
+    try:
+        layers = extract_dense_layers(model)
+        mul, add = _scaler_affine(scaler)
+    except UnsupportedModel as e:
+        print(f"NumPy-Export übersprungen: {e}")
+        if os.path.exists(path):
+            os.remove(path)
+        return False
+    arrays = {
+        "scaler_mul": mul,
+        "scaler_add": add,
+        "activations": np.array([a for _, _, a in layers]),
+        "source_sha1": np.array(sha1_file(source_path) if source_path else ""),
+    }
+    for i, (kernel, bias, _) in enumerate(layers):
+        arrays[f"kernel_{i}"] = kernel
+        arrays[f"bias_{i}"] = bias
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+    return True
+
+
+class AffineScaler:
+    """Minimaler Ersatz für den sklearn-Scaler: transform(X) = X * mul + add."""
+
+    def __init__(self, mul, add):
+        self.mul = mul
+        self.add = add
+
+    def transform(self, X):
+        return np.asarray(X, dtype=np.float64) * self.mul + self.add
+
+
+class NumpyAutoencoder:
+    """
+    Vektorisierter Forward-Pass eines Dense-Autoencoders in reinem NumPy.
+    Bietet predict() wie ein Keras-Modell und mse() für den Rekonstruktionsfehler.
+    """
+
+    def __init__(self, layers, scaler, source_sha1=""):
+        self.layers = layers
+        self.scaler = scaler
+        self.source_sha1 = source_sha1
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            activations = [str(a) for a in data["activations"]]
+            layers = []
+            for i, activation in enumerate(activations):
+                if activation not in ACTIVATIONS:
+                    raise UnsupportedModel(f"Unsupported activation: {activation}")
+                layers.append((
+                    data[f"kernel_{i}"].astype(np.float64),
+                    data[f"bias_{i}"].astype(np.float64),
+                    ACTIVATIONS[activation],
+                ))
+            scaler = AffineScaler(data["scaler_mul"], data["scaler_add"])
+            source_sha1 = str(data["source_sha1"])
+        return cls(layers, scaler, source_sha1)
+
+    def predict(self, X_scaled):
+        out = np.asarray(X_scaled, dtype=np.float64)
+        for kernel, bias, activation in self.layers:
+            out = activation(out @ kernel + bias)
+        return out
+
+    def mse(self, X_raw):
+        X_scaled = self.scaler.transform(X_raw)
+        return np.mean(np.square(X_scaled - self.predict(X_scaled)), axis=1)
@@ -0,0 +1,90 @@
+# shared_code/pattern_filter.py
+
+import json
+import re
+import threading
+
+import numpy as np
+
+from model_registry import file_signature
+
+
+class CompiledPatterns:
+    """
+    Kompilierte Form von malicious_patterns.json: exakte URLs als Hash-Set,
+    alle Regex-Einträge als eine einzige Alternation (ein Durchlauf pro URL).
+    Regex-Einträge müssen die ganze URL treffen (fullmatch); exakte URLs
+    treffen auch mit angehängtem Query-String.
+    """
+
+    def __init__(self, urls=(), regexes=()):
+        self.urls = frozenset(urls)
+        self.regex_count = len(regexes)
+        self.regex = re.compile("|".join(f"(?:{r})" for r in regexes)) if regexes else None
+
+    def is_known_bad(self, url):
+        if url in self.urls or url.split("?", 1)[0] in self.urls:
+            return True
+        return self.regex is not None and self.regex.fullmatch(url) is not None
+
+    def match(self, urls):
+        """Bool-Maske für eine Folge von URLs; jede verschiedene URL wird nur einmal geprüft."""
+        hits = {u: self.is_known_bad(u) for u in set(urls)}
+        return np.fromiter(map(hits.__getitem__, urls), dtype=bool, count=len(urls))
+
+
+def load_patterns(path):
+    with open(path) as f:
+        data = json.load(f)
+    regexes = list(data.get("regex", []))
+    for r in regexes:
+        re.compile(r)  # ungültigen Eintrag mit eigener Fehlermeldung melden
+    return CompiledPatterns(data.get("urls", []), regexes)
+
+
+class PatternFilter:
+    """
+    Vorfilter vor dem ML-Scoring für bekannte Angriffs-URLs.
+
+    Wie bei der ModelRegistry wird die JSON-Datei per stat() überwacht und bei
+    Änderungen neu kompiliert; ist sie fehlerhaft, bleiben die bisherigen
+    Muster aktiv und last_error ist gesetzt. ``hits`` zählt die Anfragen, die
+    ohne Modell als Angriff klassifiziert wurden.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.patterns = CompiledPatterns()
+        self.last_error = None
+        self.hits = 0
+        self.checked = 0
+        self._sig = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        sig = file_signature(self.path)
+        if sig != self._sig:
+            with self._lock:
+                try:
+                    self.patterns = load_patterns(self.path) if sig else CompiledPatterns()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = e
+                self._sig = sig
+        return self.patterns
+
+    def match(self, urls):
+        mask = self.get().match(urls)
+        self.checked += len(mask)
+        self.hits += int(mask.sum())
+        return mask
+
+    def stats(self):
+        patterns = self.patterns
+        return {
+            "urls": len(patterns.urls),
+            "regexes": patterns.regex_count,
+            "checked": self.checked,
+            "short_circuited": self.hits,
+            "error": str(self.last_error) if self.last_error else None,
+        }
@@ -0,0 +1,97 @@
+# shared_code/quantile_sketch.py
+
+import math
+
+import numpy as np
+
+
+class QuantileSketch:
+    """
+    Streaming-Quantile nach dem DDSketch-Verfahren: Werte landen in
+    logarithmischen Buckets, jedes Quantil hat damit höchstens
+    relative_accuracy relativen Fehler. Gewichte (z.B. Häufigkeiten
+    deduplizierter Vektoren) werden direkt unterstützt, Sketches lassen sich
+    mergen und als JSON-kompatibles dict speichern. Die Anzahl der Buckets ist
+    begrenzt; bei Überlauf werden die kleinsten zusammengelegt, sodass die
+    hohen Quantile (Threshold) genau bleiben.
+    """
+
+    def __init__(self, relative_accuracy=0.01, min_value=1e-12, max_bins=2048):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0.0
+        self.count = 0.0
+
+    def add(self, values, weights=None):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=np.float64).ravel()
+        valid = np.isfinite(values)
+        values, weights = values[valid], weights[valid]
+        if len(values) == 0:
+            return self
+        small = values <= self.min_value
+        self.zero_count += float(weights[small].sum())
+        self.count += float(weights.sum())
+        keys = np.ceil(np.log(values[~small]) / self._log_gamma).astype(np.int64)
+        if len(keys):
+            unique, inverse = np.unique(keys, return_inverse=True)
+            sums = np.bincount(inverse, weights=weights[~small])
+            for key, weight in zip(unique.tolist(), sums.tolist()):
+                self.bins[key] = self.bins.get(key, 0.0) + weight
+            self._collapse()
+        return self
+
+    def _collapse(self):
+        if len(self.bins) <= self.max_bins:
+            return
+        keys = sorted(self.bins)
+        overflow = keys[:len(keys) - self.max_bins + 1]
+        self.bins[overflow[-1]] = sum(self.bins.pop(k) for k in overflow[:-1]) + self.bins[overflow[-1]]
+
+    def merge(self, other):
+        for key, weight in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0.0) + weight
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self._collapse()
+        return self
+
+    def _value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        """Schätzwert für das q-Quantil (0..1) oder None bei leerem Sketch."""
+        if self.count <= 0:
+            return None
+        rank = q * self.count
+        cumulative = self.zero_count
+        if rank <= cumulative:
+            return 0.0
+        key = None
+        for key in sorted(self.bins):
+            cumulative += self.bins[key]
+            if cumulative >= rank:
+                return self._value(key)
+        return self._value(key) if key is not None else 0.0
+
+    def to_dict(self):
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "min_value": self.min_value,
+            "max_bins": self.max_bins,
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "bins": {str(k): v for k, v in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["relative_accuracy"], data["min_value"], data["max_bins"])
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.bins = {int(k): v for k, v in data["bins"].items()}
+        return sketch
@@ -0,0 +1,243 @@
+# shared_code/replay.py
+
+import argparse
+import gzip
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from config import (
+    MODEL_PATH, SCALER_PATH, THRESHOLD_PATH, WEIGHTS_PATH, URL_VOCAB_PATH,
+    MODEL_VERSIONS_DIR, MODEL_CURRENT_PATH, MALICIOUS_PATTERNS_PATH, TRAFFIC_PROFILES_PATH,
+)
+from ip_windows import IPWindowAggregator
+from loadgen import load_profiles, profile_paths
+from log_parser import READ_BLOCK_BYTES, feature_matrix, iter_stream_blocks, parse_block
+from model_registry import ModelRegistry, model_features
+from model_versions import ModelVersions
+from pattern_filter import PatternFilter
+from score_cache import ScoreCache
+from synthetic_log import write_log
+
+PACED_BLOCK_BYTES = 256 << 10  # kleinere Blöcke, damit die Zeitraffer-Wiedergabe gleichmäßig läuft
+UNLABELLED, NORMAL, MALICIOUS = -1, 0, 1
+
+
+class Labeller:
+    """
+    Label pro Logzeile aus den URL-Mengen der Lastprofile: Pfade des Profils
+    attack (traffic_malicious) sind bösartig, die des Profils normal
+    (traffic_normal) gutartig. Andere URLs bleiben ohne Label und gehen nicht
+    in Precision/Recall ein.
+    """
+
+    def __init__(self, normal_urls, malicious_urls):
+        self.labels = {url: NORMAL for url in normal_urls}
+        self.labels.update({url: MALICIOUS for url in malicious_urls})
+
+    @classmethod
+    def from_profiles(cls, path=TRAFFIC_PROFILES_PATH, normal="normal", attack="attack"):
+        profiles = load_profiles(path)
+        return cls(profile_paths(profiles, normal), profile_paths(profiles, attack))
+
+    def __call__(self, urls):
+        codes = {u: self.labels.get(u, UNLABELLED) for u in set(urls)}
+        return np.fromiter(map(codes.__getitem__, urls), dtype=np.int8, count=len(urls))
+
+
+class Confusion:
+    def __init__(self):
+        self.tp = self.fp = self.tn = self.fn = 0
+
+    def add(self, predicted, labels):
+        labelled = labels != UNLABELLED
+        predicted, actual = predicted[labelled], labels[labelled] == MALICIOUS
+        self.tp += int(np.sum(predicted & actual))
+        self.fp += int(np.sum(predicted & ~actual))
+        self.fn += int(np.sum(~predicted & actual))
+        self.tn += int(np.sum(~predicted & ~actual))
+
+    def report(self):
+        precision = self.tp / (self.tp + self.fp) if self.tp + self.fp else 0.0
+        recall = self.tp / (self.tp + self.fn) if self.tp + self.fn else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        return {"tp": self.tp, "fp": self.fp, "tn": self.tn, "fn": self.fn,
+                "precision": round(precision, 6), "recall": round(recall, 6), "f1": round(f1, 6)}
+
+
+def open_log(path):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def load_snapshot(versions, version):
+    """ModelSnapshot einer Version (oder der festen Pfade bei version None), ohne den Zeiger zu ändern."""
+    if version is None:
+        registry = ModelRegistry(MODEL_PATH, SCALER_PATH, THRESHOLD_PATH, WEIGHTS_PATH, vocab_path=URL_VOCAB_PATH)
+    else:
+        paths = [versions.path(version, name) for name in ("model", "scaler", "threshold", "weights", "vocab")]
+        registry = ModelRegistry(*paths[:4], vocab_path=paths[4])
+    snapshot = registry.get()
+    if snapshot is None:
+        raise RuntimeError(f"Model version {version} could not be loaded: {registry.last_error}")
+    return snapshot
+
+
+def replay(task):
+    """
+    Spielt die Logdatei einmal durch den Scoring-Pfad des Scorers (Vorfilter,
+    MSE mit Cache) für eine Modellversion und wertet alle Thresholds im selben
+    Durchlauf aus; optional die IP-Fenster als eigene Auswertung. speed > 0: Wiedergabe im Zeitraffer
+    (Logzeit / speed), sonst so schnell wie möglich. Läuft in einem eigenen
+    Prozess, damit Spitzenspeicher und Durchsatz pro Version getrennt sind.
+    """
+    log_path, root, pointer, version, thresholds, options = task
+    started = time.perf_counter()
+    snapshot = load_snapshot(ModelVersions(root, pointer), version)
+    labeller = Labeller.from_profiles(options["profiles"])
+    prefilter = PatternFilter(options["patterns"]) if options["patterns"] else None
+    ip_windows = IPWindowAggregator() if options["ip_windows"] else None
+    cache = ScoreCache()
+    thresholds = [("model", snapshot.threshold)] + [(str(t), float(t)) for t in thresholds]
+    confusion = {name: Confusion() for name, _ in thresholds}
+    # IP-Fenster bewerten ganze Clients, nicht URLs: eigene Auswertung statt ODER pro Zeile
+    ip_confusion = Confusion() if ip_windows is not None else None
+    lines = labelled = 0
+    log_start = wall_start = None
+    block_bytes = PACED_BLOCK_BYTES if options["speed"] > 0 else READ_BLOCK_BYTES
+    with open_log(log_path) as f:
+        for data in iter_stream_blocks(f, block_bytes):
+            columns = parse_block(data, lines + 1)
+            urls = columns["url"]
+            n = len(urls)
+            if n == 0:
+                continue
+            if options["speed"] > 0:
+                if log_start is None:
+                    log_start, wall_start = float(np.nanmin(columns["timestamp"])), time.perf_counter()
+                delay = (float(np.nanmax(columns["timestamp"])) - log_start) / options["speed"] \
+                    - (time.perf_counter() - wall_start)
+                if delay > 0:
+                    time.sleep(delay)
+            X = model_features(snapshot, feature_matrix(columns), urls)
+            known = prefilter.match(urls) if prefilter else np.zeros(n, dtype=bool)
+            mse = np.full(n, np.inf)
+            if not known.all():
+                mse[~known] = cache.mse(snapshot, X[~known])
+            labels = labeller(urls)
+            if ip_windows is not None:
+                features = ip_windows.update(columns["ip"], columns["timestamp"], columns["status"], urls)
+                ip_confusion.add(ip_windows.suspicious(features), labels)
+            for name, threshold in thresholds:
+                confusion[name].add(known | (mse > threshold), labels)
+            lines += n
+            labelled += int(np.sum(labels != UNLABELLED))
+    seconds = time.perf_counter() - started
+    return {
+        "version": version or "files",
+        "engine": snapshot.engine,
+        "lines": lines,
+        "labelled": labelled,
+        "seconds": round(seconds, 3),
+        "lines_per_sec": round(lines / max(seconds, 1e-9), 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "score_cache_hit_rate": round(cache.stats()["hit_rate"], 4),
+        "thresholds": {name: {"threshold": threshold, **confusion[name].report()}
+                       for name, threshold in thresholds},
+        "ip_windows": ip_confusion.report() if ip_confusion is not None else None,
+    }
+
+
+def select_versions(versions, selection):
+    """"current", "all" oder kommagetrennte Kennungen; ohne veröffentlichte Versionen die festen Pfade."""
+    if selection == "all":
+        return versions.versions() or [None]
+    if selection == "current":
+        return [versions.current()]
+    return [v.strip() for v in selection.split(",") if v.strip()]
+
+
+def print_report(results):
+    print(f"{'version':<26} {'threshold':>12} {'precision':>9} {'recall':>7} {'f1':>7} "
+          f"{'lines/s':>12} {'peak MB':>8}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['version']:<26} error: {result['error']}")
+            continue
+        for name, m in result["thresholds"].items():
+            label = f"{m['threshold']:.4g}" + (" (model)" if name == "model" else "")
+            print(f"{result['version']:<26} {label:>12} {m['precision']:>9.3f} {m['recall']:>7.3f} "
+                  f"{m['f1']:>7.3f} {result['lines_per_sec']:>12,.0f} {result['peak_rss_mb']:>8.0f}")
+        m = result.get("ip_windows")
+        if m:
+            print(f"{result['version']:<26} {'ip windows':>12} {m['precision']:>9.3f} {m['recall']:>7.3f} "
+                  f"{m['f1']:>7.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline-Replay eines gelabelten Access-Logs durch den Scoring-Pfad")
+    parser.add_argument("log", nargs="?", help="aufgezeichnetes Access-Log (auch .gz)")
+    parser.add_argument("--synthetic", type=int, default=0, help="stattdessen N synthetische Zeilen erzeugen")
+    parser.add_argument("--malicious", type=float, default=0.1, help="Anteil bösartiger Zeilen bei --synthetic")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--versions", default="all", help='"all", "current" oder Kennungen, kommagetrennt')
+    parser.add_argument("--models-dir", default=MODEL_VERSIONS_DIR)
+    parser.add_argument("--current-path", default=MODEL_CURRENT_PATH, help="Versionszeiger (für --versions current)")
+    parser.add_argument("--thresholds", default="", help="zusätzliche Thresholds, kommagetrennt")
+    parser.add_argument("--speed", type=float, default=0, help="Zeitraffer-Faktor gegenüber der Logzeit (0 = max.)")
+    parser.add_argument("--no-prefilter", action="store_true", help="nur das Modell bewerten")
+    parser.add_argument("--ip-windows", action="store_true", help="IP-Fenster des Scorers getrennt bewerten")
+    parser.add_argument("--profiles", default=TRAFFIC_PROFILES_PATH)
+    parser.add_argument("--workers", type=int, default=0, help="Versionen parallel (0 = CPUs)")
+    parser.add_argument("--output", help="Ergebnis als JSON schreiben")
+    args = parser.parse_args(argv)
+    if not args.log and not args.synthetic:
+        parser.error("log path or --synthetic N required")
+
+    workdir = None
+    log_path = args.log
+    if args.synthetic:
+        workdir = tempfile.mkdtemp(prefix="replay-")
+        log_path = os.path.join(workdir, "access.log")
+        write_log(log_path, args.synthetic, args.malicious, args.seed, profiles=args.profiles)
+    pointer = args.current_path
+    selected = select_versions(ModelVersions(args.models_dir, pointer), args.versions)
+    options = {
+        "speed": args.speed,
+        "patterns": None if args.no_prefilter else MALICIOUS_PATTERNS_PATH,
+        "ip_windows": args.ip_windows,
+        "profiles": args.profiles,
+    }
+    thresholds = [t for t in args.thresholds.split(",") if t.strip()]
+    tasks = [(log_path, args.models_dir, pointer, v, thresholds, options) for v in selected]
+    workers = min(len(tasks), args.workers or os.cpu_count() or 1)
+    results = []
+    try:
+        # "spawn": jede Version startet mit leerem Speicher (ehrlicher Spitzenwert)
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(replay, task) for task in tasks]
+            for version, future in zip(selected, futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append({"version": version or "files", "error": str(e)})
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"log": args.log or f"synthetic:{args.synthetic}", "speed": args.speed,
+                       "prefilter": not args.no_prefilter, "ip_windows": args.ip_windows,
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+# shared_code/rule_store.py
+
+import fcntl
+import ipaddress
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+
+from model_registry import file_signature
+
+# Ab so vielen Regeln wird statt einzelner "location ="-Blöcke eine nginx-map
+# (Hash-Lookup, konstante Zeit pro Request) erzeugt.
+MAP_THRESHOLD = int(os.environ.get("RULES_MAP_THRESHOLD", 64))
+MAP_VARIABLE = "$custom_rule_block"
+IP_VARIABLE = "$custom_ip_block"
+# Regeln ohne Treffer werden nach RULE_TTL_SECONDS entfernt (0 = nie)
+RULE_TTL_SECONDS = float(os.environ.get("RULE_TTL_SECONDS", 24 * 3600))
+# Ab so vielen exakten Pfaden mit gemeinsamem Stamm wird zusammengefasst
+RULE_CONSOLIDATE_MIN = int(os.environ.get("RULE_CONSOLIDATE_MIN", 3))
+# Präfix-Regeln ('/wp/a', '/wp/b', ... -> '/wp/') blockieren auch ungesehene Pfade
+# unter dem Elternpfad und sind daher nur auf Wunsch aktiv (1 = an)
+RULE_CONSOLIDATE_PREFIX = os.environ.get("RULE_CONSOLIDATE_PREFIX", "0") == "1"
+# Regelarten: exakter Pfad, Präfix, Regex und Client-Netz (CIDR, nginx geo);
+# der Index-Schlüssel trägt das Präfix
+EXACT, PREFIX, REGEX, CIDR = "exact", "prefix", "regex", "cidr"
+_KEY_PREFIX = {PREFIX: "^~", REGEX: "~", CIDR: "cidr:"}
+_DENY_RULE = re.compile(r"^\s*deny\s+([0-9A-Fa-f:.]+(?:/\d+)?)\s*;")
+_LOCATION_RULE = re.compile(r'^\s*location\s*=\s*("(?:[^"\\]|\\.)*"|\S+)\s*\{\s*deny all;\s*\}')
+_PLAIN_PATH = re.compile(r'^[^\s"\'{};\\$#]+$')
+
+
+def parse_rule_path(rule):
+    """'location = /admin { deny all; }' -> '/admin' (oder None)."""
+    m = _LOCATION_RULE.match(rule)
+    if not m:
+        return None
+    path = m.group(1)
+    if path.startswith('"'):
+        path = re.sub(r'\\(.)', r'\1', path[1:-1])
+    return path
+
+
+def parse_rule_cidr(rule):
+    """'deny 10.0.0.0/24;' -> '10.0.0.0/24' (oder None)."""
+    m = _DENY_RULE.match(rule)
+    if not m:
+        return None
+    try:
+        return str(ipaddress.ip_network(m.group(1), strict=False))
+    except ValueError:
+        return None
+
+
+def _escape(path):
+    return path.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _quote(path):
+    """Pfad als nginx-Token; Sonderzeichen werden in Anführungszeichen escaped."""
+    if _PLAIN_PATH.match(path):
+        return path
+    return f'"{_escape(path)}"'
+
+
+def _map_key(path):
+    """map-Schlüssel; '~...' (Regex) und Parameternamen werden mit '\\' maskiert."""
+    key = _escape(path)
+    if path.startswith("~") or path in ("default", "hostnames", "include", "volatile"):
+        key = "\\" + key
+    return key
+
+
+def rule_key(kind, pattern):
+    return _KEY_PREFIX.get(kind, "") + pattern
+
+
+def rule_kind(key, entry):
+    return entry.get("kind", EXACT), entry.get("pattern", key)
+
+
+def rule_regex(kind, pattern):
+    """Präfix- und Regex-Regeln als Python-/PCRE-Regex (für map und Trefferzählung)."""
+    return "^" + re.escape(pattern) if kind == PREFIX else pattern
+
+
+def render_location_rules(rules):
+    lines = []
+    for key in sorted(rules):
+        kind, pattern = rule_kind(key, rules[key])
+        if kind == CIDR:
+            continue  # steht im geo-Block der map-Datei
+        if kind == PREFIX:
+            lines.append(f"location ^~ {_quote(pattern)} {{ deny all; }}")
+        elif kind == REGEX:
+            lines.append(f'location ~ "{_escape(pattern)}" {{ deny all; }}')
+        else:
+            lines.append(f"location = {_quote(pattern)} {{ deny all; }}")
+    return "".join(line + "\n" for line in lines)
+
+
+def render_map(rules, cidrs=()):
+    """map für Pfadregeln (leer, wenn rules leer ist) und geo-Block für die Client-Netze."""
+    lines = [
+        "# Generiert von rule_store.py, nicht von Hand bearbeiten",
+        "map_hash_max_size 262144;",
+        "map_hash_bucket_size 256;",
+        f"map $uri {MAP_VARIABLE} {{",
+        "    default 0;",
+    ]
+    for key in sorted(rules):
+        kind, pattern = rule_kind(key, rules[key])
+        if kind == EXACT:
+            lines.append(f'    "{_map_key(pattern)}" 1;')
+        elif kind != CIDR:
+            lines.append(f'    "~{_escape(rule_regex(kind, pattern))}" 1;')
+    lines.append("}")
+    lines.append(f"geo {IP_VARIABLE} {{")
+    lines.append("    default 0;")
+    lines += [f"    {cidr} 1;" for cidr in cidrs]
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def collapse_cidrs(cidrs):
+    """Überlappende und benachbarte Netze zusammenfassen (z.B. zwei /25 -> ein /24)."""
+    networks = [ipaddress.ip_network(c, strict=False) for c in cidrs]
+    collapsed = []
+    for version in (4, 6):
+        collapsed += ipaddress.collapse_addresses(n for n in networks if n.version == version)
+    return [str(n) for n in collapsed]
+
+
+def _stem(path, prefix=False):
+    """Gemeinsamer Stamm für die Zusammenfassung: '/admin12' -> ('regex', '/admin')."""
+    m = re.match(r"^(/.*?)[0-9]+$", path)
+    if m and len(m.group(1)) > 1:
+        return REGEX, m.group(1)
+    head, sep, _ = path.rpartition("/")
+    if prefix and head and sep:
+        return PREFIX, head + "/"
+    return None
+
+
+def consolidate(rules, min_members=RULE_CONSOLIDATE_MIN, protected=(), prefix=RULE_CONSOLIDATE_PREFIX):
+    """
+    Fasst exakte Pfade mit gemeinsamem Stamm zusammen: '/admin1', '/admin2', ...
+    -> Regex '^/admin[0-9]+$'; mit prefix auch '/wp/a', '/wp/b', ... -> Präfix
+    '/wp/'. Eine Zusammenfassung unterbleibt, wenn sie eine geschützte URL
+    (bekannt gut oder als unauffällig beobachtet) träfe. Gibt den neuen Index
+    und die Zusammenfassungen [{"rule": Schlüssel, "members": [...]}] zurück.
+    """
+    groups = {}
+    for key, entry in rules.items():
+        kind, pattern = rule_kind(key, entry)
+        if kind == EXACT:
+            stem = _stem(pattern, prefix)
+            if stem is not None:
+                groups.setdefault(stem, []).append(key)
+    merged = dict(rules)
+    merges = []
+    for (kind, stem), keys in groups.items():
+        if len(keys) < min_members:
+            continue
+        pattern = f"^{re.escape(stem)}[0-9]+$" if kind == REGEX else stem
+        regex = re.compile(rule_regex(kind, pattern))
+        if any(regex.search(url) for url in protected):
+            continue
+        members = [merged.pop(k) for k in keys]
+        key = rule_key(kind, pattern)
+        previous = merged.get(key, {})
+        merged[key] = {
+            "kind": kind,
+            "pattern": pattern,
+            "created": min([m["created"] for m in members] + [previous.get("created", time.time())]),
+            "hits": sum(m.get("hits", 0) for m in members) + previous.get("hits", 0),
+            "last_hit": max([m["last_hit"] for m in members + [previous] if m.get("last_hit")], default=None),
+            "source": "compactor",
+            "members": sum(m.get("members", 1) for m in members) + previous.get("members", 0),
+        }
+        merges.append({"rule": key, "members": sorted(keys)})
+    return merged, merges
+
+
+def expire(rules, now, ttl=RULE_TTL_SECONDS):
+    """Entfernt Regeln ohne Treffer seit ttl Sekunden (eigene 'ttl' pro Regel hat Vorrang, None = nie)."""
+    kept = {}
+    for key, entry in rules.items():
+        rule_ttl = entry.get("ttl", ttl)
+        if rule_ttl and now - (entry.get("last_hit") or entry["created"]) > rule_ttl:
+            continue
+        kept[key] = entry
+    return kept
+
+
+def _write_atomic(path, text):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class RuleStore:
+    """
+    Index der Blockregeln (Pfad -> Metadaten) als JSON neben custom_rules.conf.
+
+    Die nginx-Konfiguration wird immer komplett aus dem Index erzeugt:
+    bis MAP_THRESHOLD Regeln als "location ="-Blöcke in custom_rules.conf, darüber
+    als map in map_path (http-Kontext) plus eine einzige if-Abfrage in
+    custom_rules.conf. Gelesen wird der Index nur, wenn sich seine Signatur
+    geändert hat; Änderungen laufen unter einer Dateisperre, da Dashboard und
+    Scorer schreiben können. Fehlt der Index, wird custom_rules.conf importiert.
+
+    Neben exakten Pfaden gibt es Präfix- und Regex-Regeln, die der Kompaktierer
+    (compact()) aus vielen ähnlichen Pfaden erzeugt. Trefferzahlen (403 im Log)
+    halten eine Regel über ihre TTL hinaus am Leben.
+    """
+
+    def __init__(self, rules_path, index_path=None, map_path=None, map_threshold=MAP_THRESHOLD):
+        base = os.path.splitext(rules_path)[0]
+        self.rules_path = rules_path
+        self.index_path = index_path or base + ".json"  # custom_rules.json
+        self.map_path = map_path or base + "_map.conf"  # custom_rules_map.conf
+        self.map_threshold = map_threshold
+        self._rules = {}
+        self._sig = None
+        self._matcher = (None, set(), [], [])
+
+    # --- Lesen ---
+    def _import_conf(self):
+        rules = {}
+        now = time.time()
+        try:
+            with open(self.rules_path) as f:
+                for line in f:
+                    path = parse_rule_path(line)
+                    if path is not None:
+                        rules[path] = {"kind": EXACT, "pattern": path, "created": now,
+                                       "hits": 0, "last_hit": None, "source": "import"}
+        except FileNotFoundError:
+            pass
+        return rules
+
+    def rules(self):
+        """Aktueller Index {pfad: {created, hits, last_hit, source, ...}} (nicht verändern)."""
+        sig = file_signature(self.index_path) or ("conf", file_signature(self.rules_path))
+        if sig != self._sig:
+            if sig[0] == "conf":
+                self._rules = self._import_conf()
+            else:
+                try:
+                    with open(self.index_path) as f:
+                        self._rules = json.load(f)["rules"]
+                except (FileNotFoundError, ValueError, KeyError):
+                    return self._rules  # wird gerade ersetzt: bisherigen Stand behalten
+            self._sig = sig
+        return self._rules
+
+    def paths(self):
+        return set(self.rules())
+
+    def __contains__(self, path):
+        return path in self.rules()
+
+    def __len__(self):
+        return len(self.rules())
+
+    def _compiled(self):
+        """(exakte Pfade, [(Schlüssel, Regex)], [(Schlüssel, Netz)]) für den aktuellen Index, gecacht."""
+        rules = self.rules()
+        if self._matcher[0] is not rules:
+            exact, patterns, networks = set(), [], []
+            for key, entry in rules.items():
+                kind, pattern = rule_kind(key, entry)
+                if kind == EXACT:
+                    exact.add(pattern)
+                elif kind == CIDR:
+                    networks.append((key, ipaddress.ip_network(pattern, strict=False)))
+                else:
+                    patterns.append((key, re.compile(rule_regex(kind, pattern))))
+            self._matcher = (rules, exact, patterns, networks)
+        return self._matcher[1:]
+
+    def match(self, url):
+        """Schlüssel der Regel, die url blockiert (wie nginx: ohne Query-String), sonst None."""
+        path = url.split("?", 1)[0]
+        exact, patterns, _ = self._compiled()
+        for candidate in (url, path):
+            if candidate in exact:
+                return candidate
+        for key, regex in patterns:
+            if regex.search(path):
+                return key
+        return None
+
+    def covers(self, url):
+        return self.match(url) is not None
+
+    def match_ip(self, ip):
+        """Schlüssel der CIDR-Regel, die ip blockiert, sonst None."""
+        networks = self._compiled()[2]
+        if not networks:
+            return None
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        for key, network in networks:
+            if addr in network:
+                return key
+        return None
+
+    def covers_cidr(self, cidr):
+        network = ipaddress.ip_network(cidr, strict=False)
+        return any(network.version == n.version and network.subnet_of(n) for _, n in self._compiled()[2])
+
+    # --- Schreiben ---
+    @contextmanager
+    def _locked(self):
+        with open(self.index_path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._sig = None  # unter der Sperre immer frisch lesen
+                yield dict(self.rules())
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _save(self, rules, render=True):
+        _write_atomic(self.index_path, json.dumps({"rules": rules}))
+        if render:
+            self.render(rules)
+        self._rules = rules
+        self._sig = file_signature(self.index_path)
+
+    def render(self, rules=None):
+        """Schreibt custom_rules.conf und die map-Datei (map + geo) aus dem Index."""
+        rules = self.rules() if rules is None else rules
+        cidrs = collapse_cidrs(e["pattern"] for e in rules.values() if e.get("kind") == CIDR)
+        path_rules = {k: e for k, e in rules.items() if e.get("kind") != CIDR}
+        ip_check = f"if ({IP_VARIABLE}) {{ return 403; }}\n" if cidrs else ""
+        if len(path_rules) > self.map_threshold:
+            _write_atomic(self.map_path, render_map(path_rules, cidrs))
+            _write_atomic(self.rules_path, (
+                f"# {len(path_rules)} Regeln als map in {os.path.basename(self.map_path)}\n"
+                f"if ({MAP_VARIABLE}) {{ return 403; }}\n" + ip_check
+            ))
+        else:
+            _write_atomic(self.map_path, render_map({}, cidrs))
+            _write_atomic(self.rules_path, ip_check + render_location_rules(path_rules))
+
+    def add(self, paths, source="ui"):
+        """Fügt neue Pfade hinzu (O(1) pro Pfad); gibt die Anzahl neuer Regeln zurück."""
+        with self._locked() as rules:
+            now = time.time()
+            added = 0
+            for path in paths:
+                if path and path not in rules:
+                    rules[path] = {"kind": EXACT, "pattern": path, "created": now,
+                                   "hits": 0, "last_hit": None, "source": source}
+                    added += 1
+            if added:
+                self._save(rules)
+        return added
+
+    def add_cidrs(self, cidrs, source="ui"):
+        """Fügt Client-Netze (nginx geo) hinzu; gibt die Anzahl neuer Regeln zurück."""
+        with self._locked() as rules:
+            now = time.time()
+            added = 0
+            for cidr in cidrs:
+                network = str(ipaddress.ip_network(cidr, strict=False))
+                key = rule_key(CIDR, network)
+                if key not in rules:
+                    rules[key] = {"kind": CIDR, "pattern": network, "created": now,
+                                  "hits": 0, "last_hit": None, "source": source}
+                    added += 1
+            if added:
+                self._save(rules)
+        return added
+
+    def remove(self, paths):
+        with self._locked() as rules:
+            removed = [p for p in paths if rules.pop(p, None) is not None]
+            if removed:
+                self._save(rules)
+        return len(removed)
+
+    def clear(self):
+        with self._locked():
+            self._save({})
+
+    def record_hits(self, hits, now):
+        """Addiert Trefferzahlen {Schlüssel: Anzahl}; die nginx-Konfiguration bleibt unverändert."""
+        with self._locked() as rules:
+            changed = False
+            for key, count in hits.items():
+                entry = rules.get(key)
+                if entry is not None:
+                    rules[key] = dict(entry, hits=entry.get("hits", 0) + count, last_hit=now)
+                    changed = True
+            if changed:
+                self._save(rules, render=False)
+
+    def compact(self, now, ttl=RULE_TTL_SECONDS, min_members=RULE_CONSOLIDATE_MIN, protected=(),
+                prefix=RULE_CONSOLIDATE_PREFIX):
+        """
+        Entfernt ungenutzte Regeln (TTL) und fasst ähnliche Pfade zusammen.
+        Gibt (abgelaufen, Zusammenfassungen wie bei consolidate()) zurück; die
+        Konfiguration wird nur neu geschrieben, wenn sich etwas geändert hat.
+        """
+        with self._locked() as rules:
+            kept = expire(rules, now, ttl)
+            merged, merges = consolidate(kept, min_members, protected, prefix)
+            expired = len(rules) - len(kept)
+            if expired or merges:
+                self._save(merged)
+        return expired, merges
+
+
+_stores = {}
+
+
+def get_rule_store(rules_path):
+    """Prozessweiter RuleStore für diese custom_rules.conf."""
+    store = _stores.get(rules_path)
+    if store is None:
+        store = _stores[rules_path] = RuleStore(rules_path)
+    return store
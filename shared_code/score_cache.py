@@ -0,0 +1,92 @@
+# shared_code/score_cache.py
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from model_registry import compute_mse
+
+# Anzahl verschiedener Feature-Vektoren (method_num, url_num, status, size) im Cache
+SCORE_CACHE_SIZE = int(os.environ.get("SCORE_CACHE_SIZE", 65536))
+
+
+class ScoreCache:
+    """
+    LRU-Cache für den Rekonstruktionsfehler pro Roh-Feature-Vektor.
+
+    Gespeichert wird nur der MSE; er hängt von Modell, Scaler und URL-Vokabular
+    ab, die alle in snapshot.version eingehen. Wechselt die Version, wird der
+    Cache geleert. Der Threshold wird erst nach dem Nachschlagen angewendet,
+    eine Threshold-Änderung liefert also nie veraltete Entscheidungen und
+    braucht den Cache nicht zu verwerfen. Pro Batch werden die Zeilen
+    dedupliziert; nur Cache-Misses gehen gesammelt ins Modell.
+    """
+
+    def __init__(self, max_entries=SCORE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.version = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.version = version
+
+    def mse(self, snapshot, X_raw):
+        """Wie model_registry.compute_mse, aber mit Cache."""
+        X_raw = np.asarray(X_raw, dtype=np.float64)
+        if len(X_raw) == 0:
+            return np.empty(0)
+        if self.max_entries <= 0:
+            return compute_mse(snapshot, X_raw)
+        unique_rows, inverse = np.unique(X_raw, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        keys = list(map(tuple, unique_rows.tolist()))
+        values = np.empty(len(keys))
+        with self._lock:
+            self._check_version(snapshot.version)
+            missing = []
+            for i, key in enumerate(keys):
+                value = self.entries.get(key)
+                if value is None:
+                    missing.append(i)
+                else:
+                    self.entries.move_to_end(key)
+                    values[i] = value
+            # Treffer/Fehlschläge zählen Zeilen, nicht verschiedene Vektoren
+            row_counts = np.bincount(inverse, minlength=len(keys))
+            missed_rows = int(row_counts[missing].sum()) if missing else 0
+            self.misses += missed_rows
+            self.hits += len(X_raw) - missed_rows
+        if missing:
+            values[missing] = compute_mse(snapshot, unique_rows[missing])
+            with self._lock:
+                if self.version == snapshot.version:
+                    for i in missing:
+                        self.entries[keys[i]] = float(values[i])
+                    overflow = len(self.entries) - self.max_entries
+                    for _ in range(max(overflow, 0)):
+                        self.entries.popitem(last=False)
+                    self.evictions += max(overflow, 0)
+        return values[inverse]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,97 @@
+# shared_code/score_store.py
+
+import json
+import os
+import time
+
+import numpy as np
+
+# Ein Datensatz pro gescorter Logzeile. Die Inode identifiziert die Logdatei,
+# damit Zeilennummern nach einer Rotation nicht verwechselt werden.
+SCORE_DTYPE = np.dtype([
+    ("inode", "<u8"),
+    ("line", "<i8"),
+    ("mse", "<f4"),
+    ("anomaly", "u1"),
+])
+
+# Ab dieser Größe wird die Datei nach <path>.1 rotiert (Plattenbedarf bleibt begrenzt)
+MAX_STORE_BYTES = 64 << 20
+
+
+class ScoreStore:
+    """
+    Append-only Binärdatei mit festen SCORE_DTYPE-Datensätzen.
+    Der Scorer hängt an, das Dashboard liest nur das Dateiende.
+    """
+
+    def __init__(self, path, max_bytes=MAX_STORE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def append(self, inode, lines, mse, anomaly):
+        records = np.empty(len(lines), dtype=SCORE_DTYPE)
+        records["inode"] = inode
+        records["line"] = lines
+        records["mse"] = mse
+        records["anomaly"] = anomaly
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            os.replace(self.path, self.path + ".1")
+        with open(self.path, "ab") as f:
+            f.write(records.tobytes())
+
+    def read_tail(self, n):
+        """Liest die letzten n Datensätze (ggf. weniger)."""
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return np.empty(0, dtype=SCORE_DTYPE)
+        count = size // SCORE_DTYPE.itemsize
+        start = max(count - n, 0)
+        with open(self.path, "rb") as f:
+            f.seek(start * SCORE_DTYPE.itemsize)
+            return np.fromfile(f, dtype=SCORE_DTYPE, count=count - start)
+
+    def lookup(self, inode, lines, window=None):
+        """
+        Liefert (mse, anomaly) als Arrays passend zu ``lines`` (Zeilennummern in
+        der Logdatei mit dieser Inode). Noch nicht gescorte Zeilen: mse = NaN.
+        """
+        lines = np.asarray(lines, dtype=np.int64)
+        mse = np.full(len(lines), np.nan, dtype=np.float32)
+        anomaly = np.zeros(len(lines), dtype=bool)
+        if len(lines) == 0:
+            return mse, anomaly
+        records = self.read_tail(window or max(4 * len(lines), 1000))
+        records = records[records["inode"] == inode]
+        if len(records) == 0:
+            return mse, anomaly
+        order = np.argsort(records["line"], kind="stable")
+        sorted_lines = records["line"][order]
+        idx = np.searchsorted(sorted_lines, lines)
+        idx = np.clip(idx, 0, len(sorted_lines) - 1)
+        hit = sorted_lines[idx] == lines
+        mse[hit] = records["mse"][order][idx[hit]]
+        anomaly[hit] = records["anomaly"][order][idx[hit]].astype(bool)
+        return mse, anomaly
+
+
+def write_json_atomic(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def read_json(path, default=None):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return default
+
+
+def scorer_is_active(status_path, max_age=10):
+    """True, wenn der Scorer-Dienst seinen Status in den letzten max_age Sekunden geschrieben hat."""
+    status = read_json(status_path)
+    return bool(status) and time.time() - status.get("updated", 0) < max_age
@@ -0,0 +1,102 @@
+# shared_code/synthetic_log.py
+
+import argparse
+import time
+
+import numpy as np
+
+from config import TRAFFIC_PROFILES_PATH
+from loadgen import load_profiles, profile_paths
+
+CHUNK_LINES = 200000
+DEFAULT_RATE = 200.0  # Zeilen pro Sekunde Logzeit (bestimmt die Zeitstempel)
+TIME_FORMAT = "%d/%b/%Y:%H:%M:%S +0000"
+
+NORMAL_METHODS = ["GET", "GET", "GET", "GET", "HEAD", "POST"]
+NORMAL_STATUS = [200, 200, 200, 200, 200, 200, 304, 404]
+ATTACK_METHODS = ["GET", "POST", "PUT", "DELETE"]
+ATTACK_STATUS = [403, 404, 404, 400, 500]
+NORMAL_AGENTS = ["python-requests/2.32.3", "Mozilla/5.0 (X11; Linux x86_64)", "curl/8.5.0"]
+ATTACK_AGENTS = ["sqlmap/1.7.2", "Nikto/2.5.0", "python-requests/2.32.3"]
+
+
+def _pick(rng, values, n):
+    return np.asarray(values, dtype=object)[rng.integers(0, len(values), n)]
+
+
+def generate_chunks(lines, malicious_ratio=0.1, seed=0, start=None, rate=DEFAULT_RATE,
+                    chunk_lines=CHUNK_LINES, profiles=TRAFFIC_PROFILES_PATH):
+    """
+    Erzeugt synthetische nginx-Logzeilen im Format "main" als Byte-Blöcke zu je
+    chunk_lines Zeilen. Ein Anteil malicious_ratio stammt von wenigen
+    Angreifer-IPs mit den Pfaden des Profils "attack", der Rest nutzt die des
+    Profils "normal" (beide aus profiles, wie die Labels in replay.py).
+    Gleicher seed -> gleiche Datei.
+    """
+    # Profile sofort laden (nicht erst beim ersten Block), damit write_log bei
+    # fehlender Datei nicht schon eine leere Ausgabedatei angelegt hat
+    data = load_profiles(profiles)
+    return _chunks(lines, malicious_ratio, seed, start, rate, chunk_lines,
+                   profile_paths(data, "normal"), profile_paths(data, "attack"))
+
+
+def _chunks(lines, malicious_ratio, seed, start, rate, chunk_lines, normal_paths, attack_paths):
+    rng = np.random.default_rng(seed)
+    start = int(time.time() - lines / rate) if start is None else int(start)
+    for offset in range(0, lines, chunk_lines):
+        n = min(chunk_lines, lines - offset)
+        malicious = rng.random(n) < malicious_ratio
+        k = int(malicious.sum())
+        methods = _pick(rng, NORMAL_METHODS, n)
+        urls = _pick(rng, normal_paths, n)
+        statuses = _pick(rng, NORMAL_STATUS, n)
+        agents = _pick(rng, NORMAL_AGENTS, n)
+        ips = np.char.add("172.18.0.", rng.integers(2, 250, n).astype(str)).astype(object)
+        sizes = rng.lognormal(7.5, 1.0, n).astype(np.int64)
+        if k:
+            methods[malicious] = _pick(rng, ATTACK_METHODS, k)
+            urls[malicious] = _pick(rng, attack_paths, k)
+            statuses[malicious] = _pick(rng, ATTACK_STATUS, k)
+            agents[malicious] = _pick(rng, ATTACK_AGENTS, k)
+            ips[malicious] = np.char.add("10.66.0.", rng.integers(2, 12, k).astype(str)).astype(object)
+            sizes[malicious] = rng.integers(150, 600, k)
+        seconds = start + (offset + np.arange(n)) // rate
+        # Zeitstempel nur einmal pro Sekunde formatieren
+        stamps = {s: time.strftime(TIME_FORMAT, time.gmtime(s)) for s in np.unique(seconds).tolist()}
+        yield "".join([
+            f'{ip} - - [{stamps[s]}] "{m} {u} HTTP/1.1" {st} {sz} "-" "{ua}" "-"\n'
+            for ip, s, m, u, st, sz, ua in zip(
+                ips.tolist(), seconds.tolist(), methods.tolist(), urls.tolist(),
+                statuses.tolist(), sizes.tolist(), agents.tolist())
+        ]).encode()
+
+
+def write_log(path, lines, malicious_ratio=0.1, seed=0, start=None, rate=DEFAULT_RATE,
+              profiles=TRAFFIC_PROFILES_PATH):
+    """Schreibt lines synthetische Zeilen nach path (blockweise, konstanter Speicher); gibt die Bytes zurück."""
+    written = 0
+    chunks = generate_chunks(lines, malicious_ratio, seed, start, rate, profiles=profiles)
+    with open(path, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Synthetisches nginx-Access-Log (Format main)")
+    parser.add_argument("path")
+    parser.add_argument("--lines", type=int, default=10000)
+    parser.add_argument("--malicious", type=float, default=0.1, help="Anteil bösartiger Zeilen (0..1)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="Zeilen pro Sekunde Logzeit")
+    parser.add_argument("--profiles", default=TRAFFIC_PROFILES_PATH, help="Quelle der normalen/bösartigen Pfade")
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+    written = write_log(args.path, args.lines, args.malicious, args.seed, rate=args.rate, profiles=args.profiles)
+    seconds = time.perf_counter() - started
+    print(f"{args.lines:,} lines, {written / 1e6:,.1f} MB in {seconds:.1f}s -> {args.path}")
+
+
+if __name__ == "__main__":
+    main()
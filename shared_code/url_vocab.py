@@ -0,0 +1,113 @@
+# shared_code/url_vocab.py
+
+import os
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from log_parser import encode_urls
+from score_store import read_json, write_json_atomic
+
+# Größe des Vokabulars: häufigste Pfade und erste Pfadsegmente aus den Trainingsdaten
+MAX_PATHS = int(os.environ.get("URL_VOCAB_MAX_PATHS", 256))
+MAX_SEGMENTS = int(os.environ.get("URL_VOCAB_MAX_SEGMENTS", 64))
+MIN_COUNT = 2  # seltenere Pfade landen im Segment bzw. in einem Hash-Bucket
+# Unbekannte Segmente: Hash-Buckets ab OOV_BASE, deutlich über allen Vokabular-IDs
+HASH_BUCKETS = int(os.environ.get("URL_VOCAB_BUCKETS", 64))
+OOV_BASE = 1000
+
+
+def url_path(url):
+    """Pfad ohne Query-String."""
+    return url.split("?", 1)[0]
+
+
+def first_segment(path):
+    """'/static/logo.png' -> '/static', '/' -> '/'."""
+    return "/" + path.lstrip("/").split("/", 1)[0]
+
+
+def stable_hash(text):
+    """Prozessunabhängiger Hash (hash() ist pro Prozess randomisiert)."""
+    return zlib.crc32(text.encode("utf-8", errors="replace"))
+
+
+class UrlVocab:
+    """
+    Gelerntes URL-Vokabular für das Feature url_num.
+
+    Bekannte Pfade bekommen die IDs 0..len(paths)-1 (häufigste zuerst), danach
+    folgen die bekannten ersten Pfadsegmente. Alles andere wird über das erste
+    Segment in einen von ``buckets`` Hash-Buckets ab OOV_BASE abgebildet: so
+    bleibt der Feature-Vektor 4-spaltig, unbekannte Bereiche der Seite sind aber
+    unterscheidbar und neue Inhalte brauchen keine Codeänderung mehr.
+    """
+
+    def __init__(self, paths, segments=(), buckets=HASH_BUCKETS, oov_base=OOV_BASE):
+        self.paths = list(paths)
+        self.segments = list(segments)
+        self.buckets = buckets
+        self.oov_base = oov_base
+        self._ids = {p: i for i, p in enumerate(self.paths)}
+        self._segment_ids = {s: len(self.paths) + i for i, s in enumerate(self.segments)}
+        if len(self._ids) + len(self._segment_ids) > oov_base:
+            raise ValueError("URL vocabulary overlaps the hash buckets")
+
+    def __len__(self):
+        return len(self.paths) + len(self.segments)
+
+    @classmethod
+    def build(cls, url_counts, max_paths=MAX_PATHS, max_segments=MAX_SEGMENTS,
+              min_count=MIN_COUNT, buckets=HASH_BUCKETS):
+        """Vokabular aus Häufigkeiten {url: Anzahl} (z.B. den Trainingsdaten)."""
+        path_counts = Counter()
+        for url, count in url_counts.items():
+            path_counts[url_path(url)] += count
+        paths = [p for p, c in path_counts.most_common(max_paths) if c >= min_count]
+        known = set(paths)
+        segment_counts = Counter()
+        for path, count in path_counts.items():
+            if path not in known:
+                segment_counts[first_segment(path)] += count
+        segments = [s for s, c in segment_counts.most_common(max_segments) if c >= min_count]
+        return cls(paths, segments, buckets)
+
+    def lookup(self, url):
+        path = url_path(url)
+        i = self._ids.get(path)
+        if i is not None:
+            return i
+        segment = first_segment(path)
+        i = self._segment_ids.get(segment)
+        if i is not None:
+            return i
+        return self.oov_base + stable_hash(segment) % self.buckets
+
+    def encode(self, urls):
+        """url_num für eine Liste URLs; jede verschiedene URL wird nur einmal nachgeschlagen."""
+        codes = {u: self.lookup(u) for u in set(urls)}
+        return np.fromiter(map(codes.__getitem__, urls), dtype=np.int32, count=len(urls))
+
+    def to_dict(self):
+        return {"paths": self.paths, "segments": self.segments,
+                "buckets": self.buckets, "oov_base": self.oov_base}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["paths"], data.get("segments", ()), data.get("buckets", HASH_BUCKETS),
+                   data.get("oov_base", OOV_BASE))
+
+    def save(self, path):
+        write_json_atomic(path, self.to_dict())
+
+
+def load_vocab(path):
+    """Gespeichertes Vokabular oder None (ältere Modelle: feste URL_MAP-Kodierung)."""
+    data = read_json(path) if path else None
+    return UrlVocab.from_dict(data) if data else None
+
+
+def url_encoder(vocab):
+    """Encoder für parse_block(url_encoder=...): Vokabular oder die feste URL_MAP."""
+    return vocab.encode if vocab is not None else encode_urls
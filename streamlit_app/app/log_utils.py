@@ -1,50 +1,166 @@
 # app/utils.py
 
+import numpy as np
 import pandas as pd
-import re
+from collections import deque
+from log_tail import LogTailer
+from log_parser import parse_block, to_dataframe
+from feature_store import FeatureStore, store_columns
+from score_store import ScoreStore, scorer_is_active
 from state import add_message
 from config import (
     LOGFILE_PATH,
     N_LOG_LINES,
+    FEATURE_STORE_DIR,
+    SCORER_STATUS_PATH,
+    SCORES_PATH,
 )
 
+# Tailer und zuletzt gesehene Einträge pro Logdatei; bleiben über die
+# Streamlit-Reruns hinweg im Prozess erhalten.
+_tailers = {}
+_recent = {}
+# Inode der zuletzt aus dem Feature-Store gelesenen Zeilen
+_store_inodes = {}
+# Große Tabelle: ein LogWindow pro Fenstergröße, ebenfalls prozessweit
+_windows = {}
+
+# Farbkategorien der Tabellenzeilen, Vorrang in dieser Reihenfolge (wie die Legende)
+CATEGORIES = ("blocked", "anomaly", "ok", "other")
+
+# Liegt mehr als diese Menge ungelesen hinter dem Tailer (z.B. nach langer
+# Pause), wird direkt ans Dateiende gesprungen statt alles zu parsen.
+TAIL_SKIP_BYTES = 4 << 20
+
+def _last_lines(data, last_n):
+    """Schneidet einen Block auf die letzten last_n Zeilen zu; gibt (übersprungen, block) zurück."""
+    total = data.count(b"\n")
+    if total <= last_n:
+        return 0, data
+    pos = len(data) - 1
+    for _ in range(last_n):
+        pos = data.rfind(b"\n", 0, pos)
+    return total - last_n, data[pos + 1:]
+
+def row_category(df):
+    """Kategorie pro Zeile ohne Python-Aufruf pro Zeile: 403 vor Anomalie vor 200."""
+    status = df["status"].to_numpy()
+    anomaly = df["anomaly"].to_numpy(dtype=bool) if "anomaly" in df else np.zeros(len(df), dtype=bool)
+    category = np.select([status == 403, anomaly, status == 200], CATEGORIES[:3], CATEGORIES[3])
+    return pd.Categorical(category, categories=CATEGORIES)
+
+def get_log_inode(logfile_path):
+    """Inode der Logdatei, aus der die zuletzt gelieferten Zeilen stammen (oder None)."""
+    if logfile_path in _store_inodes:
+        return _store_inodes[logfile_path]
+    tailer = _tailers.get(logfile_path)
+    return tailer.inode[1] if tailer is not None and tailer.inode else None
+
+def _features_from_store(logfile_path, last_n):
+    """Letzte last_n Zeilen aus dem Feature-Store (None, wenn der Scorer nicht läuft)."""
+    if not scorer_is_active(SCORER_STATUS_PATH):
+        return None
+    records = FeatureStore(FEATURE_STORE_DIR).tail(last_n)
+    if len(records) == 0:
+        return None
+    # Nur Zeilen der aktuellen Logdatei, wie beim Tailer nach einer Rotation
+    inode = int(records["inode"][-1])
+    records = records[records["inode"] == inode]
+    _store_inodes[logfile_path] = inode
+    return to_dataframe(store_columns(records))
+
 def extract_features_with_line_numbers(logfile_path, last_n=N_LOG_LINES):
-    pattern = re.compile(
-        r'(?P<ip>\S+) \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<method>\S+) (?P<url>\S+) \S+" (?P<status>\d+) (?P<size>\d+)'
-    )
-    data = []
-    url_map = {
-        '/': 0,
-        '/index.html': 1,
-        '/about': 2,
-        '/contact': 3,
-        '/help': 4,
-        '/favicon.ico': 5,
-        '/static/logo.png': 6,
-        '/static/style.css': 7
-    }
+    """
+    Liefert die letzten last_n Logeinträge als DataFrame (mit Spalte 'Line').
+    Läuft der Scorer, kommen die Zeilen bereits geparst aus dem Feature-Store.
+    Sonst wird die Datei nicht jedes Mal komplett gelesen: ein persistenter
+    LogTailer liest nur neu angehängte Bytes, Rotation und Truncation werden erkannt.
+    """
     try:
-        with open(logfile_path) as f:
-            all_lines = f.readlines()
-            total_lines = len(all_lines)
-            lines = all_lines[-last_n:]
-            start_line_number = total_lines - len(lines) + 1
-            for i, line in enumerate(lines):
-                m = pattern.match(line)
-                if m:
-                    entry = m.groupdict()
-                    entry['Line'] = start_line_number + i
-                    entry['method_num'] = 0 if entry['method'] == 'GET' else 1
-                    entry['url_num'] = url_map.get(entry['url'], 99)
-                    entry['status'] = int(entry['status'])
-                    entry['size'] = int(entry['size'])
-                    data.append(entry)
+        df = _features_from_store(logfile_path, last_n)
+        if df is not None:
+            return df
+        _store_inodes.pop(logfile_path, None)
+        tailer = _tailers.get(logfile_path)
+        recent = _recent.get(logfile_path)
+        if tailer is None or recent is None or recent["entries"].maxlen != last_n:
+            tailer = LogTailer(logfile_path)
+            tailer.seek_tail(last_n)
+            recent = {"generation": tailer.generation, "entries": deque(maxlen=last_n)}
+            _tailers[logfile_path] = tailer
+            _recent[logfile_path] = recent
+        elif tailer.lag() > TAIL_SKIP_BYTES:
+            tailer.seek_tail(last_n)
+        generation, start_line_number, data = tailer.read_block()
+        if generation != recent["generation"]:
+            recent["entries"].clear()
+            recent["generation"] = generation
+        if data:
+            # Nur die letzten last_n Zeilen parsen, der Rest fällt ohnehin aus dem Puffer
+            skipped, data = _last_lines(data, last_n)
+            df_new = to_dataframe(parse_block(data, start_line_number + skipped))
+            recent["entries"].extend(df_new.to_dict("records"))
     except Exception as e:
         add_message(f"Error reading logfile: {e}", "warning")
         return pd.DataFrame()
-    df = pd.DataFrame(data)
+    df = pd.DataFrame(list(recent["entries"]))
     if not df.empty:
        cols = ['Line'] + [c for c in df.columns if c != 'Line']
        df = df[cols]
     return df
- 
+
+class LogWindow:
+    """
+    Die letzten size gescorten Zeilen für die große Tabelle (älteste zuerst).
+    Pro Refresh werden nur die neu hinzugekommenen Datensätze aus dem
+    Feature-Store umgewandelt und nur Zeilen ohne Score im ScoreStore
+    nachgeschlagen; die Kategorie wird vektorisiert neu berechnet.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.inode = None
+        self.df = pd.DataFrame()
+
+    def refresh(self):
+        records = FeatureStore(FEATURE_STORE_DIR).tail(self.size)
+        if len(records) == 0:
+            return self.df
+        inode = int(records["inode"][-1])
+        records = records[records["inode"] == inode]
+        if inode != self.inode:
+            # Rotation: Zeilennummern beginnen neu
+            self.inode = inode
+            self.df = pd.DataFrame()
+        if not self.df.empty:
+            records = records[records["line"] > self.df["Line"].iat[-1]]
+        df = self.df
+        if len(records):
+            new = to_dataframe(store_columns(records))
+            new["mse"] = np.nan
+            new["anomaly"] = False
+            df = new if df.empty else pd.concat([df, new], ignore_index=True)
+            df = df.iloc[-self.size:].reset_index(drop=True)
+        else:
+            df = df.copy()  # ausgelieferte Fenster bleiben unverändert (eingefrorene Ansicht)
+        pending = df["mse"].isna().to_numpy()
+        if pending.any():
+            mse, anomaly = ScoreStore(SCORES_PATH).lookup(inode, df["Line"].to_numpy()[pending], window=2 * self.size)
+            df.loc[pending, "mse"] = mse
+            df.loc[pending, "anomaly"] = anomaly
+        df["category"] = row_category(df)
+        self.df = df
+        return df
+
+def log_window(size):
+    """Aktualisiertes Fenster der letzten size Zeilen (leer, wenn der Scorer nicht läuft)."""
+    if not scorer_is_active(SCORER_STATUS_PATH):
+        return pd.DataFrame()
+    window = _windows.get(size)
+    if window is None:
+        window = _windows[size] = LogWindow(size)
+    try:
+        return window.refresh()
+    except Exception as e:
+        add_message(f"Error reading the log window: {e}", "warning")
+        return window.df
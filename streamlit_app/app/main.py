@@ -1,29 +1,35 @@
 import streamlit as st
 from streamlit_autorefresh import st_autorefresh
-import os
-import json
+import time
 import numpy as np
 
 from config import (
-    LOGFILE_PATH, N_LOG_LINES, MODEL_PATH, SCALER_PATH, THRESHOLD_PATH, CUSTOM_RULES_PATH
+    LOGFILE_PATH, N_LOG_LINES, CUSTOM_RULES_PATH,
+    SCORES_PATH, SCORER_STATUS_PATH, BLOCK_SUGGESTIONS_PATH,
 )
 from state import init_session_state, add_message, show_messages
-from log_utils import extract_features_with_line_numbers
-from model_utils import scale_features, load_model
+from log_utils import extract_features_with_line_numbers, get_log_inode, row_category
+from score_store import ScoreStore, read_json, scorer_is_active
+from model_utils import get_model_snapshot, compute_mse, known_bad_mask, prefilter_stats, score_cache_stats
 from nginx_utils import (
     reload_nginx,
-    load_existing_rule_paths,
+    filter_uncovered_paths,
     build_block_rules_from_paths,
+    build_block_rules_from_cidrs,
 )
 from ui_components import (
-    color_row,
+    row_styles,
+    log_window_col,
     mode_switch_col,
     current_mode_col,
     attack_button_col,
     attack_status_col,
     copy_model_col,
     clear_rules_col,
+    reload_status_col,
     block_suggestions_col,  # NEU: Vorschlagsanzeige importieren!
+    latency_panel_col,
+    rule_merges_col,
 )
 from slider_component import threshold_slider_col
 
@@ -64,6 +70,8 @@ def main():
         attack_button_col(mode)
         copy_model_col()
         clear_rules_col()
+        reload_status_col()
+        rule_merges_col()
 
     with steer_cols[3]:
         threshold_slider_col()
@@ -82,39 +90,73 @@ def main():
     try:
         df = extract_features_with_line_numbers(LOGFILE_PATH, N_LOG_LINES)
         if not df.empty and mode == "Inference":
-            model = load_model(MODEL_PATH)
-            X_scaled = scale_features(df, SCALER_PATH)
-            reconstructions = model.predict(X_scaled)
-            mse = np.mean(np.power(X_scaled - reconstructions, 2), axis=1)
-            df["mse"] = mse
-            if os.path.exists(THRESHOLD_PATH):
-                with open(THRESHOLD_PATH) as f:
-                    threshold = json.load(f)["threshold"]
+            if scorer_is_active(SCORER_STATUS_PATH):
+                # Scores vom Scorer-Dienst übernehmen (scort jede Zeile, auch ohne offenen Browser)
+                mse, anomaly = ScoreStore(SCORES_PATH).lookup(get_log_inode(LOGFILE_PATH), df["Line"])
+                df["mse"] = mse
+                df["anomaly"] = anomaly
+                status = read_json(SCORER_STATUS_PATH, {})
+                st.caption(
+                    f"Scores from scorer service · model {status.get('model_version')} ({status.get('engine')}) · "
+                    f"{status.get('lines_per_sec', 0):.0f} lines/s · lag {status.get('lag_bytes', 0)} bytes · "
+                    f"prefilter {status.get('prefilter', {}).get('short_circuited', 0)} hits · "
+                    f"score cache {status.get('score_cache', {}).get('hit_rate', 0):.0%} hits"
+                )
+                suggestions = read_json(BLOCK_SUGGESTIONS_PATH, {})
+                suggested_paths = {s["path"] for s in suggestions.get("suggestions", [])}
+                # IPs/Netze, die auffällig viele Fehler/Pfade/Anfragen erzeugen (gleitende Fenster im Scorer)
+                suggested_cidrs = [s["cidr"] for s in suggestions.get("ip_suggestions", [])]
             else:
-                threshold = 0.1  # Fallback
-            df["anomaly"] = mse > threshold
+                snapshot = get_model_snapshot()
+                if snapshot is None:
+                    raise RuntimeError("No model available for inference.")
+                # Bekannte Angriffs-URLs vorab markieren, nur der Rest geht ins Modell
+                known = known_bad_mask(df)
+                mse = np.full(len(df), np.inf)
+                if not known.all():
+                    mse[~known] = compute_mse(df[~known], snapshot)
+                df["mse"] = mse
+                threshold = snapshot.threshold
+                cache = score_cache_stats()
+                st.caption(
+                    f"Model version {snapshot.version} ({snapshot.engine}) · loaded in {snapshot.load_seconds:.2f}s "
+                    f"at {time.strftime('%H:%M:%S', time.localtime(snapshot.loaded_at))} · threshold {threshold:.4f} · "
+                    f"prefilter {prefilter_stats()['short_circuited']} hits · "
+                    f"score cache {cache['hit_rate']:.0%} hits ({cache['size']}/{cache['max_entries']}, "
+                    f"{cache['evictions']} evicted)"
+                )
+                df["anomaly"] = known | (mse > threshold)
+                # Passe den Spaltennamen ggf. an (url)
+                suggested_paths = set(df.loc[df["anomaly"], "url"].unique())
+                suggested_cidrs = []
 
             # --- Blockregel-Vorschlagslogik ---
-            anomalous_df = df[df["anomaly"]]
-            if not anomalous_df.empty:
-                existing_paths = load_existing_rule_paths(CUSTOM_RULES_PATH)
-                # Passe den Spaltennamen ggf. an (url)
-                suggested_paths = set(anomalous_df["url"].unique()) - existing_paths
-                block_suggestions = build_block_rules_from_paths(suggested_paths)
+            if suggested_paths or suggested_cidrs:
+                suggested_paths = filter_uncovered_paths(suggested_paths, CUSTOM_RULES_PATH)
+                block_suggestions = build_block_rules_from_paths(suggested_paths) + \
+                    build_block_rules_from_cidrs(suggested_cidrs)
                 # Nur aktualisieren, wenn die Liste leer ist (stabil bis Button-Klick)
                 if "block_suggestions" not in st.session_state or not st.session_state["block_suggestions"]:
                     st.session_state["block_suggestions"] = block_suggestions
 
         if not df.empty:
-            st.write(df.style.apply(color_row, axis=1))
+            df["category"] = row_category(df)
+            st.write(df.style.apply(row_styles, axis=None))
         else:
             st.info("Keine Logeinträge gefunden.")
     except Exception as e:
         add_message(f"Fehler beim Laden/Anzeigen der Logdaten: {e}", "error")
 
+    # --- Große Tabelle zum Untersuchen eines Bursts ---
+    log_window_col()
+
     # --- Blockregel-Vorschläge anzeigen & anwenden ---
     block_suggestions_col()
 
+    # --- Latenz Erkennung -> durchgesetzte Regel ---
+    with st.expander("Detection-to-enforcement latency (p50/p95/p99)"):
+        latency_panel_col()
+
     # --- Statusmeldungen anzeigen ---
     show_messages()
 
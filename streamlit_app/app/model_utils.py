@@ -3,16 +3,31 @@
 import os
 import joblib
 import numpy as np
-import tensorflow as tf
 from state import add_message
 import pandas as pd
+from model_registry import get_registry, model_features
+from score_cache import ScoreCache
+from pattern_filter import PatternFilter
+from model_versions import ModelVersions
+from config import (
+    MODEL_PATH, SCALER_PATH, THRESHOLD_PATH, WEIGHTS_PATH, URL_VOCAB_PATH, MALICIOUS_PATTERNS_PATH,
+    MODEL_VERSIONS_DIR, MODEL_CURRENT_PATH,
+)
+
+FEATURE_COLS = ['method_num', 'url_num', 'status', 'size']
+
+# Prozessweit, damit die Muster nur bei Änderung der JSON-Datei neu kompiliert werden
+_prefilter = PatternFilter(MALICIOUS_PATTERNS_PATH)
+# Prozessweit über alle Refreshes; wird bei einer neuen Modellversion geleert
+_score_cache = ScoreCache()
+model_versions = ModelVersions(MODEL_VERSIONS_DIR, MODEL_CURRENT_PATH)
 
 def scale_features(df: pd.DataFrame, scaler_path: str) -> np.ndarray:
     """
     Skaliert die Features im DataFrame df mit dem Scaler aus scaler_path.
     Gibt ein 2D-numpy-Array zurück.
     """
-    feature_cols = ['method_num', 'url_num', 'status', 'size']
+    feature_cols = FEATURE_COLS
     if not os.path.exists(scaler_path):
         add_message("Scaler file not found! Model inference will be incorrect.", "error")
         return np.zeros((len(df), len(feature_cols)))
@@ -34,8 +49,9 @@ def load_model(model_path: str):
         add_message(f"Model file not found at {model_path}!", "error")
         return None
 
-    # Versuche zuerst, ein Keras-Modell zu laden
+    # Versuche zuerst, ein Keras-Modell zu laden (TensorFlow nur bei Bedarf importieren)
     try:
+        import tensorflow as tf
         model = tf.keras.models.load_model(model_path, compile=False)
         return model
     except Exception:
@@ -53,3 +69,39 @@ def load_model(model_path: str):
         add_message(f"Failed to load model with joblib: {e}", "error")
         return None
 
+
+def get_model_snapshot():
+    """
+    Liefert Modell, Scaler und Threshold aus der prozessweiten Registry.
+    Geladen wird nur, wenn sich die Dateien auf der Platte geändert haben.
+    Bevorzugt wird der NumPy-Export (kein TensorFlow im Hot Path).
+    """
+    registry = get_registry(MODEL_PATH, SCALER_PATH, THRESHOLD_PATH, WEIGHTS_PATH, URL_VOCAB_PATH,
+                            versions=model_versions)
+    snapshot = registry.get()
+    if registry.last_error is not None:
+        level = "error" if snapshot is None else "warning"
+        add_message(f"Failed to (re)load model: {registry.last_error}", level)
+    return snapshot
+
+def compute_mse(df: pd.DataFrame, snapshot) -> np.ndarray:
+    """
+    Skaliert die Features mit dem Scaler des Snapshots und berechnet den
+    Rekonstruktionsfehler (MSE) pro Zeile. url_num wird mit dem URL-Vokabular
+    des Modells kodiert; bereits gescorte Feature-Vektoren kommen aus dem Cache.
+    """
+    X = model_features(snapshot, df[FEATURE_COLS].astype(float).to_numpy(), df["url"])
+    return _score_cache.mse(snapshot, X)
+
+def known_bad_mask(df: pd.DataFrame) -> np.ndarray:
+    """Zeilen, deren URL in malicious_patterns.json steht (werden ohne Modell als Anomalie gewertet)."""
+    mask = _prefilter.match(df["url"].tolist())
+    if _prefilter.last_error is not None:
+        add_message(f"Invalid malicious_patterns.json: {_prefilter.last_error}", "warning")
+    return mask
+
+def prefilter_stats():
+    return _prefilter.stats()
+
+def score_cache_stats():
+    return _score_cache.stats()
@@ -1,26 +1,24 @@
 # app/nginx_utils.py
 
 import os
-import subprocess
+import time
 from state import add_message
-
-RELOAD_TRIGGER = "/shared/nginx_reload.trigger"
+from rule_store import get_rule_store, parse_rule_path, parse_rule_cidr
+from score_store import read_json
+from latency import PendingTraces
+from config import RELOAD_TRIGGER, RELOAD_STATUS_PATH, BLOCK_SUGGESTIONS_PATH, LATENCY_TRACES_PATH
 
 def load_existing_rule_paths(rules_path):
     """
-    Extrahiert alle Pfade, die bereits in custom_rules.conf als Blockregel existieren.
+    Alle Pfade, für die bereits eine Blockregel existiert (aus dem Regel-Index,
+    custom_rules.conf wird nicht erneut geparst).
     """
-    existing_paths = set()
-    if os.path.exists(rules_path):
-        with open(rules_path, "r") as f:
-            for line in f:
-                line = line.strip()
-                if line.startswith("location ="):
-                    # Beispiel: location = /admin { deny all; }
-                    parts = line.split()
-                    if len(parts) >= 3:
-                        existing_paths.add(parts[2])
-    return existing_paths
+    return get_rule_store(rules_path).paths()
+
+def filter_uncovered_paths(paths, rules_path):
+    """Nur Pfade, die noch von keiner Regel (exakt, Präfix oder Regex) geblockt werden."""
+    store = get_rule_store(rules_path)
+    return {path for path in paths if not store.covers(path)}
 
 def build_block_rules_from_paths(paths):
     """
@@ -28,56 +26,72 @@ def build_block_rules_from_paths(paths):
     """
     return [f"location = {path} {{ deny all; }}" for path in paths]
 
+def build_block_rules_from_cidrs(cidrs):
+    """
+    Baut für Client-IPs/-Netze Blockregeln (landen im nginx geo-Block).
+    """
+    return [f"deny {cidr};" for cidr in cidrs]
+
 def write_rules_to_file(rules, rules_path):
     """
-    Hängt neue Regeln an die custom_rules.conf an (ohne Doubletten).
+    Übernimmt neue Regeln in den Regel-Index (ohne Doubletten) und erzeugt
+    custom_rules.conf daraus neu (ab vielen Regeln als nginx-map, IPs als geo).
     """
-    existing_rules = set()
-    if os.path.exists(rules_path):
-        with open(rules_path, "r") as f:
-            for line in f:
-                rule = line.strip()
-                if rule:
-                    existing_rules.add(rule)
-    new_rules = [rule for rule in rules if rule.strip() and rule not in existing_rules]
-    if new_rules:
-        with open(rules_path, "a") as f:
-            for rule in new_rules:
-                f.write(rule + "\n")
-    return len(new_rules)
+    store = get_rule_store(rules_path)
+    paths = [p for p in (parse_rule_path(rule) for rule in rules) if p]
+    cidrs = [c for c in (parse_rule_cidr(rule) for rule in rules) if c]
+    new_keys = [p for p in paths if p not in store.rules()] + [c for c in cidrs if not store.covers_cidr(c)]
+    added = store.add(paths)
+    added += store.add_cidrs(cidrs)
+    if added:
+        trace_rules(new_keys)
+    return added
+
+def trace_rules(keys):
+    """
+    Startet bzw. übernimmt die Latenz-Traces neu geschriebener Regeln: Pfade aus
+    den Scorer-Vorschlägen bringen logged/parsed/scored/suggested mit. Abgeschlossen
+    werden die Traces vom Scorer, sobald reload-watcher.sh den Reload meldet.
+    """
+    now = time.time()
+    suggestions = read_json(BLOCK_SUGGESTIONS_PATH, {}) or {}
+    known = {s["path"]: s.get("trace") or {} for s in suggestions.get("suggestions", [])}
+    try:
+        PendingTraces(LATENCY_TRACES_PATH).add({key: {**known.get(key, {}), "rule_written": now} for key in keys})
+    except OSError:
+        pass  # Messung darf das Schreiben der Regeln nicht verhindern
 
 def clear_custom_rules_file(rules_path):
     """
-    Löscht alle Blockregeln (setzt Datei auf leer).
+    Löscht alle Blockregeln (Index und erzeugte Konfiguration).
     """
-    with open(rules_path, "w") as f:
-        pass
+    get_rule_store(rules_path).clear()
 
 def reload_nginx():
     """
-    Reloaded NGINX im Docker-Container 'nginx'.
+    Fordert einen NGINX-Reload an. reload-watcher.sh im nginx-Container fasst
+    Anforderungen zusammen, prüft mit "nginx -t" und meldet das Ergebnis in
+    RELOAD_STATUS_PATH (siehe reload_status()).
     """
-    print("CWD:", os.getcwd())
-    print("shared exists:", os.path.exists("shared"))
-    print("shared absolute:", os.path.abspath("shared"))
     try:
-#        result = subprocess.run(
-#            ["docker", "exec", "nginx", "nginx", "-s", "reload"],
-#            capture_output=True, text=True, check=True
-#        )
-#        add_message("NGINX configuration reloaded successfully!", "info")
-#        return True
-#    except subprocess.CalledProcessError as e:
-#        add_message(f"Failed to reload NGINX: {e.stderr} {e.stdout}", "error")
-#    except Exception as e:
-#        add_message(f"Unexpected error while reloading NGINX: {e}", "error")
-
-       # Schreibe eine leere Datei oder aktualisiere den Timestamp
-       with open(RELOAD_TRIGGER, "w") as f:
-           f.write("reload\n")
-       add_message("NGINX reload trigger file written. Waiting for external reload.", "info")
-       return True
+        # Eine Zeile pro Anforderung (Zeitpunkt), damit der Watcher zusammenfassen
+        # und die Zeit bis zur Durchsetzung messen kann
+        requested = round(time.time(), 3)
+        with open(RELOAD_TRIGGER, "a") as f:
+            f.write(f"{requested:.3f}\n")
+        try:
+            PendingTraces(LATENCY_TRACES_PATH).mark("reload_requested", requested)
+        except OSError:
+            pass
+        add_message("NGINX reload requested.", "info")
+        return True
     except Exception as e:
         add_message(f"Failed to write NGINX reload trigger file: {e}", "error")
     return False
 
+def reload_pending():
+    return os.path.exists(RELOAD_TRIGGER) or os.path.exists(RELOAD_TRIGGER + ".processing")
+
+def reload_status():
+    """Ergebnis des letzten Reloads (dict) oder None, falls noch keiner lief."""
+    return read_json(RELOAD_STATUS_PATH)
@@ -1,21 +1,41 @@
 import streamlit as st
 import os
 import json
-from config import THRESHOLD_PATH
+from config import THRESHOLD_PATH, THRESHOLD_SKETCH_PATH
+from quantile_sketch import QuantileSketch
+from score_store import read_json, write_json_atomic
+from model_utils import model_versions
 
 def threshold_slider_col():
     """
     Zeigt einen Slider für den Anomaly-Threshold an, lädt und speichert den Wert in THRESHOLD_PATH.
+    Im Modus "Percentile" wird der Threshold als Quantil des Fehler-Sketches des
+    Trainers gewählt; der Trainer kalibriert ihn dann bei neuen Daten nach.
+    Der Wert gilt für die aktive Modellversion; nach einem Versionswechsel
+    greift der mit der Version veröffentlichte Threshold.
     """
     threshold = 0.0
+    current = {}
     if os.path.exists(THRESHOLD_PATH):
         try:
             with open(THRESHOLD_PATH) as f:
-                threshold = float(json.load(f).get("threshold", 0.0))
+                current = json.load(f)
+            threshold = float(current.get("threshold", 0.0))
         except Exception as e:
             st.warning(f"Fehler beim Laden des Thresholds: {e}")
 
     st.markdown("**Anomaly threshold**")
+    sketch_data = read_json(THRESHOLD_SKETCH_PATH)
+    sketch = QuantileSketch.from_dict(sketch_data) if sketch_data else None
+    if sketch is not None and sketch.count > 0:
+        threshold_mode = st.radio(
+            "Threshold mode", ("Absolute", "Percentile"), horizontal=True,
+            index=1 if current.get("method") == "quantile" else 0, key="threshold_mode",
+        )
+        if threshold_mode == "Percentile":
+            percentile_slider(current, sketch)
+            return
+
     min_slider = 0.0
     max_slider = threshold * 10 if threshold > 0 else 1.0
     if min_slider < max_slider:
@@ -31,8 +51,9 @@ def threshold_slider_col():
             )
             if new_threshold != threshold:
                 try:
-                    with open(THRESHOLD_PATH, "w") as f:
-                        json.dump({"threshold": new_threshold}, f)
+                    write_json_atomic(THRESHOLD_PATH, {
+                        "threshold": new_threshold, "method": "manual", "version": model_versions.current(),
+                    })
                     st.info(f"Threshold updated to {new_threshold:.2f}.")
                 except Exception as e:
                     st.error(f"Failed to save new threshold: {e}")
@@ -40,3 +61,27 @@ def threshold_slider_col():
             st.error(f"Failed to display slider: {e}")
     else:
         st.info("Threshold range too small for slider or was not set.")
+
+def percentile_slider(current, sketch):
+    """Threshold als Perzentil der Rekonstruktionsfehler im Normalbetrieb."""
+    percentile = float(current.get("quantile", 0.999)) * 100 if current.get("method") == "quantile" else 99.9
+    new_percentile = st.slider(
+        "Percentile of normal traffic",
+        min_value=90.0,
+        max_value=99.99,
+        value=min(max(percentile, 90.0), 99.99),
+        step=0.01,
+        format="%.2f",
+        key="threshold_percentile_slider"
+    )
+    threshold = sketch.quantile(new_percentile / 100)
+    st.caption(f"Threshold {threshold:.4f} · sketch of {sketch.count:.0f} errors")
+    if current.get("method") != "quantile" or abs(new_percentile - percentile) > 1e-9:
+        try:
+            write_json_atomic(THRESHOLD_PATH, {
+                "threshold": threshold, "method": "quantile", "quantile": new_percentile / 100,
+                "version": model_versions.current(),
+            })
+            st.info(f"Threshold set to the {new_percentile:.2f}th percentile ({threshold:.4f}).")
+        except Exception as e:
+            st.error(f"Failed to save new threshold: {e}")
@@ -1,32 +1,57 @@
 import streamlit as st
 import os
-import shutil
+import time
+import numpy as np
+import pandas as pd
 from config import (
     TRAINING_TRIGGER,
     ATTACK_TRIGGER,
-    MODEL_PATH,
     MODEL_REF_PATH,
+    SCALER_REF_PATH,
+    WEIGHTS_REF_PATH,
+    URL_VOCAB_REF_PATH,
     CUSTOM_RULES_PATH,
     MALICIOUS_DURATION,
+    LATENCY_METRICS_PATH,
+    SCORER_STATUS_PATH,
+    LOG_WINDOW_LINES,
+    LOG_PAGE_ROWS,
 )
 from state import add_message
+from log_utils import CATEGORIES, log_window
+from model_utils import model_versions
+from model_versions import REFERENCE_VERSION
+from latency import STAGES
+from control_bus import ATTACK, TRAINING_MODE, describe_acks, publish
+from score_store import read_json
 from nginx_utils import (
     clear_custom_rules_file,
     reload_nginx,
+    reload_pending,
+    reload_status,
     write_rules_to_file,  # NEU: Importiere die neue Funktion!
 )
 
+def notify(type, data):
+    """Meldet eine Zustandsänderung über den Steuerbus; die Trigger-Datei ist dann schon geschrieben."""
+    try:
+        return describe_acks(*publish(type, data, sender="streamlit"))
+    except OSError as e:
+        return f"control bus unavailable ({e}), services pick up the trigger file"
+
 def mode_switch_col():
     mode = st.radio("Mode", ("Training", "Inference"), horizontal=True, key="mode_radio")
     training_mode = os.path.exists(TRAINING_TRIGGER)
     if mode == "Training" and not training_mode:
         try:
             open(TRAINING_TRIGGER, "w").close()
+            add_message(f"Training mode on: {notify(TRAINING_MODE, {'enabled': True})}.", "info")
         except Exception as e:
             add_message(f"Could not activate training mode: {e}", "warning")
     elif mode == "Inference" and training_mode:
         try:
             os.remove(TRAINING_TRIGGER)
+            add_message(f"Training mode off: {notify(TRAINING_MODE, {'enabled': False})}.", "info")
         except Exception as e:
             add_message(f"Could not deactivate training mode: {e}", "warning")
     return mode
@@ -47,12 +72,14 @@ def attack_button_col(mode):
             try:
                 os.remove(TRAINING_TRIGGER)
                 st.session_state["mode_radio"] = "Inference"
+                notify(TRAINING_MODE, {"enabled": False})
                 add_message("Automatically switched to inference mode to avoid training the model with attack data.", "info")
             except Exception as e:
                 add_message(f"Could not deactivate training mode: {e}", "warning")
         with open(ATTACK_TRIGGER, "w") as f:
             f.write("go")
-        add_message("Malicious traffic is being generated! Watch the log entries.", "info")
+        acks = notify(ATTACK, {"duration": MALICIOUS_DURATION})
+        add_message(f"Malicious traffic is being generated ({acks})! Watch the log entries.", "info")
     if mode == "Training":
         st.info("In training mode, generating attacks is disabled.")
 
@@ -64,27 +91,98 @@ def attack_status_col(attack_running):
     )
 
 def copy_model_col():
-    if st.button("Copy reference model", key="copy_model_btn"):
+    """
+    Schaltet auf das Referenzmodell bzw. den vorherigen Stand um. Das ist nur ein
+    Wechsel des Versionszeigers, das aktive Modell wird nie überschrieben.
+    """
+    if st.button("Use reference model", key="copy_model_btn"):
+        try:
+            if not model_versions.exists(REFERENCE_VERSION):
+                if not os.path.exists(MODEL_REF_PATH):
+                    add_message("Reference model not found.", "warning")
+                    return
+                # Einmalig als Version übernehmen; ohne eigenes Vokabular gilt die feste URL_MAP
+                model_versions.import_files({
+                    "model": MODEL_REF_PATH,
+                    "scaler": SCALER_REF_PATH,
+                    "weights": WEIGHTS_REF_PATH,
+                    "vocab": URL_VOCAB_REF_PATH,
+                }, REFERENCE_VERSION)
+            model_versions.publish(REFERENCE_VERSION)
+            add_message("Switched to the reference model.", "info")
+        except Exception as e:
+            add_message(f"Error switching to reference model: {e}", "error")
+    if st.button("Roll back model", key="rollback_model_btn"):
         try:
-            if os.path.exists(MODEL_REF_PATH):
-                shutil.copy(MODEL_REF_PATH, MODEL_PATH)
-                add_message("Reference model copied to current model.", "info")
+            version = model_versions.rollback()
+            if version:
+                add_message(f"Rolled back to model version {version}.", "info")
             else:
-                add_message("Reference model not found.", "warning")
+                add_message("No previous model version available.", "warning")
         except Exception as e:
-            add_message(f"Error copying reference model: {e}", "error")
+            add_message(f"Error rolling back model: {e}", "error")
 
 def clear_rules_col():
     if st.button("Clear custom_rules.conf", key="clear_rules_btn"):
         try:
             clear_custom_rules_file(CUSTOM_RULES_PATH)
             if reload_nginx():
-                add_message("custom_rules.conf has been cleared and NGINX reloaded.", "info")
+                add_message("custom_rules.conf has been cleared, NGINX reload requested.", "info")
             else:
-                add_message("custom_rules.conf has been cleared, but NGINX reload failed.", "warning")
+                add_message("custom_rules.conf has been cleared, but the NGINX reload could not be requested.", "warning")
         except Exception as e:
             add_message(f"Error clearing custom_rules.conf: {e}", "error")
 
+def reload_status_col():
+    """Ergebnis des letzten NGINX-Reloads aus reload-watcher.sh (inkl. nginx -t)."""
+    if reload_pending():
+        st.caption("NGINX reload pending ...")
+        return
+    status = reload_status()
+    if not status:
+        return
+    enforce = ""
+    if status.get("requested_first"):
+        enforce = f" · enforced {status['finished_ms'] / 1000 - status['requested_first']:.1f}s after request"
+    if status.get("ok"):
+        st.caption(
+            f"Last NGINX reload OK in {status.get('duration_ms')} ms "
+            f"({status.get('requests')} request(s) coalesced){enforce}"
+        )
+    else:
+        st.error(f"Last NGINX reload failed, previous config still active: {status.get('message')}")
+
+def rule_merges_col():
+    """Vom Scorer zusammengefasste Blockregeln (welche exakten Pfade durch welche Regel ersetzt wurden)."""
+    merges = (read_json(SCORER_STATUS_PATH, {}) or {}).get("rule_merges") or []
+    for merge in merges[-3:]:
+        st.caption(
+            f"Rules merged at {time.strftime('%H:%M:%S', time.localtime(merge['time']))}: "
+            f"{', '.join(merge['members'])} → {merge['rule']}"
+        )
+
+def latency_panel_col():
+    """
+    Latenz von der Logzeile bis zur durchgesetzten Regel (p50/p95/p99 pro Station),
+    aus den Histogrammen des Scorers. Export für Prometheus: scorer:9108/metrics.
+    """
+    summary = (read_json(LATENCY_METRICS_PATH, {}) or {}).get("summary")
+    if not summary or not summary.get("completed"):
+        st.caption("No detection-to-enforcement traces completed yet.")
+        return
+    fmt = lambda v: "-" if v is None else f"{v:.2f}"  # noqa: E731
+    rows = [
+        {"stage": f"{previous} → {stage}", "count": summary["stages"][stage]["count"],
+         "p50 (s)": fmt(summary["stages"][stage]["p50"]), "p95 (s)": fmt(summary["stages"][stage]["p95"]),
+         "p99 (s)": fmt(summary["stages"][stage]["p99"])}
+        for previous, stage in zip(STAGES, STAGES[1:])
+    ]
+    total = summary["total"]
+    rows.append({"stage": "total (log line → reload done)", "count": total["count"],
+                 "p50 (s)": fmt(total["p50"]), "p95 (s)": fmt(total["p95"]), "p99 (s)": fmt(total["p99"])})
+    st.dataframe(pd.DataFrame(rows).set_index("stage"))
+    st.caption(f"{summary['completed']} traces completed, {summary['expired']} expired without reload")
+
 def block_suggestions_col():
     """
     Zeigt die aktuellen Blockregel-Vorschläge an und bietet den 'Apply and Reload NGINX'-Button.
@@ -99,24 +197,63 @@ def block_suggestions_col():
             try:
                 num_written = write_rules_to_file(block_suggestions, CUSTOM_RULES_PATH)
                 if num_written > 0:
-                    msg = f"{num_written} neue Regel{'n' if num_written > 1 else ''} übernommen und NGINX neu geladen."
+                    msg = f"{num_written} neue Regel{'n' if num_written > 1 else ''} übernommen, NGINX-Reload angefordert."
                 else:
                     msg = "Keine neuen Regeln übernommen (alle Regeln bereits vorhanden)."
                 if reload_nginx():
                     add_message(msg, "info")
                 else:
-                    add_message(msg + " Aber: NGINX reload fehlgeschlagen.", "warning")
+                    add_message(msg + " Aber: NGINX-Reload konnte nicht angefordert werden.", "warning")
                 st.session_state["block_suggestions"] = []  # Vorschlagsliste leeren
             except Exception as e:
                 add_message(f"Fehler beim Übernehmen der Regeln: {e}", "error")
 
-def color_row(row):
-    if row.get('status', None) == 403:
-        return ['background-color: #FF0000; color: white; font-weight: bold'] * len(row)
-    elif row.get('anomaly', False):
-        return ['background-color: #FFA500; color: black; font-weight: bold'] * len(row)
-    elif row.get('status', None) == 200:
-        return ['background-color: #90EE90; color: black'] * len(row)
-    else:
-        return [''] * len(row)
+CATEGORY_STYLES = {
+    "blocked": "background-color: #FF0000; color: white; font-weight: bold",
+    "anomaly": "background-color: #FFA500; color: black; font-weight: bold",
+    "ok": "background-color: #90EE90; color: black",
+    "other": "",
+}
+# Große Tabelle (st.dataframe): keine Zellstile, Farbe als Markierung in der Kategoriespalte
+CATEGORY_LABELS = {"blocked": "🟥 blocked", "anomaly": "🟧 anomaly", "ok": "🟩 ok", "other": "⬜ other"}
+
+def row_styles(df):
+    """Für Styler.apply(axis=None): CSS aller Zellen aus der Spalte 'category' in einem Schritt."""
+    css = df["category"].map(CATEGORY_STYLES).to_numpy(dtype=object)
+    return pd.DataFrame(np.repeat(css[:, None], df.shape[1], axis=1), index=df.index, columns=df.columns)
+
+def log_window_col():
+    """
+    Große Tabelle der letzten LOG_WINDOW_LINES gescorten Zeilen, neueste zuerst.
+    Der Browser bekommt pro Refresh nur die gewählte Seite als Arrow-Tabelle;
+    st.dataframe scrollt darin virtuell. Ohne "Follow" bleibt das Fenster
+    eingefroren, damit ein Burst in Ruhe durchgeblättert werden kann.
+    """
+    if not st.checkbox(f"Investigate the last {LOG_WINDOW_LINES:,} scored rows", key="log_window_on"):
+        st.session_state.pop("log_window_frozen", None)
+        return
+    follow = st.checkbox("Follow new rows", value=True, key="log_window_follow")
+    if follow or "log_window_frozen" not in st.session_state:
+        st.session_state["log_window_frozen"] = log_window(LOG_WINDOW_LINES)
+    df = st.session_state["log_window_frozen"]
+    if df.empty:
+        st.info("The large log window needs the scorer service; no scored rows yet.")
+        return
+    counts = df["category"].value_counts()
+    st.caption(" · ".join(f"{CATEGORY_LABELS[c]} {counts[c]:,}" for c in CATEGORIES) +
+               f" · lines {df['Line'].iat[0]:,}–{df['Line'].iat[-1]:,}")
+    selected = st.multiselect("Show", CATEGORIES, default=list(CATEGORIES), key="log_window_categories")
+    view = df[df["category"].isin(selected)].iloc[::-1]
+    pages = max(1, -(-len(view) // LOG_PAGE_ROWS))
+    if st.session_state.get("log_window_page", 1) > pages:
+        st.session_state["log_window_page"] = pages
+    # Fester Label-Text: ändert er sich, legt Streamlit ein neues Widget an und springt auf Seite 1
+    page = st.number_input("Page", min_value=1, max_value=pages, key="log_window_page",
+                           help=f"{LOG_PAGE_ROWS} rows per page, newest first")
+    st.caption(f"Page {page} of {pages} · {len(view):,} rows shown")
+    rows = view.iloc[(page - 1) * LOG_PAGE_ROWS:page * LOG_PAGE_ROWS]
+    # Nur Parameter, die auch ältere Streamlit-Wheels aus docker_wheels kennen
+    table = rows[["Line", "category", "time", "ip", "method", "url", "status", "size", "mse"]].set_index("Line")
+    st.dataframe(table.assign(category=table["category"].map(CATEGORY_LABELS), mse=table["mse"].round(4)),
+                 height=420)
 
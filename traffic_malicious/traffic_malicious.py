@@ -1,48 +1,38 @@
-import requests
 import time
-import random
 import os
 from shared_code.config import (
     ATTACK_TRIGGER,
     MALICIOUS_DURATION,
-    MALICIOUS_RATE,
     NGINX_HOST,
 )
- 
-# Feste Auswahl an "maliziösen" Methoden und URLs
-MALICIOUS_METHODS = ["POST", "PUT", "DELETE"]
-MALICIOUS_URLS = [
-    "/admin",
-    "/wp-login.php",
-    "/api/secret",
-    "/etc/passwd",
-    "/.env",
-    "/login?user=admin'--",
-    "/index.php?page=../../../../etc/passwd",
-    "/cgi-bin/test.cgi",
-    "/config.php",
-    "/hidden"
-]
+from loadgen import run_profile
+from control_bus import ATTACK, RESYNC_INTERVAL, open_subscriber
 
-while True:
-    if os.path.exists(ATTACK_TRIGGER):
-        print("Malicious traffic started!")
-        end_time = time.time() + MALICIOUS_DURATION
-        while time.time() < end_time:
-            method = random.choice(MALICIOUS_METHODS)
-            path = random.choice(MALICIOUS_URLS)
-            url = NGINX_HOST + path
+# Methoden, URLs und Rate stehen im Profil "attack" in /shared/traffic_profiles.json
+ATTACK_PROFILE = os.environ.get("ATTACK_PROFILE", "attack")
+
+def run_attack(duration=MALICIOUS_DURATION):
+    print("Malicious traffic started!")
+    report = run_profile(ATTACK_PROFILE, NGINX_HOST, duration=duration)
+    print(f"Malicious traffic stopped: {report['requests']} requests, {report['rps']} req/s, "
+          f"status {report['status']}")
+
+def main():
+    # Der Angriff startet auf die Steuernachricht hin; die Trigger-Datei wird nur
+    # alle RESYNC_INTERVAL Sekunden geprüft (ohne Bus wie bisher alle 0,5 s).
+    bus = open_subscriber("traffic-malicious", [ATTACK])
+    while True:
+        message = bus.receive(timeout=RESYNC_INTERVAL) if bus else None
+        if message is not None:
+            bus.ack(message, detail="attack started")
+        if message is not None or os.path.exists(ATTACK_TRIGGER):
+            run_attack(message.data["duration"] if message else MALICIOUS_DURATION)
             try:
-                requests.request(method, url, timeout=1)
-                print(f"{method} {url}")
+                os.remove(ATTACK_TRIGGER)
             except Exception:
                 pass
-            time.sleep(1.0 / MALICIOUS_RATE)
-        print("Malicious traffic stopped.")
-        try:
-            os.remove(ATTACK_TRIGGER)
-        except Exception:
-            pass
-    else:
-        time.sleep(0.5)
+        elif bus is None:
+            time.sleep(0.5)
 
+if __name__ == "__main__":
+    main()
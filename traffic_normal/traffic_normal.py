@@ -1,31 +1,17 @@
-import requests
-import time
-import random
+import os
+from loadgen import run_profile
 
 TARGET_URL = "http://nginx"  # Passe ggf. an, je nach Compose-Setup
-
-NORMAL_PATHS = [
-    "/",
-    "/about",
-    "/index.html",
-    "/static/logo.png",
-    "/static/style.css",
-    "/contact",
-    "/help",
-    "/favicon.ico"
-]
+# Lastprofil aus /shared/traffic_profiles.json ("normal" = 1 Anfrage/s wie bisher,
+# "mixed"/"stress" für Lasttests mit tausenden Anfragen/s)
+TRAFFIC_PROFILE = os.environ.get("TRAFFIC_PROFILE", "normal")
 
 def send_normal_traffic():
     while True:
-        path = random.choice(NORMAL_PATHS)
-        url = f"{TARGET_URL}{path}"
-        try:
-            response = requests.get(url)
-            print(f"Sent GET {path}, status: {response.status_code}")
-        except Exception as e:
-            print(f"Error requesting {url}: {e}")
-        time.sleep(1)
+        report = run_profile(TRAFFIC_PROFILE, TARGET_URL)
+        # Profile mit begrenzter Dauer: Bericht ausgeben und erneut starten
+        print(f"Profil {TRAFFIC_PROFILE} beendet: {report['rps']} req/s, "
+              f"p99 {report['latency_ms']['p99']} ms, {report['errors']} Fehler")
 
 if __name__ == "__main__":
     send_normal_traffic()
-
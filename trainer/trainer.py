@@ -3,70 +3,343 @@ import numpy as np
 import tensorflow as tf
 import os
 import time
-import re
 import json
+import math
+import shutil
+from collections import Counter
 from sklearn.preprocessing import MinMaxScaler
+from numpy_engine import export_autoencoder
+from log_tail import LogTailer
+from log_parser import FEATURE_COLS, parse_block, to_dataframe, iter_file_blocks
+from log_ingest import aggregate_block, aggregate_logs
+from feature_store import FeatureStore, store_columns
+from quantile_sketch import QuantileSketch
+from score_store import read_json, write_json_atomic
+from url_vocab import UrlVocab, load_vocab, url_encoder
+from model_versions import FILES, ModelVersions
+from background_job import BackgroundJob
+from control_bus import FULL_RETRAIN, TRAINING_MODE, open_subscriber
+from config import (
+    LOGFILE_PATH, MODEL_PATH, THRESHOLD_PATH, SCALER_PATH, TRAINING_TRIGGER, FULL_RETRAIN_TRIGGER,
+    TRAINER_STATE_PATH, FEATURE_STORE_DIR, THRESHOLD_SKETCH_PATH, URL_VOCAB_PATH, MODEL_VERSIONS_DIR,
+    MODEL_CURRENT_PATH,
+)
 
-LOGFILE = "/logs/access.log"
-MODEL_PATH = "/model/autoencoder_model.h5"
-THRESHOLD_PATH = "/model/autoencoder_threshold.json"
-TRAINING_TRIGGER = "/shared/training_mode"
-SCALER_PATH = "/model/autoencoder_scaler.pkl"
+# "incremental": nur neue Logzeilen, Fine-Tuning des bestehenden Modells
+# "full": bei jeder Logänderung komplett neu trainieren (bisheriges Verhalten)
+TRAINER_MODE = os.environ.get("TRAINER_MODE", "incremental")
+INCREMENTAL_READ_BYTES = 64 << 20
+FINETUNE_EPOCHS = 3
+# Höchstens so viele Epochen; vorher Abbruch, sobald der Loss nicht mehr sinkt
+TRAIN_MAX_EPOCHS = int(os.environ.get("TRAIN_MAX_EPOCHS", 50))
+EARLY_STOPPING_PATIENCE = 3
+EARLY_STOPPING_MIN_DELTA = 1e-5
+# Mindestanzahl Optimizer-Schritte pro Epoche: nach der Deduplizierung gibt es
+# oft nur wenige verschiedene Vektoren, eine Epoche wäre sonst nur ein Batch.
+MIN_STEPS_PER_EPOCH = 50
+# Batchgröße wächst mit der Anzahl verschiedener Vektoren (Zweierpotenz)
+MIN_BATCH_SIZE = 32
+MAX_BATCH_SIZE = 4096
+# Ein laufendes Full-Retrain wird neu gestartet, wenn das Log seit dem Start um
+# diesen Anteil und mindestens TRAINER_PREEMPT_MIN_BYTES gewachsen ist
+# (0 = nie, nur Trigger/Ende der Trainingsphase). Ohne veröffentlichtes Modell nie.
+TRAINER_PREEMPT_GROWTH = float(os.environ.get("TRAINER_PREEMPT_GROWTH", 0.5))
+TRAINER_PREEMPT_MIN_BYTES = int(os.environ.get("TRAINER_PREEMPT_MIN_BYTES", 64 << 20))
+JOB_POLL_INTERVAL = 1
+# Prozesse für das Einlesen beim Full-Retrain (0 = alle CPUs)
+TRAINER_WORKERS = int(os.environ.get("TRAINER_WORKERS", 0)) or os.cpu_count() or 1
+# Rotierte Logs (access.log.1, access.log.2.gz, ...) beim Full-Retrain mitlesen
+TRAINER_INCLUDE_ROTATED = os.environ.get("TRAINER_INCLUDE_ROTATED", "0") == "1"
+# "store": Full-Retrain aus dem Feature-Store des Scorers (nur Zeilen aus dem
+# Trainingsmodus, kein erneutes Parsen), "log": aus dem Textlog
+TRAINER_SOURCE = os.environ.get("TRAINER_SOURCE", "log")
+# Zeitfenster für das Training aus dem Feature-Store in Sekunden (0 = alles)
+TRAINER_WINDOW_SECONDS = float(os.environ.get("TRAINER_WINDOW_SECONDS", 0))
+# "std": Threshold = mean + 3*std, "quantile": Quantil des Fehler-Sketches
+THRESHOLD_MODE = os.environ.get("THRESHOLD_MODE", "std")
+THRESHOLD_QUANTILE = float(os.environ.get("THRESHOLD_QUANTILE", 0.999))
+# Unterhalb dieser (gewichteten) Anzahl Fehlerwerte ist das Quantil zu unsicher
+THRESHOLD_MIN_COUNT = 1000
+VERSIONS = ModelVersions(MODEL_VERSIONS_DIR, MODEL_CURRENT_PATH)
+# Steuerbus (erst in der Hauptschleife geöffnet, nicht im Worker-Prozess)
+_bus = None
+_full_retrain_message = False
 
 def extract_features(logfile_path):
-    pattern = re.compile(
-        r'(?P<ip>\S+) \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<method>\S+) (?P<url>\S+) \S+" (?P<status>\d+) (?P<size>\d+)'
-    )
-    data = []
-    # Mapping nach deinen echten Logdaten!
-    url_map = {
-        '/': 0,
-        '/index.html': 1,
-        '/about': 2,
-        '/contact': 3,
-        '/help': 4,
-        '/favicon.ico': 5,
-        '/static/logo.png': 6,
-        '/static/style.css': 7
-    }
     try:
-        with open(logfile_path) as f:
-            lines = f.readlines()
-            for line in lines:
-                m = pattern.search(line)
-                if m:
-                    entry = m.groupdict()
-                    entry['method_num'] = 0 if entry['method'] == 'GET' else 1
-                    entry['url_num'] = url_map.get(entry['url'], 99)
-                    entry['status'] = int(entry['status'])
-                    entry['size'] = int(entry['size'])
-                    data.append(entry)
+        frames = [to_dataframe(parse_block(block)) for block in iter_file_blocks(logfile_path)]
     except Exception as e:
         print(f"Fehler beim Lesen des Logfiles: {e}")
         return pd.DataFrame()
-    df = pd.DataFrame(data)
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
     return df
 
-def safe_model_save(model, path, retries=5, delay=2):
-    for i in range(retries):
-        try:
-            model.save(path)
-            return
-        except BlockingIOError:
-            print(f"Speichern blockiert, versuche erneut ({i+1}/{retries}) ...")
-            time.sleep(delay)
-    raise RuntimeError("Konnte Modell nach mehreren Versuchen nicht speichern!")
-
-def train_and_save_model():
+def counter_to_arrays(counter, url_vocab=None):
+    """
+    Zählung {(method_num, url, status, size): n} -> (X_unique, counts). url wird
+    mit dem URL-Vokabular (sonst URL_MAP) kodiert; Tupel, die danach gleich
+    sind, werden zusammengefasst.
+    """
+    if not counter:
+        return np.empty((0, len(FEATURE_COLS))), np.empty(0)
+    methods, urls, statuses, sizes = zip(*counter.keys())
+    X = np.column_stack([methods, url_encoder(url_vocab)(urls), statuses, sizes]).astype(float)
+    weights = np.fromiter(counter.values(), dtype=float, count=len(counter))
+    X_unique, inverse = np.unique(X, axis=0, return_inverse=True)
+    return X_unique, np.bincount(inverse.ravel(), weights=weights)
+
+def url_counts(counter):
+    """Häufigkeit jeder URL in einer Zählung aus aggregate_block."""
+    counts = Counter()
+    for (_, url, _, _), n in counter.items():
+        counts[url] += n
+    return counts
+
+def aggregate_features(logfile_path, include_rotated=TRAINER_INCLUDE_ROTATED):
+    """
+    Liest das Logfile parallel in Blöcken und zählt identische Tupel
+    (method_num, url, status, size). Gibt (counter, live_state) zurück; der
+    Speicherbedarf hängt nur von der Anzahl verschiedener Tupel ab, live_state
+    ist der Lesestand für den LogTailer.
+    """
+    try:
+        return aggregate_logs(logfile_path, TRAINER_WORKERS, include_rotated)
+    except Exception as e:
+        print(f"Fehler beim Lesen des Logfiles: {e}")
+        return Counter(), None
+
+def aggregate_store_features(ts_from=None, ts_to=None):
+    """
+    Zählt die Tupel (method_num, url, status, size) der im Trainingsmodus
+    gescorten Zeilen im Zeitfenster [ts_from, ts_to] aus dem Feature-Store.
+    """
+    records = FeatureStore(FEATURE_STORE_DIR).read_time_range(ts_from, ts_to, training_only=True)
+    counter = Counter()
+    if len(records):
+        # url_num im Store stammt evtl. von einem älteren Vokabular, daher die URL zählen
+        columns = store_columns(records)
+        counter.update(zip(
+            columns["method_num"].tolist(), columns["url"].tolist(),
+            columns["status"].tolist(), columns["size"].tolist(),
+        ))
+    return counter
+
+def read_new_features(tailer, url_vocab=None):
+    """Aggregiert alle seit dem letzten Aufruf angehängten Zeilen über den Tailer."""
+    counter = Counter()
+    while True:
+        _, _, data = tailer.read_block()
+        if not data:
+            break
+        aggregate_block(data, counter)
+    return counter_to_arrays(counter, url_vocab)
+
+def error_stats(mse, weights):
+    """Gewichtete Zählung, Mittelwert und M2 (Summe der Abweichungsquadrate) der Fehler."""
+    count = float(np.sum(weights))
+    mean = float(np.average(mse, weights=weights))
+    m2 = float(np.sum(weights * np.square(mse - mean)))
+    return {"count": count, "mean": mean, "m2": m2}
+
+def merge_error_stats(a, b):
+    """Kombiniert zwei error_stats (paralleler Welford/Chan-Algorithmus)."""
+    if not a or a["count"] == 0:
+        return b
+    count = a["count"] + b["count"]
+    delta = b["mean"] - a["mean"]
+    mean = a["mean"] + delta * b["count"] / count
+    m2 = a["m2"] + b["m2"] + delta * delta * a["count"] * b["count"] / count
+    return {"count": count, "mean": mean, "m2": m2}
+
+def threshold_from_stats(stats):
+    return float(stats["mean"] + 3 * math.sqrt(stats["m2"] / stats["count"]))
+
+def adaptive_batch_size(n_rows):
+    """Etwa n_rows/64, als Zweierpotenz zwischen MIN_BATCH_SIZE und MAX_BATCH_SIZE."""
+    size = 2 ** round(math.log2(max(n_rows / 64, 1)))
+    return int(min(MAX_BATCH_SIZE, max(MIN_BATCH_SIZE, size)))
+
+def make_dataset(X_scaled, counts, batch_size):
+    """
+    tf.data-Pipeline über die deduplizierten Vektoren mit den Häufigkeiten als
+    sample_weight (normiert auf Mittelwert 1): gemischt, endlos wiederholt,
+    gebatcht und vorausgeladen. Die Epochenlänge legt steps_per_epoch fest.
+    """
+    X = X_scaled.astype(np.float32)
+    sample_weight = (counts / counts.mean()).astype(np.float32)
+    dataset = tf.data.Dataset.from_tensor_slices((X, X, sample_weight))
+    return (dataset.shuffle(min(len(X), 1 << 16), reshuffle_each_iteration=True)
+            .repeat()
+            .batch(batch_size)
+            .prefetch(tf.data.AUTOTUNE))
+
+class EpochMetrics(tf.keras.callbacks.Callback):
+    """Loggt Dauer, Loss und Durchsatz (Vektoren/s) jeder Epoche."""
+
+    def __init__(self, samples_per_epoch):
+        super().__init__()
+        self.samples_per_epoch = samples_per_epoch
+        self.epoch_start = 0.0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = time.perf_counter() - self.epoch_start
+        print(f"Epoche {epoch + 1}: loss {logs.get('loss', float('nan')):.6f}, {seconds:.2f}s, "
+              f"{self.samples_per_epoch / max(seconds, 1e-9):.0f} Vektoren/s")
+
+def fit_weighted(model, X_scaled, counts, max_epochs):
+    """
+    Trainiert über make_dataset mit adaptiver Batchgröße und bricht ab, sobald
+    der Loss EARLY_STOPPING_PATIENCE Epochen nicht mehr sinkt (beste Gewichte
+    werden wiederhergestellt). Gibt Epochen, Dauer und letzten Loss zurück.
+    """
+    batch_size = adaptive_batch_size(len(X_scaled))
+    steps_per_epoch = max(MIN_STEPS_PER_EPOCH, math.ceil(len(X_scaled) / batch_size))
+    early_stopping = tf.keras.callbacks.EarlyStopping(
+        monitor="loss", min_delta=EARLY_STOPPING_MIN_DELTA, patience=EARLY_STOPPING_PATIENCE,
+        restore_best_weights=True,
+    )
+    start = time.perf_counter()
+    history = model.fit(
+        make_dataset(X_scaled, counts, batch_size), epochs=max_epochs, steps_per_epoch=steps_per_epoch,
+        callbacks=[early_stopping, EpochMetrics(steps_per_epoch * batch_size)], shuffle=False, verbose=0,
+    )
+    seconds = time.perf_counter() - start
+    epochs = len(history.history.get("loss", []))
+    print(f"Training: {epochs}/{max_epochs} Epochen, Batchgröße {batch_size}, {seconds:.1f}s, "
+          f"{epochs * steps_per_epoch * batch_size / max(seconds, 1e-9):.0f} Vektoren/s")
+    return {"epochs": epochs, "seconds": seconds, "batch_size": batch_size,
+            "loss": history.history["loss"][-1] if epochs else None}
+
+def threshold_data(threshold, method="std", quantile=None, version=None):
+    data = {"threshold": threshold, "method": method}
+    if quantile is not None:
+        data["quantile"] = quantile
+    if version is not None:
+        data["version"] = version
+    return data
+
+def save_threshold(threshold, method="std", quantile=None, version=None):
+    write_json_atomic(THRESHOLD_PATH, threshold_data(threshold, method, quantile, version))
+
+def load_sketch():
+    data = read_json(THRESHOLD_SKETCH_PATH)
+    return QuantileSketch.from_dict(data) if data else QuantileSketch()
+
+def target_quantile():
+    """Quantil aus der Threshold-Datei (im Dashboard gewählt), sonst THRESHOLD_QUANTILE."""
+    current = read_json(THRESHOLD_PATH, {})
+    if current.get("method") == "quantile":
+        return float(current.get("quantile", THRESHOLD_QUANTILE))
+    return THRESHOLD_QUANTILE if THRESHOLD_MODE == "quantile" else None
+
+def update_threshold(stats, sketch):
+    """
+    Speichert den Sketch und bestimmt den Threshold aus dem Sketch (Quantil-Modus)
+    oder mean+3*std. Gibt die Threshold-Daten für publish_model zurück.
+    """
+    write_json_atomic(THRESHOLD_SKETCH_PATH, sketch.to_dict())
+    quantile = target_quantile()
+    if quantile is not None and sketch.count >= THRESHOLD_MIN_COUNT:
+        return threshold_data(sketch.quantile(quantile), "quantile", quantile)
+    return threshold_data(threshold_from_stats(stats))
+
+def recalibrate_threshold():
+    """
+    Quantil-Threshold aus dem gespeicherten Sketch neu berechnen (ohne Training),
+    z.B. nachdem im Dashboard ein anderes Perzentil gewählt wurde.
+    """
+    current = read_json(THRESHOLD_PATH, {})
+    if current.get("method") != "quantile":
+        return  # manuell gesetzter oder mean+3*std-Threshold bleibt unverändert
+    quantile = float(current.get("quantile", THRESHOLD_QUANTILE))
+    sketch = load_sketch()
+    if sketch.count < THRESHOLD_MIN_COUNT:
+        return
+    threshold = sketch.quantile(quantile)
+    if current.get("threshold") != threshold:
+        save_threshold(threshold, "quantile", quantile, current.get("version"))
+        print(f"Threshold neu kalibriert: {quantile:.2%}-Quantil = {threshold:.4f}")
+
+def idle(seconds):
+    """Wartepause beider Trainer-Modi: im Dashboard gewähltes Perzentil übernehmen, dann warten."""
+    recalibrate_threshold()
+    wait_for_control(seconds)
+
+def load_trainer_state():
+    if not os.path.exists(TRAINER_STATE_PATH):
+        return {}
+    try:
+        with open(TRAINER_STATE_PATH) as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Trainer-Status nicht lesbar, starte neu: {e}")
+        return {}
+
+def save_trainer_state(state):
+    tmp_path = TRAINER_STATE_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, TRAINER_STATE_PATH)
+
+def current_model_files():
+    """(Modell, Scaler, URL-Vokabular) des aktiven Stands; ohne Versionen die festen Pfade."""
+    version = VERSIONS.current()
+    if version is None:
+        return MODEL_PATH, SCALER_PATH, URL_VOCAB_PATH
+    return tuple(VERSIONS.path(version, name) for name in ("model", "scaler", "vocab"))
+
+def publish_model(autoencoder, scaler, url_vocab, threshold):
+    """
+    Schreibt Modell, Scaler, NumPy-Export, URL-Vokabular und Threshold in ein
+    privates Staging-Verzeichnis und veröffentlicht es als neue Version: erst
+    wenn alles vollständig auf der Platte liegt, wird der Zeiger umgeschaltet.
+    Gibt die Versionskennung zurück.
+    """
+    import joblib
+    version, staging = VERSIONS.stage()
+    try:
+        model_path = os.path.join(staging, FILES["model"])
+        autoencoder.save(model_path)
+        joblib.dump(scaler, os.path.join(staging, FILES["scaler"]))
+        # Gewichte + Scaler für die NumPy-Inferenz (Dashboard/Scorer ohne TensorFlow)
+        export_autoencoder(autoencoder, scaler, os.path.join(staging, FILES["weights"]), source_path=model_path)
+        if url_vocab is not None:
+            url_vocab.save(os.path.join(staging, FILES["vocab"]))
+        write_json_atomic(os.path.join(staging, FILES["threshold"]), {**threshold, "version": version})
+        VERSIONS.commit(version, staging)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    VERSIONS.publish(version)
+    # Aktueller (im Dashboard änderbarer) Threshold, gilt für diese Version
+    write_json_atomic(THRESHOLD_PATH, {**threshold, "version": version})
+    VERSIONS.prune()
+    return version
+
+def train_and_save_model(counter=None):
+    """
+    Vollständiges Training. Ohne Argumente wird das ganze Logfile gelesen.
+    Das URL-Vokabular wird aus den Trainingsdaten neu gelernt und zusammen mit
+    Modell, Scaler und Threshold als neue Version veröffentlicht. Gibt die Fehlerstatistik (für das inkrementelle
+    Nachtraining) zurück, oder False, wenn keine Trainingsdaten vorliegen.
+    """
     print("Starte Training ...")
-    df = extract_features(LOGFILE)
-    if df.empty:
+    if counter is None:
+        counter, _ = aggregate_features(LOGFILE_PATH)
+    if not counter:
         print("Keine Trainingsdaten gefunden. Training übersprungen.")
         return False
-    feature_cols = ['method_num', 'url_num', 'status', 'size']
-    X_train = df[feature_cols].astype(float).to_numpy()
+    url_vocab = UrlVocab.build(url_counts(counter))
+    X_train, counts = counter_to_arrays(counter, url_vocab)
+    print(f"URL-Vokabular: {len(url_vocab.paths)} Pfade, {len(url_vocab.segments)} Segmente, "
+          f"{url_vocab.buckets} Hash-Buckets")
 
-    # Normalisierung mit MinMaxScaler
+    # Normalisierung mit MinMaxScaler (Min/Max hängen nicht von den Häufigkeiten ab)
     scaler = MinMaxScaler()
     X_train_scaled = scaler.fit_transform(X_train)
 
@@ -74,11 +347,7 @@ def train_and_save_model():
     print("Min/Max nach Skalierung:", X_train_scaled.min(), X_train_scaled.max())
     print("Beispielwerte nach Skalierung:", X_train_scaled[:5])
 
-    # Optional: Scaler speichern, falls du ihn für spätere Inferenz brauchst
-    import joblib
-    joblib.dump(scaler, SCALER_PATH)
-
-    print(f"Trainingsdaten: {X_train_scaled.shape[0]} Zeilen (normalisiert)")
+    print(f"Trainingsdaten: {int(counts.sum())} Zeilen, {len(X_train_scaled)} verschiedene Vektoren (normalisiert)")
 
     # Einfacher Autoencoder
     inputs = tf.keras.Input(shape=(4,))
@@ -87,48 +356,259 @@ def train_and_save_model():
     autoencoder = tf.keras.Model(inputs, decoded)
 
     autoencoder.compile(optimizer="adam", loss=tf.keras.losses.MeanSquaredError())
-    autoencoder.fit(X_train_scaled, X_train_scaled, epochs=10, batch_size=32, verbose=0)
-    safe_model_save(autoencoder, MODEL_PATH)
-    print(f"Modell gespeichert ({MODEL_PATH})")
+    fit_weighted(autoencoder, X_train_scaled, counts, max_epochs=TRAIN_MAX_EPOCHS)
 
-    reconstructions = autoencoder.predict(X_train_scaled)
+    reconstructions = autoencoder.predict(X_train_scaled, verbose=0)
     mse = np.mean(np.power(X_train_scaled - reconstructions, 2), axis=1)
-    # Threshold-Berechnung und Fallback
-    if len(mse) == 0:
-        threshold = 0.1  # Fallback, falls keine Daten
+    # Threshold aus der gewichteten Verteilung: mean+3*std über alle Zeilen oder,
+    # im Quantil-Modus, aus dem (neuen) Sketch der Rekonstruktionsfehler
+    stats = error_stats(mse, counts)
+    threshold = update_threshold(stats, QuantileSketch().add(mse, counts))
+    version = publish_model(autoencoder, scaler, url_vocab, threshold)
+    print(f"Modell veröffentlicht (Version {version}), Threshold (MSE): {threshold['threshold']:.4f}")
+    return stats
+
+def incremental_update(X_new, counts, stats, url_vocab=None):
+    """
+    Nachtraining nur mit neuen Daten: Scaler per partial_fit erweitern,
+    bestehendes Modell warm starten und ein paar Epochen fine-tunen,
+    Threshold über die laufende Mittelwert/Varianz-Statistik fortschreiben.
+    Gibt die aktualisierte Statistik zurück.
+    """
+    import joblib
+    model_path, scaler_path, _ = current_model_files()
+    scaler = joblib.load(scaler_path)
+    old_range = (scaler.data_min_.copy(), scaler.data_max_.copy())
+    scaler.partial_fit(X_new)
+    range_changed = not (np.array_equal(old_range[0], scaler.data_min_)
+                         and np.array_equal(old_range[1], scaler.data_max_))
+    X_scaled = scaler.transform(X_new)
+
+    autoencoder = tf.keras.models.load_model(model_path, compile=False)
+    autoencoder.compile(optimizer="adam", loss=tf.keras.losses.MeanSquaredError())
+    fit_weighted(autoencoder, X_scaled, counts, max_epochs=FINETUNE_EPOCHS)
+
+    mse = np.mean(np.power(X_scaled - autoencoder.predict(X_scaled, verbose=0), 2), axis=1)
+    batch_stats = error_stats(mse, counts)
+    if range_changed:
+        # Neue Skalierung: alte Fehler sind nicht mehr vergleichbar
+        print("Wertebereich des Scalers erweitert, Fehlerstatistik neu begonnen (Full-Retrain empfohlen).")
+        stats = batch_stats
+        sketch = QuantileSketch()
     else:
-        threshold = float(np.mean(mse) + 3 * np.std(mse))
-    print(f"Threshold (MSE): {threshold:.4f}")
+        stats = merge_error_stats(stats, batch_stats)
+        sketch = load_sketch()
+    threshold = update_threshold(stats, sketch.add(mse, counts))
+    version = publish_model(autoencoder, scaler, url_vocab, threshold)
+    print(f"Inkrementelles Training: {int(counts.sum())} neue Zeilen, "
+          f"{len(X_new)} verschiedene Vektoren, Version {version}, Threshold (MSE): {threshold['threshold']:.4f}")
+    return stats
 
-    # Threshold speichern
-    with open(THRESHOLD_PATH, "w") as f:
-        json.dump({"threshold": threshold}, f)
+def full_retrain_requested():
+    global _full_retrain_message
+    if TRAINER_MODE == "full":
+        return True
+    if _full_retrain_message:
+        _full_retrain_message = False
+        return True
+    if os.path.exists(FULL_RETRAIN_TRIGGER):
+        try:
+            os.remove(FULL_RETRAIN_TRIGGER)
+        except OSError:
+            pass
+        return True
+    return False
 
 def is_training_mode():
     return os.path.exists(TRAINING_TRIGGER)
 
+def control_bus():
+    """Subscriber des Trainers am Steuerbus (einmal pro Prozess) oder None."""
+    global _bus
+    if _bus is None:
+        _bus = open_subscriber("trainer", [TRAINING_MODE, FULL_RETRAIN]) or False
+    return _bus or None
+
+def wait_for_control(seconds):
+    """
+    Wartet bis zu seconds Sekunden, kehrt aber sofort zurück, sobald über den
+    Steuerbus die Trainingsphase umgeschaltet oder ein Full-Retrain angefordert
+    wird. Ohne Bus wie bisher time.sleep(). Gibt True bei einer Nachricht zurück.
+    """
+    global _full_retrain_message
+    bus = control_bus()
+    if bus is None:
+        time.sleep(seconds)
+        return False
+    message = bus.receive(timeout=seconds)
+    if message is None:
+        return False
+    if message.type == FULL_RETRAIN:
+        _full_retrain_message = True
+    bus.ack(message, detail="trainer loop woken")
+    print(f"Steuernachricht: {message.type} {message.data}")
+    return True
+
 def wait_for_logfile():
-    while not os.path.exists(LOGFILE) or os.path.getsize(LOGFILE) == 0:
+    while not os.path.exists(LOGFILE_PATH) or os.path.getsize(LOGFILE_PATH) == 0:
         print("Warte auf Logdaten ...")
         time.sleep(2)
 
-def main():
-    print("Trainer gestartet.")
-    wait_for_logfile()
+def log_size():
+    try:
+        return os.path.getsize(LOGFILE_PATH)
+    except OSError:
+        return 0
+
+def run_full_retrain():
+    """Full-Retrain (läuft im Worker-Prozess); gibt (stats, live_state) zurück."""
+    counter, live_state = load_full_training_data()
+    return train_and_save_model(counter), live_state
+
+def start_full_retrain():
+    """Startet das Full-Retrain als BackgroundJob; die Hauptschleife bleibt reaktionsfähig."""
+    job = BackgroundJob("full-retrain", run_full_retrain).start()
+    job.log_size = log_size()
+    job.log_mod_time = os.path.getmtime(LOGFILE_PATH) if os.path.exists(LOGFILE_PATH) else 0
+    print(f"Full-Retrain gestartet (Worker-PID {job.process.pid}).")
+    return job
+
+def preempt_reason(job):
+    """Grund, ein laufendes Full-Retrain abzubrechen, oder None."""
+    if not is_training_mode():
+        return "Trainingsphase beendet"
+    if TRAINER_MODE != "full" and full_retrain_requested():
+        return "neues Full-Retrain angefordert"
+    if TRAINER_PREEMPT_GROWTH > 0 and VERSIONS.current() is not None:
+        # Kleines/frisches Log wächst relativ schnell: ohne Mindestzuwachs würde jeder
+        # Neustart wieder abgebrochen und nie ein Modell veröffentlicht
+        growth = log_size() - job.log_size
+        if growth > max(job.log_size * TRAINER_PREEMPT_GROWTH, TRAINER_PREEMPT_MIN_BYTES):
+            return "Logfile seit dem Start deutlich gewachsen"
+    return None
+
+def supervise(job):
+    """
+    Prüft einen laufenden Job. Gibt (job, ergebnis) zurück: job ist der weiterhin
+    (bzw. neu gestartete) laufende Job oder None, ergebnis ist das Resultat eines
+    fertigen Jobs oder None.
+    """
+    result = job.poll()
+    if result is None:
+        reason = preempt_reason(job)
+        if reason is None:
+            return job, None
+        job.cancel()
+        print(f"Full-Retrain nach {job.elapsed():.0f}s abgebrochen: {reason}.")
+        return (start_full_retrain() if is_training_mode() else None), None
+    kind, value = result
+    print(f"Full-Retrain beendet ({kind}) nach {job.elapsed():.0f}s.")
+    if kind == "error":
+        print(value)
+    return None, result
+
+def main_full():
     last_mod_time = 0
+    job = None
     while True:
+        if job is not None:
+            finished_job = job
+            job, result = supervise(job)
+            if job is not None:
+                wait_for_control(JOB_POLL_INTERVAL)
+                continue
+            if result is not None:
+                if result[0] == "ok" and result[1][0]:
+                    last_mod_time = finished_job.log_mod_time
+                wait_for_control(10)
+                continue
         if is_training_mode():
-            log_mod_time = os.path.getmtime(LOGFILE)
-            model_exists = os.path.exists(MODEL_PATH)
+            log_mod_time = os.path.getmtime(LOGFILE_PATH)
+            model_exists = os.path.exists(current_model_files()[0])
             if (not model_exists) or (log_mod_time > last_mod_time):
-                trained = train_and_save_model()
-                if trained:
-                    last_mod_time = log_mod_time
+                job = start_full_retrain()
+                continue
             else:
                 print("Modell aktuell. Warte auf neue Logdaten oder Datei-Löschung ...")
         else:
             print("Nicht in Trainingsphase. Warte ...")
-        time.sleep(10)
+        idle(10)
+
+def load_full_training_data():
+    """Trainingsdaten für ein Full-Retrain gemäß TRAINER_SOURCE; fällt auf das Log zurück."""
+    if TRAINER_SOURCE == "store":
+        ts_from = time.time() - TRAINER_WINDOW_SECONDS if TRAINER_WINDOW_SECONDS else None
+        counter = aggregate_store_features(ts_from)
+        if counter:
+            print(f"Trainingsdaten aus dem Feature-Store: {sum(counter.values())} Zeilen")
+            return counter, None  # Tailer setzt am Dateiende fort
+        print("Feature-Store leer, lese das Logfile.")
+    return aggregate_features(LOGFILE_PATH)
+
+def main_incremental():
+    """
+    Liest nur neue Logzeilen (Offset/Inode persistiert in TRAINER_STATE_PATH).
+    Ein Full-Retrain läuft, wenn noch kein Modell existiert oder über
+    FULL_RETRAIN_TRIGGER explizit angefordert wird. Es läuft in einem
+    Worker-Prozess; die Schleife reagiert währenddessen auf Trigger und bricht
+    es bei Bedarf ab (siehe preempt_reason).
+    """
+    state = load_trainer_state()
+    tailer = LogTailer(LOGFILE_PATH, max_bytes=INCREMENTAL_READ_BYTES)
+    if not tailer.restore_state(state.get("log", {})):
+        state = {}  # neue/rotierte Logdatei: Statistik passt nicht mehr
+    job = None
+    while True:
+        if job is not None:
+            job, result = supervise(job)
+            if job is not None:
+                wait_for_control(JOB_POLL_INTERVAL)
+                continue
+            if result is not None and result[0] == "ok":
+                stats, live_state = result[1]
+                # Inkrementell ab dem Stand weiterlesen, bis zu dem eingelesen wurde
+                tailer.close()
+                tailer = LogTailer(LOGFILE_PATH, max_bytes=INCREMENTAL_READ_BYTES)
+                if not tailer.restore_state(live_state or {}):
+                    tailer.seek_tail(0)  # Daten aus dem Store oder zwischenzeitlich rotiert
+                if stats:
+                    state = {"log": tailer.get_state(), "error_stats": stats}
+                    save_trainer_state(state)
+            if result is not None:
+                wait_for_control(10)  # kein sofortiger Neustart, falls das Training fehlschlug
+                continue
+        if is_training_mode():
+            model_path, scaler_path, vocab_path = current_model_files()
+            model_ready = all(os.path.exists(p) for p in (model_path, scaler_path)) and state.get("error_stats")
+            if not model_ready or full_retrain_requested():
+                job = start_full_retrain()
+                continue
+            elif tailer.lag() > 0:
+                # Vokabular bleibt bis zum nächsten Full-Retrain fest (Modell kennt nur diese IDs)
+                url_vocab = load_vocab(vocab_path)
+                X_new, counts = read_new_features(tailer, url_vocab)
+                if len(X_new):
+                    state["error_stats"] = incremental_update(X_new, counts, state["error_stats"], url_vocab)
+                state["log"] = tailer.get_state()
+                save_trainer_state(state)
+            else:
+                print("Modell aktuell. Warte auf neue Logdaten ...")
+        else:
+            # Zeilen außerhalb der Trainingsphase (evtl. Angriffe) nicht nachtrainieren
+            if tailer.lag() > 0 and state:
+                tailer.seek_tail(0)
+                state["log"] = tailer.get_state()
+                save_trainer_state(state)
+            print("Nicht in Trainingsphase. Warte ...")
+        idle(10)
+
+def main():
+    print(f"Trainer gestartet (Modus: {TRAINER_MODE}).")
+    wait_for_logfile()
+    if TRAINER_MODE == "full":
+        main_full()
+    else:
+        main_incremental()
 
 if __name__ == "__main__":
     main()